@@ -0,0 +1,59 @@
+"""Compares the DOM and streaming ISM manifest parsers on a synthetic manifest."""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.ism_manifest import ISMManifest
+
+
+def synthetic_manifest(chunks: int, chunk_duration: int = 20000000) -> bytes:
+    lines = [
+        f'<?xml version="1.0" encoding="utf-8"?>',
+        f'<SmoothStreamingMedia MajorVersion="2" MinorVersion="2" TimeScale="10000000" Duration="{chunks * chunk_duration}">',
+    ]
+    streams = [
+        ("video", "video", 'QualityLevels({bitrate})/Fragments(video={start time})',
+         '<QualityLevel Index="{i}" Bitrate="{b}" FourCC="H264" MaxWidth="1280" MaxHeight="720" CodecPrivateData="00000001"/>'),
+        ("audio", "audio_eng", 'QualityLevels({bitrate})/Fragments(audio_eng={start time})',
+         '<QualityLevel Index="{i}" Bitrate="{b}" FourCC="AACL" SamplingRate="48000" Channels="2" BitsPerSample="16" PacketSize="4" AudioTag="255" CodecPrivateData="1190"/>'),
+    ]
+    for stype, name, url, ql in streams:
+        lines.append(f'<StreamIndex Type="{stype}" Name="{name}" TimeScale="10000000" Chunks="{chunks}" QualityLevels="3" Url="{url}">')
+        for i, b in enumerate((3000000, 1500000, 800000)):
+            lines.append(ql.format(i=i, b=b))
+        lines.append(f'<c t="0" d="{chunk_duration}"/>')
+        lines.extend(f'<c d="{chunk_duration}"/>' for _ in range(chunks - 1))
+        lines.append('</StreamIndex>')
+    lines.append('</SmoothStreamingMedia>')
+    return "\n".join(lines).encode()
+
+
+def measure(data: bytes, use_dom: bool):
+    tracemalloc.start()
+    start = time.perf_counter()
+    ism = ISMManifest("synthetic", data, use_dom)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return ism, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--chunks", type=int, default=20000, help="chunks per stream")
+    args = parser.parse_args()
+
+    data = synthetic_manifest(args.chunks)
+    print(f"manifest: {len(data)} bytes, {args.chunks} chunks x 2 streams")
+    for label, use_dom in (("dom", True), ("streaming", False)):
+        ism, elapsed, peak = measure(data, use_dom)
+        cnt = sum(si.chunk_cnt() for si in ism.streams)
+        print(f"{label:10s} {elapsed * 1000:9.1f} ms  peak {peak / (1 << 20):8.1f} MiB  chunks {cnt}")
+
+
+if __name__ == "__main__":
+    main()
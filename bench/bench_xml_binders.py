@@ -0,0 +1,56 @@
+"""Compares reflective and cached-binder XML node binding on manifest-like nodes."""
+import argparse
+import os
+import sys
+import time
+from io import BytesIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.xml_utils import XmlUtils
+from core.ism_manifest import ISMManifest
+
+
+class SlottedChunk:
+    __slots__ = ("attt", "attd", "attr")
+
+    def __init__(self):
+        self.attt = None
+        self.attd = None
+        self.attr = None
+
+
+def build_nodes(count: int):
+    xml = "<StreamIndex>" + "".join(
+        f'<QualityLevel Index="{i % 4}" Bitrate="{800000 + i}" FourCC="H264" MaxWidth="1280" MaxHeight="720"/>'
+        f'<c t="{i * 20000000}" d="20000000"/>'
+        for i in range(count)
+    ) + "</StreamIndex>"
+    root = XmlUtils.parse_xml(BytesIO(xml.encode()))
+    return XmlUtils.get_elements(root, "QualityLevel"), XmlUtils.get_elements(root, "c")
+
+
+def run(label, bind, qls, chunks, chunk_class):
+    start = time.perf_counter()
+    for node in qls:
+        bind(ISMManifest.VideoQualityLevel, node)
+    for node in chunks:
+        bind(chunk_class, node)
+    elapsed = time.perf_counter() - start
+    nodes = len(qls) + len(chunks)
+    print(f"{label:22s} {elapsed * 1000:9.1f} ms  {nodes / elapsed:12.0f} nodes/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--nodes", type=int, default=20000, help="QualityLevel and c nodes each")
+    args = parser.parse_args()
+
+    qls, chunks = build_nodes(args.nodes)
+    run("reflective", XmlUtils.instance_from_node_reflective, qls, chunks, ISMManifest.Chunk)
+    run("binder", XmlUtils.instance_from_node, qls, chunks, ISMManifest.Chunk)
+    run("binder (__slots__)", XmlUtils.instance_from_node, qls, chunks, SlottedChunk)
+
+
+if __name__ == "__main__":
+    main()
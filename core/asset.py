@@ -1,4 +1,18 @@
-from typing import Optional
+from collections import OrderedDict
+from typing import List, Optional
+
+from modules.shell import Shell
+from modules.utils import Utils
+from core.cdn import CDN
+from core.challenge_queue import ChallengeQueue
+from core.debug_sink import DebugSink
+from core.device import Device
+from core.file_cache import FileCache
+from core.key_store import KeyStore
+from core.license import License
+from core.ls import LS
+from core.manifest_cache import ManifestCache
+from core.mspr import MSPR
 
 class Asset:
     def __init__(self, id: str, sd=None, td=None):
@@ -46,7 +60,7 @@ class Asset:
             else:
                 Shell.println("- loading cached manifest")
 
-            self.ism = ISMManifest.from_file(manpath)
+            self.ism = ManifestCache.load(manpath)
         return self.ism
 
     def cache_key(self, content_key: bytes):
@@ -54,7 +68,38 @@ class Asset:
         keydata = Utils.construct_hex_string(content_key)
         Utils.save_file(keyfile, keydata.encode())
 
+    def get_kid(self) -> Optional[bytes]:
+        ism = self.get_manifest()
+        if ism and ism.ph and ism.ph.wrmhdr():
+            return ism.ph.wrmhdr().kid
+        return None
+
+    def get_content_key(self) -> Optional[bytes]:
+        """Returns the content key, from the key store when its KID has an unexpired entry."""
+        kid = self.get_kid()
+        if kid is not None:
+            content_key = KeyStore.get(kid)
+            if content_key is not None:
+                Shell.println("- using stored content key")
+                self.cache_key(content_key)
+                return content_key
+        lic = self.get_license()
+        return lic.get_content_key() if lic else None
+
+    def renew_license(self) -> Optional[License]:
+        """Requests a fresh license even if the current one or a stored key is still valid."""
+        self.license = None
+        return self.get_license()
+
     def get_license(self) -> Optional[License]:
+        """
+        Returns the license of the asset, from the local license file or a license request.
+
+        The key store is not consulted: it keeps content keys, not the License
+        (rights, expiration, signature) this returns, and renew_license relies
+        on it to force a request. Callers after the key only use get_content_key,
+        which checks the store first.
+        """
         if self.license is None:
             license_file = FileCache.local_license_filename(self.id)
             if license_file and Utils.file_exists(license_file):
@@ -68,31 +113,80 @@ class Asset:
                 if ism:
                     Shell.println("- generating license req")
                     wrmhdr = ism.get_wrmhdr_data()
-                    req = MSPR.get_license_request(curdev, wrmhdr)
-                    debugfile = FileCache.debug_file(self.id, "lic_req.txt")
-                    Utils.save_file(debugfile, req.encode())
+                    req = ChallengeQueue.license_request(curdev, wrmhdr)
+                    DebugSink.write(self.id, "lic_req.txt", req.encode())
 
                     ls_url = self.get_ls_url()
                     if ls_url:
                         Shell.println(f"- sending license req to: {ls_url}")
                         resp = LS.send_license_req(ls_url, curdev, req)
                         license_xml = resp.encode()
-                        debugfile = FileCache.debug_file(self.id, "lic_resp.txt")
-                        Utils.save_file(debugfile, license_xml)
+                        DebugSink.write(self.id, "lic_resp.txt", license_xml)
+                        debugfile = DebugSink.path(self.id, "lic_resp.txt")
 
                         try:
                             self.license = License(license_xml)
                         except Exception as e:
+                            DebugSink.dump(self.id)
                             Shell.report_error(f"Cannot parse license, see [{debugfile}] for details: {e}")
                             self.license = None
 
                         if self.license is None:
+                            DebugSink.dump(self.id)
                             Shell.report_error(f"Cannot get license, see [{debugfile}] for details")
                 else:
                     manpath = FileCache.manifest_filename(self.id)
                     Shell.report_error(f"Invalid asset id or Manifest not present [{manpath}]")
 
+        if self.license is not None and not self.license.verify_signature():
+            DebugSink.dump(self.id)
+            Shell.report_error("License signature verification failed")
+            self.license = None
+
         if self.license is not None:
-            self.cache_key(self.license.get_content_key())
+            content_key = self.license.get_content_key()
+            self.cache_key(content_key)
+            kid = self.license.get_key_id()
+            if kid is not None and content_key is not None:
+                KeyStore.put(kid, content_key, self.license.ExpirationDate)
         
         return self.license
+
+    @staticmethod
+    def acquire_keys(assets: List["Asset"]) -> int:
+        """
+        Gets the content keys of several assets with batched license challenges.
+
+        Assets whose KID is already in the key store are skipped. The others are
+        grouped by license server, and each group costs one signed challenge per
+        MSPR batch instead of one per asset. Returns the number of assets with a key.
+        """
+        groups = OrderedDict()
+        for asset in assets:
+            kid = asset.get_kid()
+            if kid is None or KeyStore.get(kid) is not None:
+                continue
+            ls_url = asset.get_ls_url()
+            if ls_url:
+                groups.setdefault(ls_url, OrderedDict()).setdefault(kid, asset.ism.ph.wrmhdr())
+
+        curdev = Device.cur_device()
+        for ls_url, headers in groups.items():
+            for batch, req in MSPR.batch_license_requests(curdev, list(headers.values()), ChallengeQueue.license_request):
+                Shell.println(f"- sending license req for {len(batch)} headers to: {ls_url}")
+                resp = LS.send_license_req(ls_url, curdev, req)
+                lic = License(resp.encode())
+                keys = lic.get_content_keys()
+                if not keys:
+                    Shell.report_error(f"No valid license in batched response from {ls_url}")
+                for kid, content_key in keys.items():
+                    KeyStore.put(kid, content_key, lic.ExpirationDate)
+
+        cnt = 0
+        for asset in assets:
+            kid = asset.get_kid()
+            content_key = KeyStore.get(kid) if kid is not None else None
+            if content_key is not None:
+                asset.cache_key(content_key)
+                cnt += 1
+        return cnt
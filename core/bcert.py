@@ -2,6 +2,14 @@ import os
 import struct
 from typing import Optional, List, Union
 
+from modules.byte_input import ByteInput
+from modules.byte_output import ByteOutput
+from modules.crypto import Crypto
+from modules.ecc import ECC
+from modules.error import ERR
+from modules.shell import Shell
+from modules.utils import Utils
+
 class BCert:
     BASE_DIR = "secrets"
 
@@ -19,6 +27,21 @@ class BCert:
     # Key types
     KEY_SIGNING = 0x0
     KEY_ENCRYPTION = 0x1
+    KEY_TYPE_ECC256 = 0x1
+
+    # Key usages
+    KEY_USAGE_SIGN = 0x1
+    KEY_USAGE_ENCRYPT_KEY = 0x2
+    KEY_USAGE_ISSUER_ALL = 0x4
+    KEY_USAGE_ISSUER_INDIV = 0x5
+    KEY_USAGE_ISSUER_DEVICE = 0x6
+    SIGNING_USAGES = [KEY_USAGE_SIGN, KEY_USAGE_ISSUER_ALL, KEY_USAGE_ISSUER_INDIV, KEY_USAGE_ISSUER_DEVICE]
+
+    # Cert header and basic info values
+    CERT_VERSION = 0x1
+    CERT_TYPE_DEVICE = 0x1
+    NO_EXPIRATION = 0xffffffff
+    SIGNATURE_TYPE_ECDSA = 0x1
 
     # Lengths
     DIGEST_SIZE = 0x20
@@ -32,13 +55,15 @@ class BCert:
     @staticmethod
     def load_file(name: str) -> Optional[bytes]:
         path = os.path.join(BCert.BASE_DIR, name)
-        print(f"path {path}")
         return Utils.load_file(path)
 
     def save_file(self, name: str, data: bytes) -> bool:
         path = os.path.join(self.BASE_DIR, name)
         return Utils.save_file(path, data)
 
+    def save(self, name: str) -> bool:
+        return self.save_file(name, self.body())
+
     @staticmethod
     def from_file(name: str) -> Union["CertificateChain", "Certificate", None]:
         data = BCert.load_file(name)
@@ -46,9 +71,9 @@ class BCert:
             bi = ByteInput(name, data)
             magic = bi.peek_4()
             if magic == BCert.BCERT_CHAIN:
-                return CertificateChain(bi)
+                return BCert.CertificateChain(bi)
             elif magic == BCert.BCERT_CERT:
-                return Certificate(bi)
+                return BCert.Certificate(bi)
         return None
 
     class CertAttr:
@@ -75,170 +100,355 @@ class BCert:
             pp.println(f"attr: {Utils.hex_value(self.tag, 8)}")
             pp.printhex("data", self.data)
 
-    class CertificateChain(BCert):
-        def __init__(self, bi: Optional["ByteInput"] = None):
-            super().__init__(bi.source() if bi else None)
-            self.magic = 0
-            self.word1 = 0
-            self.total_len = 0
-            self.word3 = 0
-            self.cert_cnt = 0
-            self.certs = []
-
-            if bi:
-                self.magic = bi.read_4()
-                self.word1 = bi.read_4()
-                self.total_len = bi.read_4()
-                self.word3 = bi.read_4()
-                self.cert_cnt = bi.read_4()
-
-                for _ in range(self.cert_cnt):
-                    cert = Certificate(bi)
-                    self.certs.append(cert)
-
-        def cert_cnt(self):
-            return self.cert_cnt
-
-        def get(self, idx: int) -> Optional["Certificate"]:
-            if idx < len(self.certs):
-                return self.certs[idx]
-            return None
-
-        def add(self, cert: "Certificate"):
-            self.certs.append(cert)
-            self.cert_cnt += 1
-
-        def insert(self, cert: "Certificate") -> "CertificateChain":
-            chain = BCert.CertificateChain()
-            chain.add(cert)
-            for c in self.certs:
-                chain.add(c)
-            return chain
-
-        def print(self, debug: bool):
-            pp = Shell.get_pp()
-            pp.println(f"CERT CHAIN: {self.source}")
+
+class CertificateChain(BCert):
+    def __init__(self, bi: Optional["ByteInput"] = None):
+        super().__init__(bi.source if bi else None)
+        self.magic = BCert.BCERT_CHAIN
+        self.word1 = 0x00000001
+        self.total_len = 0
+        self.word3 = 0
+        self.cert_cnt = 0
+        self.certs = []
+
+        if bi:
+            self.magic = bi.read_4()
+            self.word1 = bi.read_4()
+            self.total_len = bi.read_4()
+            self.word3 = bi.read_4()
+            self.cert_cnt = bi.read_4()
+
+            for _ in range(self.cert_cnt):
+                cert = BCert.Certificate(bi)
+                self.certs.append(cert)
+
+    def get(self, idx: int) -> Optional["Certificate"]:
+        if idx < len(self.certs):
+            return self.certs[idx]
+        return None
+
+    def add(self, cert: "Certificate"):
+        self.certs.append(cert)
+        self.cert_cnt += 1
+
+    def insert(self, cert: "Certificate") -> "CertificateChain":
+        chain = BCert.CertificateChain()
+        chain.word1 = self.word1
+        chain.word3 = self.word3
+        chain.add(cert)
+        for c in self.certs:
+            chain.add(c)
+        return chain
+
+    def print(self, debug: bool):
+        pp = Shell.get_pp()
+        pp.println(f"CERT CHAIN: {self.source}")
+        pp.pad(2, "")
+        for cert in self.certs:
+            cert.print(debug)
+        pp.leave()
+
+    def body(self) -> bytes:
+        # Cert bodies are cached, so re-emitting an unchanged chain only copies bytes
+        bodies = [cert.body() for cert in self.certs]
+        bo = ByteOutput(BCert.BO_SIZE)
+        total_len = sum(len(body) for body in bodies) + 5 * 4
+        bo.write_4(BCert.BCERT_CHAIN)
+        bo.write_4(self.word1)
+        bo.write_4(total_len)
+        bo.write_4(self.word3)
+        bo.write_4(len(self.certs))
+
+        for body in bodies:
+            bo.write_n(body)
+        return bo.bytes()
+
+class Certificate(BCert):
+    def __init__(self, bi: Optional["ByteInput"] = None):
+        super().__init__(bi.source if bi else None)
+        self.magic = BCert.BCERT_CERT
+        self.word1 = BCert.CERT_VERSION
+        self.total_len = 0
+        self.cert_len = 0
+        self.attributes = []
+        self.data = None
+        self.names = None
+        self.random = None
+        self.seclevel = 0
+        self.flags = 0
+        self.cert_type = BCert.CERT_TYPE_DEVICE
+        self.expiration = BCert.NO_EXPIRATION
+        self.digest = None
+        self.uniqueid = None
+        self.keys = []
+        self.pubkey_sign = None
+        self.pubkey_enc = None
+        self.signature = None
+        self.signing_key = None
+        self.prvkey_sign = None
+
+        # Serialized cert and its signed part, dropped whenever a setter changes a field
+        self.body_cache = None
+        self.signed_data_cache = None
+
+        if bi:
+            start_pos = bi.get_pos()
+            self.magic = bi.read_4()
+            self.word1 = bi.read_4()
+            self.total_len = bi.read_4()
+            self.cert_len = bi.read_4()
+            len_remaining = self.total_len - 0x10
+
+            while len_remaining > 0:
+                attr = BCert.CertAttr(bi, bi.get_pos() - start_pos)
+                self.attributes.append(attr)
+                len_remaining -= attr.length()
+
+            end_pos = bi.get_pos()
+            bi.set_pos(start_pos)
+            self.data = bi.read_n(end_pos - start_pos)
+            self.parse_attributes()
+
+            self.body_cache = self.data
+            self.signed_data_cache = self.data[:self.cert_len]
+
+    def parse_attributes(self):
+        ids = self.lookup_tag(BCert.TAG_IDS)
+        if ids:
+            bi = ByteInput(self.source, ids.data)
+            self.random = bi.read_n(0x10)
+            self.seclevel = bi.read_4()
+            self.flags = bi.read_4()
+            self.cert_type = bi.read_4()
+            self.digest = bi.read_n(BCert.DIGEST_SIZE)
+            self.expiration = bi.read_4()
+            self.uniqueid = bi.read_n(0x10)
+
+        keyinfo = self.lookup_tag(BCert.TAG_KEYINFO)
+        if keyinfo:
+            bi = ByteInput(self.source, keyinfo.data)
+            for _ in range(bi.read_4()):
+                bi.read_2()  # key type
+                bi.read_2()  # key length in bits
+                flags = bi.read_4()
+                key = bi.read_n(BCert.PUB_KEY_SIZE)
+                usages = [bi.read_4() for _ in range(bi.read_4())]
+                self.keys.append([key, usages, flags])
+            self.pubkey_sign = self.key_for(BCert.SIGNING_USAGES)
+            self.pubkey_enc = self.key_for([BCert.KEY_USAGE_ENCRYPT_KEY])
+
+        signature = self.lookup_tag(BCert.TAG_SIGNATURE)
+        if signature:
+            bi = ByteInput(self.source, signature.data)
+            bi.read_2()  # signature type
+            self.signature = bi.read_n(bi.read_2())
+            self.signing_key = bi.read_n(bi.read_4() // 8)
+
+    def verify_signing_key(self):
+        if self.prvkey_sign and self.pubkey_sign:
+            k = ECC.make_bi(self.prvkey_sign, 0, 0x20)
+            pub = ECC.ECPoint.from_bytes(self.pubkey_sign)
+            genpoint = ECC.GEN().multiply(k)
+
+            if not ECC.on_curve(pub):
+                ERR.log("Device cert signing key not on curve")
+            if genpoint != pub:
+                ERR.log("Device cert prv signing key does not match public key")
+
+    def invalidate(self, signed: bool = True):
+        self.body_cache = None
+        if signed:
+            self.signed_data_cache = None
+
+    def update(self, name: str, value, signed: bool = True) -> bool:
+        if getattr(self, name) == value:
+            return False
+        setattr(self, name, value)
+        self.invalidate(signed)
+        return True
+
+    def key_for(self, usages: List[int]) -> Optional[bytes]:
+        for key, key_usages, _ in self.keys:
+            if any(usage in key_usages for usage in usages):
+                return key
+        return None
+
+    def set_key(self, usage: int, usages: List[int], key: bytes):
+        for entry in self.keys:
+            if any(u in entry[1] for u in usages):
+                entry[0] = key
+                return
+        self.keys.append([key, [usage], 0])
+
+    def set_names(self, names: List[str]):
+        self.update("names", names)
+
+    def set_random(self, random: bytes):
+        self.update("random", random)
+
+    def set_seclevel(self, seclevel: int):
+        self.update("seclevel", seclevel)
+
+    def set_digest(self, digest: bytes):
+        self.update("digest", digest)
+
+    def set_uniqueid(self, uniqueid: bytes):
+        self.update("uniqueid", uniqueid)
+
+    def set_prvkey_sign(self, prvkey_sign: bytes):
+        self.prvkey_sign = prvkey_sign
+        self.verify_signing_key()
+
+    def set_pubkey_sign(self, pubkey_sign: bytes):
+        if self.update("pubkey_sign", pubkey_sign):
+            self.set_key(BCert.KEY_USAGE_SIGN, BCert.SIGNING_USAGES, pubkey_sign)
+        self.verify_signing_key()
+
+    def set_pubkey_enc(self, pubkey_enc: bytes):
+        if self.update("pubkey_enc", pubkey_enc):
+            self.set_key(BCert.KEY_USAGE_ENCRYPT_KEY, [BCert.KEY_USAGE_ENCRYPT_KEY], pubkey_enc)
+
+    def set_signature(self, signature: bytes):
+        self.update("signature", signature, signed=False)
+
+    def set_signing_key(self, signing_key: bytes):
+        self.update("signing_key", signing_key, signed=False)
+
+    def get_random(self) -> Optional[bytes]:
+        return self.random
+
+    def get_seclevel(self) -> int:
+        return self.seclevel
+
+    def get_uniqueid(self) -> Optional[bytes]:
+        return self.uniqueid
+
+    def get_pubkey_for_signing(self) -> Optional[bytes]:
+        return self.pubkey_sign
+
+    def get_prvkey_for_signing(self) -> Optional[bytes]:
+        return self.prvkey_sign
+
+    def get_pubkey_for_encryption(self) -> Optional[bytes]:
+        return self.pubkey_enc
+
+    def sign(self, issuer_key, cert_key=None):
+        if cert_key is not None:
+            self.set_pubkey_sign(cert_key.pub_bytes())
+        self.set_signing_key(issuer_key.pub_bytes())
+        self.set_signature(Crypto.ecdsa(self.get_signed_data(), issuer_key))
+
+    def lookup_tag(self, tag: int) -> Optional["CertAttr"]:
+        for attr in self.attributes:
+            if attr.tag == tag:
+                return attr
+        return None
+
+    def print(self, debug: bool):
+        pp = Shell.get_pp()
+        pp.println("### CERT")
+        if debug:
             pp.pad(2, "")
-            for cert in self.certs:
-                cert.print()
+            for attr in self.attributes:
+                attr.print()
             pp.leave()
 
-        def body(self) -> bytes:
+    @staticmethod
+    def write_attr(bo: "ByteOutput", tag: int, data: bytes):
+        bo.write_4(tag)
+        bo.write_4(len(data) + 8)
+        bo.write_n(data)
+
+    def ids_data(self) -> bytes:
+        digest = self.digest
+        if digest is None and self.pubkey_sign:
+            digest = Crypto.SHA256(self.pubkey_sign)
+        bo = ByteOutput(BCert.BO_SIZE)
+        bo.write_n((self.random or b"").ljust(0x10, b"\x00"))
+        bo.write_4(self.seclevel)
+        bo.write_4(self.flags)
+        bo.write_4(self.cert_type)
+        bo.write_n((digest or b"").ljust(BCert.DIGEST_SIZE, b"\x00"))
+        bo.write_4(self.expiration)
+        bo.write_n((self.uniqueid or b"").ljust(0x10, b"\x00"))
+        return bo.bytes()
+
+    def keyinfo_data(self) -> bytes:
+        bo = ByteOutput(BCert.BO_SIZE)
+        bo.write_4(len(self.keys))
+        for key, usages, flags in self.keys:
+            bo.write_2(BCert.KEY_TYPE_ECC256)
+            bo.write_2(BCert.PUB_KEY_SIZE * 8)
+            bo.write_4(flags)
+            bo.write_n(key)
+            bo.write_4(len(usages))
+            for usage in usages:
+                bo.write_4(usage)
+        return bo.bytes()
+
+    def names_data(self) -> bytes:
+        bo = ByteOutput(BCert.BO_SIZE)
+        bo.write_4(0)
+        for name in self.names:
+            data = name.encode() + b"\x00"
+            bo.write_4(len(data))
+            bo.write_n(data.ljust((len(data) + 3) & ~3, b"\x00"))
+        return bo.bytes()
+
+    def signature_data(self) -> bytes:
+        bo = ByteOutput(BCert.BO_SIZE)
+        bo.write_2(BCert.SIGNATURE_TYPE_ECDSA)
+        bo.write_2(BCert.SIGNATURE_SIZE)
+        bo.write_n((self.signature or b"").ljust(BCert.SIGNATURE_SIZE, b"\x00"))
+        bo.write_4(BCert.PUB_KEY_SIZE * 8)
+        bo.write_n((self.signing_key or b"").ljust(BCert.PUB_KEY_SIZE, b"\x00"))
+        return bo.bytes()
+
+    def attrs_data(self) -> bytes:
+        """Serializes all attributes but the signature, keeping parsed ones not managed by setters verbatim."""
+        bo = ByteOutput(BCert.BO_SIZE)
+        generated = {
+            BCert.TAG_IDS: self.ids_data,
+            BCert.TAG_KEYINFO: self.keyinfo_data,
+        }
+        if self.names is not None:
+            generated[BCert.TAG_NAMES] = self.names_data
+
+        tags = [attr.tag for attr in self.attributes if attr.tag != BCert.TAG_SIGNATURE]
+        if not self.attributes:
+            tags = list(generated.keys())
+
+        for tag in tags:
+            if tag in generated:
+                BCert.Certificate.write_attr(bo, tag, generated[tag]())
+            else:
+                BCert.Certificate.write_attr(bo, tag, self.lookup_tag(tag).data)
+        return bo.bytes()
+
+    def get_signed_data(self) -> bytes:
+        if self.signed_data_cache is None:
+            attrs = self.attrs_data()
+            self.cert_len = 0x10 + len(attrs)
+            self.total_len = self.cert_len + 8 + len(self.signature_data())
+
             bo = ByteOutput(BCert.BO_SIZE)
-            total_len = sum(cert.body().length for cert in self.certs) + 5 * 4
-            bo.write_4(BCert.BCERT_CHAIN)
-            bo.write_4(0x00000001)
-            bo.write_4(total_len)
-            bo.write_4(0x00000000)
-            bo.write_4(self.cert_cnt)
-
-            for cert in self.certs:
-                bo.write_n(cert.body())
-            return bo.bytes()
-
-    class Certificate(BCert):
-        def __init__(self, bi: Optional["ByteInput"] = None):
-            super().__init__(bi.source() if bi else None)
-            self.magic = 0
-            self.word1 = 0
-            self.total_len = 0
-            self.cert_len = 0
-            self.attributes = []
-            self.data = None
-            self.names = None
-            self.random = None
-            self.seclevel = 0
-            self.digest = None
-            self.uniqueid = None
-            self.pubkey_sign = None
-            self.pubkey_enc = None
-            self.signature = None
-            self.signing_key = None
-            self.prvkey_sign = None
-
-            if bi:
-                start_pos = bi.get_pos()
-                self.magic = bi.read_4()
-                self.word1 = bi.read_4()
-                self.total_len = bi.read_4()
-                self.cert_len = bi.read_4()
-                len_remaining = self.total_len - 0x10
-
-                while len_remaining > 0:
-                    attr = BCert.CertAttr(bi, bi.get_pos() - start_pos)
-                    self.attributes.append(attr)
-                    len_remaining -= attr.length()
-
-                bi.set_pos(start_pos)
-                self.data = bi.read_n(bi.get_pos() - start_pos)
-
-        def verify_signing_key(self):
-            if self.prvkey_sign and self.pubkey_sign:
-                k = ECC.make_bi(self.prvkey_sign, 0, 0x20)
-                pub = ECC.ECPoint(self.pubkey_sign)
-                genpoint = ECC.GEN().op_multiply(k)
-
-                if not ECC.on_curve(genpoint):
-                    ERR.log("Device cert signing key not on curve")
-                if not genpoint.equals(pub):
-                    ERR.log("Device cert prv signing key does not match public key")
-
-        def set_names(self, names: List[str]):
-            self.names = names
-
-        def set_random(self, random: bytes):
-            self.random = random
-
-        def set_seclevel(self, seclevel: int):
-            self.seclevel = seclevel
-
-        def set_digest(self, digest: bytes):
-            self.digest = digest
-
-        def set_uniqueid(self, uniqueid: bytes):
-            self.uniqueid = uniqueid
-
-        def set_prvkey_sign(self, prvkey_sign: bytes):
-            self.prvkey_sign = prvkey_sign
-            self.verify_signing_key()
-
-        def set_pubkey_sign(self, pubkey_sign: bytes):
-            self.pubkey_sign = pubkey_sign
-            self.verify_signing_key()
-
-        def set_pubkey_enc(self, pubkey_enc: bytes):
-            self.pubkey_enc = pubkey_enc
-
-        def set_signature(self, signature: bytes):
-            self.signature = signature
-
-        def set_signing_key(self, signing_key: bytes):
-            self.signing_key = signing_key
-
-        def lookup_tag(self, tag: int) -> Optional["CertAttr"]:
-            for attr in self.attributes:
-                if attr.tag == tag:
-                    return attr
-            return None
+            bo.write_4(self.magic)
+            bo.write_4(self.word1)
+            bo.write_4(self.total_len)
+            bo.write_4(self.cert_len)
+            bo.write_n(attrs)
+            self.signed_data_cache = bo.bytes()
+        return self.signed_data_cache
+
+    def body(self) -> bytes:
+        if self.body_cache is None:
+            bo = ByteOutput(BCert.BO_SIZE)
+            bo.write_n(self.get_signed_data())
+            BCert.Certificate.write_attr(bo, BCert.TAG_SIGNATURE, self.signature_data())
+            self.body_cache = bo.bytes()
+        return self.body_cache
 
-        def print(self, debug: bool):
-            pp = Shell.get_pp()
-            pp.println("### CERT")
-            if debug:
-                pp.pad(2, "")
-                for attr in self.attributes:
-                    attr.print()
-                pp.leave()
-
-        # Additional methods (get_random, get_seclevel, get_pubkey_for_signing, etc.)
-        # would follow a similar pattern, accessing or calculating attribute data as needed.
-
-        # Placeholder for the body method, replace with the actual implementation
-        def body(self) -> bytes:
-            # Implement the actual logic for the body method here
-            return bytes()
-
-        # Placeholder for the get_signed_data method, replace with actual implementation
-        def get_signed_data(self) -> bytes:
-            # Implement the actual logic for the get_signed_data method here
-            return bytes()
+
+# Subclasses of BCert cannot be nested in it, they are reachable as BCert.* like CertAttr
+BCert.CertificateChain = CertificateChain
+BCert.Certificate = Certificate
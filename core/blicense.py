@@ -1,5 +1,13 @@
+from collections import OrderedDict
 from typing import List, Optional, Union
 
+from modules.byte_input import ByteInput
+from modules.byte_output import ByteOutput
+from modules.crypto import Crypto
+from modules.shell import Shell
+from modules.utils import Utils
+from core.mspr import MSPR
+
 class BLicense:
     MAGIC_XMR = 0x584d5200
     ATTR_HDR_SIZE = 8
@@ -47,6 +55,19 @@ class BLicense:
     TAG_ExecuteContainerObject = 0x003F
     TAG_RestrictedSourceIdObject = 0x0028
     TAG_ROOT_CONTAINER = 0x7fff
+    CONTAINER_TAGS = (TAG_OuterContainer, TAG_GlobalPolicy, TAG_KeyMaterialContainer, TAG_ExplicitAnalogVideoOutputProtectionContainer)
+
+    SIGNATURE_AES_OMAC1 = 0x0001
+    XMR_VERSION = 3
+    ATTR_FLAG_MUST_UNDERSTAND = 0x0001
+    ATTR_FLAG_CONTAINER = 0x0002
+    SYMMETRIC_AES_CTR = 0x0001
+    KEY_ENCRYPTION_ECC256 = 0x0003
+    BO_SIZE = 0x400
+    VERIFIED_CACHE_SIZE = 256
+
+    # License digest -> integrity key it was verified with, most recently used last
+    verified = OrderedDict()
 
     def __init__(self, data: bytes):
         self.data = data
@@ -54,13 +75,13 @@ class BLicense:
         self.unknown_data = None
         self.root = None
 
-        bi = ByteInput(data)
+        bi = ByteInput("XMR", data)
         magic = bi.read_4()
 
         if magic == BLicense.MAGIC_XMR:
             self.version = bi.read_4()
             self.unknown_data = bi.read_n(0x10)
-            self.root = ContainerAttr.get(BLicense.TAG_ROOT_CONTAINER, bi.remaining_data())
+            self.root = BLicense.ContainerAttr.get(BLicense.TAG_ROOT_CONTAINER, 0, bi.remaining_data())
 
     @staticmethod
     def tag_name(tag: int) -> str:
@@ -69,6 +90,11 @@ class BLicense:
             BLicense.TAG_GlobalPolicy: "GlobalPolicy",
             BLicense.TAG_PlaybackPolicy: "PlaybackPolicy",
             BLicense.TAG_PlayEnabler: "PlayEnabler",
+            BLicense.TAG_SecurityLevel: "SecurityLevel",
+            BLicense.TAG_KeyMaterialContainer: "KeyMaterialContainer",
+            BLicense.TAG_ContentKey: "ContentKey",
+            BLicense.TAG_XMRSignature: "XMRSignature",
+            BLicense.TAG_ExpirationRestriction: "ExpirationRestriction",
             # Define all tag names similarly as in the Java code.
             # ... other tags
         }
@@ -77,37 +103,42 @@ class BLicense:
     @staticmethod
     def read_attributes(data: bytes) -> List["BLicense.Attr"]:
         attributes = []
-        bi = ByteInput(data)
-        len_remaining = len(data)
-
-        while len_remaining > 0:
-            bi.skip(2)
-            tag = bi.peek_2()
-            bi.skip(-2)
-
-            attr = BLicense.Attr(bi)
-            attributes.append(attr)
+        bi = ByteInput("XMR", data)
 
-            len_remaining -= attr.len() + BLicense.ATTR_HDR_SIZE
+        while bi.remaining() > 0:
+            attributes.append(BLicense.Attr.read(bi))
 
         return attributes
 
     class Attr:
-        def __init__(self, bi: "ByteInput"):
-            self.lvl = bi.read_2()
-            self.tag = bi.read_2()
-            self.len = bi.read_4()
-            self.data = bi.read_n(self.len - 8)
-            self.name = BLicense.tag_name(self.tag)
+        def __init__(self, lvl: int, tag: int, data: bytes):
+            self.lvl = lvl
+            self.tag = tag
+            self.len = len(data) + BLicense.ATTR_HDR_SIZE
+            self.data = data
+            self.name = BLicense.tag_name(tag)
+
+        @staticmethod
+        def read(bi: "ByteInput") -> "BLicense.Attr":
+            if bi.remaining() < BLicense.ATTR_HDR_SIZE:
+                raise ValueError(f"Truncated XMR attribute at {bi.get_pos()}")
+            lvl = bi.read_2()
+            tag = bi.read_2()
+            length = bi.read_4()
+            if length < BLicense.ATTR_HDR_SIZE or length - BLicense.ATTR_HDR_SIZE > bi.remaining():
+                raise ValueError(f"Invalid XMR attribute length {length} for tag {Utils.hex_value(tag, 4)}")
+            return BLicense.Attr(lvl, tag, bi.read_n(length - BLicense.ATTR_HDR_SIZE))
 
         @staticmethod
         def parse(attr: "BLicense.Attr") -> Union["BLicense.Attr", "BLicense.SecurityLevel", "BLicense.ContentKey", "BLicense.ContainerAttr"]:
             if attr.tag == BLicense.TAG_SecurityLevel:
-                return BLicense.SecurityLevel.get(attr.data)
+                return BLicense.SecurityLevel(attr.lvl, attr.data)
             elif attr.tag == BLicense.TAG_ContentKey:
-                return BLicense.ContentKey.get(attr.data)
-            elif attr.tag in (BLicense.TAG_OuterContainer, BLicense.TAG_KeyMaterialContainer, BLicense.TAG_ExplicitAnalogVideoOutputProtectionContainer):
-                return BLicense.ContainerAttr.get(attr.tag, attr.data)
+                return BLicense.ContentKey(attr.lvl, attr.data)
+            elif attr.tag == BLicense.TAG_XMRSignature:
+                return BLicense.Signature(attr.lvl, attr.data)
+            elif attr.lvl & BLicense.ATTR_FLAG_CONTAINER or attr.tag in BLicense.CONTAINER_TAGS:
+                return BLicense.ContainerAttr.get(attr.tag, attr.lvl, attr.data)
             return attr
 
         def print(self):
@@ -117,15 +148,11 @@ class BLicense:
                 pp.printhex("data", self.data)
 
     class SecurityLevel(Attr):
-        def __init__(self, data: bytes):
-            super().__init__(len(data), BLicense.TAG_SecurityLevel, data)
-            bi = ByteInput(data)
+        def __init__(self, lvl: int, data: bytes):
+            super().__init__(lvl, BLicense.TAG_SecurityLevel, data)
+            bi = ByteInput("XMR", data)
             self.security_level = bi.read_2()
 
-        @staticmethod
-        def get(data: bytes) -> "BLicense.SecurityLevel":
-            return BLicense.SecurityLevel(data)
-
         def print(self):
             pp = Shell.get_pp()
             pp.println("SecurityLevel")
@@ -134,19 +161,15 @@ class BLicense:
             pp.leave()
 
     class ContentKey(Attr):
-        def __init__(self, data: bytes):
-            super().__init__(len(data), BLicense.TAG_ContentKey, data)
-            bi = ByteInput(data)
+        def __init__(self, lvl: int, data: bytes):
+            super().__init__(lvl, BLicense.TAG_ContentKey, data)
+            bi = ByteInput("XMR", data)
             self.key_id = bi.read_n(0x10)
             self.v1 = bi.read_2()
             self.v2 = bi.read_2()
             self.enc_data_len = bi.read_2()
             self.enc_data = bi.read_n(self.enc_data_len)
 
-        @staticmethod
-        def get(data: bytes) -> "BLicense.ContentKey":
-            return BLicense.ContentKey(data)
-
         def print(self):
             pp = Shell.get_pp()
             pp.println("ContentKey")
@@ -158,9 +181,25 @@ class BLicense:
             pp.printhex("enc_data", self.enc_data)
             pp.leave()
 
+    class Signature(Attr):
+        def __init__(self, lvl: int, data: bytes):
+            super().__init__(lvl, BLicense.TAG_XMRSignature, data)
+            bi = ByteInput("XMR", data)
+            self.sig_type = bi.read_2()
+            self.sig_len = bi.read_2()
+            self.sig_data = bi.read_n(self.sig_len)
+
+        def print(self):
+            pp = Shell.get_pp()
+            pp.println("XMRSignature")
+            pp.pad(2, "")
+            pp.println(f"type: {Utils.hex_value(self.sig_type, 4)}")
+            pp.printhex("signature", self.sig_data)
+            pp.leave()
+
     class ContainerAttr(Attr):
-        def __init__(self, data: bytes, attributes: Optional[List["BLicense.Attr"]] = None):
-            super().__init__(len(data), BLicense.TAG_ROOT_CONTAINER, data)
+        def __init__(self, tag: int, lvl: int, data: bytes, attributes: Optional[List["BLicense.Attr"]] = None):
+            super().__init__(lvl, tag, data)
             self.attributes = attributes or []
 
         def add_attr(self, attr: "BLicense.Attr"):
@@ -173,15 +212,11 @@ class BLicense:
             return None
 
         @staticmethod
-        def get(tag: int, data: bytes) -> Optional[Union["BLicense.Attr", "BLicense.ContainerAttr"]]:
-            attributes = BLicense.read_attributes(data)
-            if len(attributes) == 1 and tag != BLicense.TAG_ROOT_CONTAINER:
-                return BLicense.Attr.parse(attributes[0])
-            else:
-                container = BLicense.ContainerAttr(data, attributes=[])
-                for attr in attributes:
-                    container.add_attr(BLicense.Attr.parse(attr))
-                return container
+        def get(tag: int, lvl: int, data: bytes) -> "BLicense.ContainerAttr":
+            container = BLicense.ContainerAttr(tag, lvl, data)
+            for attr in BLicense.read_attributes(data):
+                container.add_attr(BLicense.Attr.parse(attr))
+            return container
 
         def print(self):
             pp = Shell.get_pp()
@@ -202,14 +237,117 @@ class BLicense:
         res = None
 
         for elem in path_elem:
-            if isinstance(curpos, BLicense.ContainerAttr):
-                res = curpos.lookup_attr_by_name(elem)
+            res = curpos.lookup_attr_by_name(elem) if isinstance(curpos, BLicense.ContainerAttr) else None
             if res is None:
                 break
             curpos = res
 
         return res
 
+    def get_signature(self) -> Optional["BLicense.Signature"]:
+        sig = self.get_attr("OuterContainer.XMRSignature")
+        return sig if isinstance(sig, BLicense.Signature) else None
+
+    def signed_data(self, sig: "BLicense.Signature") -> bytes:
+        # The signature object is the last attribute of the outer container and
+        # covers everything preceding it, starting with the XMR header.
+        return self.data[:len(self.data) - (len(sig.data) + BLicense.ATTR_HDR_SIZE)]
+
+    def digest(self) -> bytes:
+        return Crypto.SHA256(self.data)
+
+    def verified_integrity_key(self) -> Optional[bytes]:
+        """The integrity key this license was already verified with, None if it was not."""
+        digest = self.digest()
+        key = BLicense.verified.get(digest)
+        if key is not None:
+            BLicense.verified.move_to_end(digest)
+        return key
+
+    def verify_signature(self, integrity_key: bytes) -> bool:
+        """Checks the AES-OMAC1 license signature, reusing earlier successful checks with the same key."""
+        if not integrity_key:
+            return False
+        if self.verified_integrity_key() == integrity_key:
+            return True
+
+        sig = self.get_signature()
+        if sig is None or sig.sig_type != BLicense.SIGNATURE_AES_OMAC1:
+            return False
+        if Crypto.aes_omac1(self.signed_data(sig), integrity_key) != sig.sig_data:
+            return False
+
+        # Only successes are kept, a failed check must not hide a later one with the right key
+        BLicense.verified[self.digest()] = integrity_key
+        if len(BLicense.verified) > BLicense.VERIFIED_CACHE_SIZE:
+            BLicense.verified.popitem(last=False)
+        return True
+
+    @staticmethod
+    def attr_bytes(tag: int, data: bytes, flags: int = ATTR_FLAG_MUST_UNDERSTAND) -> bytes:
+        bo = ByteOutput(BLicense.ATTR_HDR_SIZE + len(data))
+        bo.write_2(flags)
+        bo.write_2(tag)
+        bo.write_4(BLicense.ATTR_HDR_SIZE + len(data))
+        bo.write_n(data)
+        return bo.bytes()
+
+    @staticmethod
+    def container_bytes(tag: int, attrs: List[bytes]) -> bytes:
+        return BLicense.attr_bytes(tag, b"".join(attrs), BLicense.ATTR_FLAG_MUST_UNDERSTAND | BLicense.ATTR_FLAG_CONTAINER)
+
+    @staticmethod
+    def build(kid: bytes, enc_data: bytes, integrity_key: bytes, security_level: int, rights_id: bytes) -> bytes:
+        """
+        Serializes a minimal XMR license: security level, one ECC256 wrapped content key
+        and the AES-OMAC1 signature over everything preceding it.
+
+        Parameters:
+        - kid (bytes): The 16 byte key id.
+        - enc_data (bytes): The integrity and content keys ECC encrypted to the device.
+        - integrity_key (bytes): The integrity key, used to sign the license.
+        - security_level (int): The minimum client security level.
+        - rights_id (bytes): The 16 byte license id.
+
+        Returns:
+        - bytes: The XMR license.
+        """
+        bo = ByteOutput(2)
+        bo.write_2(security_level)
+        policy = BLicense.container_bytes(BLicense.TAG_GlobalPolicy, [
+            BLicense.attr_bytes(BLicense.TAG_SecurityLevel, bo.bytes())
+        ])
+
+        bo = ByteOutput(BLicense.BO_SIZE)
+        bo.write_n(kid)
+        bo.write_2(BLicense.SYMMETRIC_AES_CTR)
+        bo.write_2(BLicense.KEY_ENCRYPTION_ECC256)
+        bo.write_2(len(enc_data))
+        bo.write_n(enc_data)
+        keys = BLicense.container_bytes(BLicense.TAG_KeyMaterialContainer, [
+            BLicense.attr_bytes(BLicense.TAG_ContentKey, bo.bytes())
+        ])
+
+        # The outer container length covers the signature object appended afterwards
+        sig_len = BLicense.ATTR_HDR_SIZE + 4 + 0x10
+        body = policy + keys
+        bo = ByteOutput(BLicense.BO_SIZE)
+        bo.write_4(BLicense.MAGIC_XMR)
+        bo.write_4(BLicense.XMR_VERSION)
+        bo.write_n(rights_id)
+        bo.write_2(BLicense.ATTR_FLAG_MUST_UNDERSTAND | BLicense.ATTR_FLAG_CONTAINER)
+        bo.write_2(BLicense.TAG_OuterContainer)
+        bo.write_4(BLicense.ATTR_HDR_SIZE + len(body) + sig_len)
+        bo.write_n(body)
+        signed = bo.bytes()
+
+        signature = Crypto.aes_omac1(signed, integrity_key)
+        bo = ByteOutput(4 + len(signature))
+        bo.write_2(BLicense.SIGNATURE_AES_OMAC1)
+        bo.write_2(len(signature))
+        bo.write_n(signature)
+        return signed + BLicense.attr_bytes(BLicense.TAG_XMRSignature, bo.bytes())
+
     def print(self):
         pp = Shell.get_pp()
         pp.println("XMR LICENSE")
@@ -1,5 +1,6 @@
 import time
-from modules.crpto import Crypto
+from typing import Optional, Tuple
+from modules.crypto import Crypto
 from modules.ecc import ECC
 from modules.vars import Vars
 from modules.utils import Utils
@@ -76,11 +77,11 @@ class CDN:
         """
         time_value = CDN.get_time()
         return [
-            "FriendlyName.dlna.org", "nBox",
-            "Range", "bytes=0-",
-            "X-nBox-Code", CDN.get_nbox_code(serial, time_value),
-            "X-nBox-SerialNumber", serial,
-            "X-nBox-Time", time_value
+            ("FriendlyName.dlna.org", "nBox"),
+            ("Range", "bytes=0-"),
+            ("X-nBox-Code", CDN.get_nbox_code(serial, time_value)),
+            ("X-nBox-SerialNumber", serial),
+            ("X-nBox-Time", time_value)
         ]
 
     @staticmethod
@@ -98,6 +99,22 @@ class CDN:
         """
         return Web.http_get_to_file(url, CDN.get_reqprops(serial), outfile)
 
+    @staticmethod
+    def download_if_modified(serial: str, url: str, etag: Optional[str] = None, last_modified: Optional[str] = None) -> Tuple:
+        """
+        Download content from a URL unless it is unchanged since the last download.
+
+        Parameters:
+            serial (str): The serial number.
+            url (str): The URL of the content.
+            etag (str): ETag of the previous download, if any.
+            last_modified (str): Last-Modified of the previous download, if any.
+
+        Returns:
+            tuple: (status, content or None when not modified, etag, last_modified).
+        """
+        return Web.http_get_conditional(url, CDN.get_reqprops(serial), etag, last_modified)
+
     # Uncommented methods below would need definitions in `Web` to function in Python
     # @staticmethod
     # def get_pathinfo(serial: str, url: str) -> Web.PathInfo:
@@ -0,0 +1,55 @@
+import os
+from typing import Any, Callable, Optional
+
+from modules.crypto import Crypto
+from modules.snapshot import Snapshot
+from modules.utils import Utils
+from core.bcert import BCert
+
+
+class CertCache:
+    """Pre-parsed device certificate chains persisted next to their source files."""
+
+    CACHE_EXT = ".cache"
+
+    @staticmethod
+    def cache_filename(path: str) -> str:
+        return path + CertCache.CACHE_EXT
+
+    @staticmethod
+    def get(name: str, loader: Callable[[str], Any]) -> Optional[Any]:
+        """
+        Returns the parsed object for a file in BCert.BASE_DIR.
+
+        A cache whose recorded size/mtime match the source is used without
+        reading it. Otherwise the cache is keyed by the SHA-256 of the source,
+        so replacing the file transparently invalidates it. On a miss the object
+        is built with loader(name) and stored for the next process.
+        """
+        path = os.path.join(BCert.BASE_DIR, name)
+        stamp = Snapshot.stamp(path)
+        if stamp is None:
+            return None
+
+        cache_path = CertCache.cache_filename(path)
+        key = Snapshot.read_key(cache_path)
+        entry = Snapshot.read(cache_path, key) if key else None
+        if entry is not None and entry[0] == stamp:
+            return entry[1]
+
+        data = Utils.load_file(path)
+        if data is None:
+            return None
+        digest = Crypto.SHA256(data)
+        if entry is not None and key == digest:
+            obj = entry[1]
+        else:
+            obj = loader(name)
+            if obj is None:
+                return None
+        Snapshot.write(cache_path, digest, (stamp, obj))
+        return obj
+
+    @staticmethod
+    def group_cert(name: str) -> Optional["BCert.CertificateChain"]:
+        return CertCache.get(name, BCert.from_file)
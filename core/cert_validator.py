@@ -0,0 +1,106 @@
+import os
+from collections import OrderedDict
+from typing import List, Optional
+
+from modules.crypto import Crypto
+from modules.shell import Shell
+from modules.utils import Utils
+from core.bcert import BCert
+
+
+class CertValidator:
+    """Validation of BCert certificate chains (leaf first, root last)."""
+
+    RESULT_CACHE_SIZE = 1024
+    # Trusted root public key (64 byte X || Y) in BCert.BASE_DIR, device chains must end at it
+    ROOT_KEY_FILE = "root.pub"
+
+    ISSUER_USAGES = [BCert.KEY_USAGE_ISSUER_ALL, BCert.KEY_USAGE_ISSUER_INDIV, BCert.KEY_USAGE_ISSUER_DEVICE]
+
+    # Cert digest -> signature check result; group certs shared by every device chain stay here
+    results = OrderedDict()
+    verifications = 0
+    # Pinned root public key, loaded from ROOT_KEY_FILE unless set by pin_root_key
+    root_key = None
+
+    @staticmethod
+    def pin_root_key(pubkey: Optional[bytes]):
+        CertValidator.root_key = pubkey
+
+    @staticmethod
+    def pinned_root_key() -> Optional[bytes]:
+        """Returns the trusted root public key, None when there is none to check chains against."""
+        if CertValidator.root_key is None:
+            data = Utils.load_file(os.path.join(BCert.BASE_DIR, CertValidator.ROOT_KEY_FILE))
+            if data is not None and len(data) == BCert.PUB_KEY_SIZE:
+                CertValidator.root_key = data
+        return CertValidator.root_key
+
+    @staticmethod
+    def verify_signature(cert: "BCert.Certificate") -> bool:
+        """Checks the cert signature with the issuer key it carries, memoized by the cert digest."""
+        digest = Crypto.SHA256(cert.body())
+        res = CertValidator.results.get(digest)
+        if res is not None:
+            CertValidator.results.move_to_end(digest)
+            return res
+
+        CertValidator.verifications += 1
+        res = bool(cert.signature and cert.signing_key) and \
+            Crypto.ecdsa_verify(cert.get_signed_data(), cert.signature, cert.signing_key)
+
+        CertValidator.results[digest] = res
+        if len(CertValidator.results) > CertValidator.RESULT_CACHE_SIZE:
+            CertValidator.results.popitem(last=False)
+        return res
+
+    @staticmethod
+    def check_usages(cert: "BCert.Certificate", idx: int) -> List[str]:
+        errors = []
+        if idx == 0:
+            if cert.key_for([BCert.KEY_USAGE_SIGN]) is None:
+                errors.append(f"cert {idx}: no signing key")
+            if cert.key_for([BCert.KEY_USAGE_ENCRYPT_KEY]) is None:
+                errors.append(f"cert {idx}: no encryption key")
+        elif cert.key_for(CertValidator.ISSUER_USAGES) is None:
+            errors.append(f"cert {idx}: no issuer key")
+        return errors
+
+    @staticmethod
+    def validate(chain: "BCert.CertificateChain", root_key: Optional[bytes] = None) -> List[str]:
+        """
+        Validates every link of the chain and returns the list of problems found.
+
+        Each cert must be signed by the issuer key of the next cert, the last one
+        by root_key (or by itself when root_key is not given). Issuers must hold an
+        issuer key and must not be below the security level of what they sign.
+        """
+        errors = []
+        certs = chain.certs
+        if not certs:
+            return ["empty certificate chain"]
+
+        for idx, cert in enumerate(certs):
+            errors.extend(CertValidator.check_usages(cert, idx))
+
+            if idx + 1 < len(certs):
+                issuer = certs[idx + 1]
+                issuer_key = issuer.key_for(CertValidator.ISSUER_USAGES)
+                if cert.seclevel > issuer.seclevel:
+                    errors.append(f"cert {idx}: security level {cert.seclevel} above issuer's {issuer.seclevel}")
+            else:
+                issuer_key = root_key if root_key is not None else cert.key_for(CertValidator.ISSUER_USAGES)
+
+            if issuer_key is None or cert.signing_key != issuer_key:
+                errors.append(f"cert {idx}: not signed by its issuer key")
+            elif not CertValidator.verify_signature(cert):
+                errors.append(f"cert {idx}: invalid signature")
+
+        return errors
+
+    @staticmethod
+    def is_valid(chain: "BCert.CertificateChain", root_key: Optional[bytes] = None) -> bool:
+        errors = CertValidator.validate(chain, root_key)
+        for err in errors:
+            Shell.report_error(f"cert chain: {err}")
+        return not errors
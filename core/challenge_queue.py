@@ -0,0 +1,159 @@
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional
+
+from modules.shell import Shell
+from modules.vars import Vars
+from core.mspr import MSPR
+
+
+class ChallengeQueue:
+    """
+    Per device queue of pre-generated challenge parts (ephemeral XML key, nonce,
+    encrypted cert chain) refilled by a background thread. A license request only
+    inserts its content header and signs.
+    """
+
+    # Overridden by MSPR_CHALLENGE_DEPTH / MSPR_CHALLENGE_MAX_AGE (seconds)
+    DEPTH = 8
+    MAX_AGE = 300
+    # Seconds the refill thread backs off after a failed prepare()
+    RETRY_DELAY = 1.0
+
+    # Device serial -> ChallengeQueue
+    queues = {}
+    queues_lock = threading.Lock()
+
+    @staticmethod
+    def setting(name: str, default: int) -> int:
+        val = Vars.get_int(name)
+        return val if val > 0 else default
+
+    @staticmethod
+    def enabled() -> bool:
+        return Vars.get_int("MSPR_CHALLENGE_QUEUE") == 1
+
+    @staticmethod
+    def for_device(dev) -> "ChallengeQueue":
+        with ChallengeQueue.queues_lock:
+            queue = ChallengeQueue.queues.get(dev.get_serial())
+            if queue is None or queue.dev is not dev:
+                if queue is not None:
+                    queue.stop()
+                queue = ChallengeQueue(dev)
+                ChallengeQueue.queues[dev.get_serial()] = queue
+                queue.start()
+            return queue
+
+    @staticmethod
+    def license_request(dev, wrmheader) -> str:
+        """Builds a license request, from the device queue when MSPR_CHALLENGE_QUEUE is 1."""
+        if ChallengeQueue.enabled():
+            return ChallengeQueue.for_device(dev).request(wrmheader)
+        return MSPR.get_license_request(dev, wrmheader)
+
+    def __init__(self, dev, depth: Optional[int] = None, max_age: Optional[float] = None):
+        self.dev = dev
+        self.depth = depth or ChallengeQueue.setting("MSPR_CHALLENGE_DEPTH", ChallengeQueue.DEPTH)
+        self.max_age = max_age or ChallengeQueue.setting("MSPR_CHALLENGE_MAX_AGE", ChallengeQueue.MAX_AGE)
+        self.items = deque()
+        self.cond = threading.Condition()
+        self.thread = None
+        self.running = False
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.generated = 0
+        self.errors = 0
+        self.used_age = 0.0
+        # Chain generation is not thread-safe, it only ever happens on the callers' threads
+        dev.get_cert_chain()
+
+    def prepare(self, chain=None) -> "MSPR.PreparedChallenge":
+        return MSPR.PreparedChallenge(self.dev, MSPR.XmlKey(), chain)
+
+    def usable(self, prepared: "MSPR.PreparedChallenge") -> bool:
+        # A regenerated device chain (device or security level change) invalidates prepared challenges
+        return prepared.age() < self.max_age and prepared.chain is self.dev.cert_chain
+
+    def take(self) -> "MSPR.PreparedChallenge":
+        """Returns the oldest usable prepared challenge, building one inline when the queue is empty."""
+        # Regenerates a stale chain here, the refill thread waits for it
+        self.dev.get_cert_chain()
+        with self.cond:
+            while self.items:
+                prepared = self.items.popleft()
+                if self.usable(prepared):
+                    self.hits += 1
+                    self.used_age += prepared.age()
+                    self.cond.notify()
+                    return prepared
+                self.stale += 1
+            self.misses += 1
+            self.cond.notify()
+        return self.prepare()
+
+    def request(self, wrmheader) -> str:
+        return MSPR.get_license_request(self.dev, wrmheader, self.take())
+
+    def refill(self):
+        while True:
+            with self.cond:
+                while self.running and len(self.items) >= self.depth:
+                    # Wake up before the oldest entry goes stale to replace it
+                    timeout = self.max_age - self.items[0].age() if self.items else None
+                    self.cond.wait(timeout if timeout is None or timeout > 0 else 0)
+                    while self.items and not self.usable(self.items[0]):
+                        self.items.popleft()
+                        self.stale += 1
+                if not self.running:
+                    return
+                if self.dev.chain_stale():
+                    # Left to the next take(), which notifies once the chain is rebuilt
+                    self.cond.wait()
+                    continue
+                chain = self.dev.cert_chain
+            try:
+                prepared = self.prepare(chain)
+            except Exception as e:
+                Shell.report_error(f"Challenge prepare failed [{self.dev.get_serial()}]: {e}")
+                with self.cond:
+                    self.errors += 1
+                    self.cond.wait(ChallengeQueue.RETRY_DELAY)
+                continue
+            with self.cond:
+                self.items.append(prepared)
+                self.generated += 1
+
+    def start(self):
+        with self.cond:
+            if self.running:
+                return
+            self.running = True
+        self.thread = threading.Thread(target=self.refill, name=f"challenges-{self.dev.get_serial()}", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+        self.thread = None
+
+    def stats(self) -> Dict[str, float]:
+        """Queue depth, age of the oldest entry and hit/miss/stale/error counters."""
+        with self.cond:
+            oldest = self.items[0].age() if self.items else 0.0
+            return {
+                "depth": len(self.items),
+                "target_depth": self.depth,
+                "oldest_age": round(oldest, 3),
+                "mean_used_age": round(self.used_age / self.hits, 3) if self.hits else 0.0,
+                "hits": self.hits,
+                "misses": self.misses,
+                "stale": self.stale,
+                "generated": self.generated,
+                "errors": self.errors,
+            }
@@ -0,0 +1,140 @@
+import atexit
+import os
+import queue
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional
+
+from modules.utils import Utils
+from modules.vars import Vars
+from core.file_cache import FileCache
+
+
+class DebugSink:
+    """
+    Debug artifacts (license requests/responses, ...) kept off the license hot path.
+
+    Modes, selected by MSPR_DEBUG_SINK:
+    - off:   artifacts are dropped
+    - ring:  the last RING_SIZE artifacts are kept in memory and only written by dump()
+    - async: artifacts are written to the asset debug dir by a background thread (default)
+    - sync:  artifacts are written immediately, as before
+    """
+
+    MODE_OFF = "off"
+    MODE_RING = "ring"
+    MODE_ASYNC = "async"
+    MODE_SYNC = "sync"
+    MODES = (MODE_OFF, MODE_RING, MODE_ASYNC, MODE_SYNC)
+    DEFAULT_MODE = MODE_ASYNC
+
+    RING_SIZE = 64
+    # Larger artifacts are truncated
+    MAX_ARTIFACT = 1 << 20
+    # Artifacts are dropped while this many bytes wait for the async writer
+    MAX_PENDING = 16 << 20
+
+    ring = deque(maxlen=RING_SIZE)
+    pending = queue.Queue()
+    pending_bytes = 0
+    dropped = 0
+    written = 0
+    failed = 0
+    lock = threading.Lock()
+    writer = None
+
+    @staticmethod
+    def mode() -> str:
+        mode = Vars.get_str("MSPR_DEBUG_SINK")
+        return mode if mode in DebugSink.MODES else DebugSink.DEFAULT_MODE
+
+    @staticmethod
+    def path(assetname: str, name: str) -> str:
+        return os.path.join(FileCache.debug_dir(assetname), name)
+
+    @staticmethod
+    def save(assetname: str, name: str, data: bytes) -> bool:
+        try:
+            ok = Utils.save_file(FileCache.debug_file(assetname, name), data)
+        except Exception:
+            ok = False
+        with DebugSink.lock:
+            if ok:
+                DebugSink.written += 1
+            else:
+                DebugSink.failed += 1
+        return ok
+
+    @staticmethod
+    def write(assetname: str, name: str, data: bytes):
+        """Records a debug artifact of an asset according to the sink mode."""
+        mode = DebugSink.mode()
+        if mode == DebugSink.MODE_OFF:
+            return
+        if len(data) > DebugSink.MAX_ARTIFACT:
+            data = data[:DebugSink.MAX_ARTIFACT]
+        if mode == DebugSink.MODE_SYNC:
+            DebugSink.save(assetname, name, data)
+            return
+
+        with DebugSink.lock:
+            if mode == DebugSink.MODE_RING:
+                DebugSink.ring.append((assetname, name, data, time.time()))
+                return
+            if DebugSink.pending_bytes + len(data) > DebugSink.MAX_PENDING:
+                DebugSink.dropped += 1
+                return
+            DebugSink.pending_bytes += len(data)
+            if DebugSink.writer is None:
+                DebugSink.writer = threading.Thread(target=DebugSink.run, name="debug-sink", daemon=True)
+                DebugSink.writer.start()
+                # The writer is a daemon thread, queued artifacts are saved before the interpreter exits
+                atexit.register(DebugSink.flush)
+        DebugSink.pending.put((assetname, name, data))
+
+    @staticmethod
+    def run():
+        while True:
+            assetname, name, data = DebugSink.pending.get()
+            try:
+                # save() counts its own failures, the writer must outlive any of them
+                DebugSink.save(assetname, name, data)
+            finally:
+                with DebugSink.lock:
+                    DebugSink.pending_bytes -= len(data)
+                DebugSink.pending.task_done()
+
+    @staticmethod
+    def flush():
+        """Waits until the async writer has saved every queued artifact."""
+        DebugSink.pending.join()
+
+    @staticmethod
+    def dump(assetname: Optional[str] = None) -> int:
+        """Writes the in-memory artifacts (of one asset, or all) to disk, e.g. after an error; returns their count."""
+        mode = DebugSink.mode()
+        if mode == DebugSink.MODE_ASYNC:
+            # Already on their way to disk
+            DebugSink.flush()
+            return 0
+        if mode != DebugSink.MODE_RING:
+            return 0
+        with DebugSink.lock:
+            entries = [e for e in DebugSink.ring if assetname is None or e[0] == assetname]
+        # Only the latest artifact of each name is kept on disk
+        latest = {(e[0], e[1]): e[2] for e in entries}
+        for (asset, name), data in latest.items():
+            DebugSink.save(asset, name, data)
+        return len(latest)
+
+    @staticmethod
+    def stats() -> Dict[str, int]:
+        with DebugSink.lock:
+            return {
+                "ring": len(DebugSink.ring),
+                "pending_bytes": DebugSink.pending_bytes,
+                "written": DebugSink.written,
+                "failed": DebugSink.failed,
+                "dropped": DebugSink.dropped,
+            }
@@ -1,12 +1,23 @@
 import os
 from typing import Optional
 
+from modules.ecc import ECC
+from modules.error import ERR
+from modules.shell import Shell
+from modules.utils import Utils
+from modules.vars import Vars
+from core.bcert import BCert
+from core.cert_cache import CertCache
+from core.cert_validator import CertValidator
+from core.mspr import MSPR
+
 class Device:
     DEFAULT_SL = MSPR.SL2000
     UNIQUEID_SIZE = 0x10
     MAC_SIZE = 0x06
 
-    group_key = ECC.ECKey.from_file(os.path.join(BCert.BASE_DIR, "z1"))
+    # Loaded on first use by get_group_key(), importing the module reads no secrets
+    group_key = None
     curdev = None
     group_cert = None
 
@@ -14,13 +25,15 @@ class Device:
         self.serial = serial
         self.mac = mac
         self.uniqueid = uniqueid
+        self.cert = None
+        self.cert_chain = None
 
         if MSPR.fixed_identity():
-            self.sign_key = ECC.ECKey(Utils.parse_hex_string("f105e249363781a7c24ebd0bc1ba66642194f26ef2614998932b9bb67fef1337"))
-            self.enc_key = ECC.ECKey(Utils.parse_hex_string("d59e783a81ec4159a5089bfa735245421d4847eb4376c297112451a35b3e179d"))
+            self._sign_key = ECC.ECKey(Utils.parse_hex_string("f105e249363781a7c24ebd0bc1ba66642194f26ef2614998932b9bb67fef1337"))
+            self._enc_key = ECC.ECKey(Utils.parse_hex_string("d59e783a81ec4159a5089bfa735245421d4847eb4376c297112451a35b3e179d"))
         else:
-            self.sign_key = ECC.ECKey()
-            self.enc_key = ECC.ECKey()
+            self._sign_key = ECC.ECKey()
+            self._enc_key = ECC.ECKey()
 
     @staticmethod
     def revert_serial(serial: str, revert_pos: int) -> str:
@@ -72,10 +85,10 @@ class Device:
         return bytes(self.uniqueid)
 
     def sign_key(self) -> ECC.ECKey:
-        return self.sign_key
+        return self._sign_key
 
     def enc_key(self) -> ECC.ECKey:
-        return self.enc_key
+        return self._enc_key
 
     def print(self):
         pp = Shell.get_pp()
@@ -84,14 +97,16 @@ class Device:
         pp.println(f"serial: {self.get_serial()}")
         pp.println(f"mac:    {self.get_mac()}")
         pp.printhex("uniqueid", self.get_uniqueid())
-        self.sign_key.print("sign key")
-        self.enc_key.print("enc key")
+        self._sign_key.print("sign key")
+        self._enc_key.print("enc key")
         pp.leave()
 
     @staticmethod
     def gen_fake_group_cert():
         root_sign_key = ECC.ECKey()
-        for i in range(Device.group_cert.cert_cnt() - 1, -1, -1):
+        # The fake root is the one generated chains must lead to
+        CertValidator.pin_root_key(root_sign_key.pub_bytes())
+        for i in range(Device.group_cert.cert_cnt - 1, -1, -1):
             cert = Device.group_cert.get(i)
             cert_sign_key = ECC.ECKey()
             cert.sign(root_sign_key, cert_sign_key)
@@ -100,21 +115,38 @@ class Device:
 
     @staticmethod
     def get_group_cert() -> BCert.CertificateChain:
-        print("Device.get_group_cert")
         if Device.group_cert is None:
-            Device.group_cert = BCert.from_file("g1")
+            Device.group_cert = CertCache.group_cert("g1")
             if Vars.get_int("MSPR_FAKE_ROOT") == 1:
                 Device.gen_fake_group_cert()
                 Device.group_cert.save("fakechain")
         return Device.group_cert
 
+    @staticmethod
+    def get_group_key() -> Optional[ECC.ECKey]:
+        # A 32 byte raw key, cheaper to read than a cache and never copied to one
+        if Device.group_key is None:
+            path = os.path.join(BCert.BASE_DIR, "z1")
+            Device.group_key = ECC.ECKey.from_file(path)
+            # Earlier versions kept a plaintext copy of the key in a cache next to it
+            try:
+                os.remove(CertCache.cache_filename(path))
+            except OSError:
+                pass
+        return Device.group_key
+
     @staticmethod
     def get_group_prvkey() -> int:
-        return Device.group_key.prv()
+        return Device.get_group_key().prv()
 
     @staticmethod
     def get_group_pubkey() -> ECC.ECPoint:
-        return Device.group_key.pub()
+        return Device.get_group_key().pub()
+
+    @staticmethod
+    def cur_SL() -> int:
+        level = MSPR.string2SL(Vars.get_str("SL"))
+        return level if level > 0 else Device.DEFAULT_SL
 
     @staticmethod
     def changed() -> bool:
@@ -131,7 +163,7 @@ class Device:
         if (self.cert is None or self.changed() or
            (self.cert is not None and self.cert.get_seclevel() != self.cur_SL())):
             self.cert = BCert.Certificate()
-            Shell.out.println("generating new cert, device changed or not initialized")
+            Shell.println("generating new cert, device changed or not initialized")
             if MSPR.fixed_identity():
                 random = Utils.parse_hex_string("bee27cbf64aac0c94cd60ff28a05e1b4")
             else:
@@ -139,21 +171,34 @@ class Device:
             self.cert.set_random(random)
             self.cert.set_seclevel(self.cur_SL())
             self.cert.set_uniqueid(self.get_uniqueid())
-            self.cert.set_prvkey_sign(self.sign_key.prv_bytes())
-            self.cert.set_pubkey_sign(self.sign_key.pub_bytes())
-            self.cert.set_pubkey_enc(self.enc_key.pub_bytes())
+            self.cert.set_prvkey_sign(self._sign_key.prv_bytes())
+            self.cert.set_pubkey_sign(self._sign_key.pub_bytes())
+            self.cert.set_pubkey_enc(self._enc_key.pub_bytes())
+            # Loading the group cert first, a fake root replaces the group key
+            self.get_group_cert()
+            if Device.get_group_key() is None:
+                ERR.log("No group private key to sign the device cert with")
+            self.cert.sign(Device.group_key)
         return self.cert
 
+    def chain_stale(self) -> bool:
+        """True when the next get_cert_chain() call generates the chain (first use, device or security level change)."""
+        return (self.cert_chain is None or self.changed() or
+                (self.cert is not None and self.cert.get_seclevel() != self.cur_SL()))
+
     def get_cert_chain(self) -> BCert.CertificateChain:
-        print("Device.get_cert_chain")
-        if (self.cert_chain is None or self.changed() or
-           (self.cert is not None and self.cert.get_seclevel() != self.cur_SL())):
+        if self.chain_stale():
             if MSPR.fixed_identity():
                 r = ECC.make_bi(Utils.reverse_hex_string("062dd035241da79eedbc2abc9d99ab5b159788bb78d56aedcc3b603018ec02f7"))
                 ECC.set_random(r)
             gcert = self.get_group_cert()
-            print(f"gcert {gcert}")
             self.cert_chain = gcert.insert(self.get_cert())
+            if Vars.get_int("MSPR_VERIFY_CHAIN") == 1:
+                root_key = CertValidator.pinned_root_key()
+                if root_key is None:
+                    ERR.log(f"No trusted root key [{os.path.join(BCert.BASE_DIR, CertValidator.ROOT_KEY_FILE)}] to verify the device cert chain")
+                if not CertValidator.is_valid(self.cert_chain, root_key):
+                    ERR.log("Generated device cert chain is invalid")
             self.cert_chain.save("genchain")
         return self.cert_chain
 
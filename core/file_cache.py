@@ -1,4 +1,8 @@
 import os
+from typing import Optional
+
+from modules.utils import Utils
+from modules.vars import Vars
 
 class FileCache:
     DEFAULT_CACHE_DIR = "content"
@@ -14,10 +18,13 @@ class FileCache:
     INFO_FILE = "Info.json"
     MP4_FILE = "movie.mp4"
 
+    # Debug dirs already created by this process
+    debug_dirs = set()
+
     @staticmethod
     def content_dir() -> str:
         cache_dir = Vars.get_str("CONTENT_DIR")
-        if cache_dir is None:
+        if cache_dir == Vars.UNKNOWN_STR:
             cache_dir = FileCache.DEFAULT_CACHE_DIR
         return cache_dir
 
@@ -46,7 +53,9 @@ class FileCache:
     @staticmethod
     def debug_file(assetname: str, debugfile: str) -> str:
         dir = FileCache.debug_dir(assetname)
-        Utils.mkdir(dir)
+        if dir not in FileCache.debug_dirs:
+            Utils.mkdir(dir)
+            FileCache.debug_dirs.add(dir)
         return os.path.join(dir, debugfile)
 
     @staticmethod
@@ -72,7 +81,7 @@ class FileCache:
     @staticmethod
     def local_license_filename(assetname: str) -> Optional[str]:
         local_license = Vars.get_str("MSPR_LOCAL_LICENSE")
-        if local_license:
+        if local_license != Vars.UNKNOWN_STR:
             return os.path.join(FileCache.asset_dir(assetname), local_license)
         return None
 
@@ -121,6 +130,30 @@ class FileCache:
             vqdir = FileCache.video_qdir(assetname, vquality)
             Utils.mkdir(vqdir)
 
+    @staticmethod
+    def stream_dir(assetname: str, stream_type: str, stream_name: str) -> str:
+        if stream_type == "audio":
+            return FileCache.audio_dir(assetname, stream_name)
+        return FileCache.video_dir(assetname)
+
+    @staticmethod
+    def remove_fragments(assetname: str, stream_type: str, stream_name: str, first: int, last: int) -> int:
+        """Removes cached fragments [first, last) of a stream from all its quality dirs, returns the count removed."""
+        sdir = FileCache.stream_dir(assetname, stream_type, stream_name)
+        try:
+            qdirs = [os.path.join(sdir, d) for d in os.listdir(sdir) if d.startswith(FileCache.QUALITY_DIR)]
+        except OSError:
+            return 0
+        removed = 0
+        for qdir in qdirs:
+            for idx in range(first, last):
+                try:
+                    os.remove(os.path.join(qdir, str(idx)))
+                    removed += 1
+                except OSError:
+                    pass
+        return removed
+
     @staticmethod
     def fragment_exists(assetid: str, audio_name: str, audio_quality: str, video_quality: str, idx: int) -> bool:
         vfragpath = FileCache.video_filename(assetid, video_quality, idx)
@@ -1,5 +1,15 @@
 import os
+from array import array
+from bisect import bisect_left, bisect_right
+from io import BytesIO
 from xml.dom import minidom
+from xml.parsers import expat
+
+from modules.shell import Shell
+from modules.utils import Utils
+from modules.xml_utils import XmlUtils
+from core.file_cache import FileCache
+from core.wrm_header import WRMHeader
 
 class ISMManifest:
     class SmoothStreamingMedia:
@@ -8,6 +18,9 @@ class ISMManifest:
             self.attMinorVersion = None
             self.attTimeScale = None
             self.attDuration = None
+            self.attIsLive = None
+            self.attLookAheadFragmentCount = None
+            self.attDVRWindowLength = None
 
         def MajorVersion(self):
             return self.attMajorVersion
@@ -21,18 +34,33 @@ class ISMManifest:
         def Duration(self):
             return self.attDuration
 
+        def IsLive(self):
+            return self.attIsLive
+
+        def LookAheadFragmentCount(self):
+            return self.attLookAheadFragmentCount
+
+        def DVRWindowLength(self):
+            return self.attDVRWindowLength
+
+        def is_live(self):
+            return (self.attIsLive or "").upper() == "TRUE"
+
+        def timescale_val(self):
+            timescale = Utils.long_value(self.attTimeScale)
+            return timescale if timescale > 0 else ISMManifest.DEFAULT_TIMESCALE
+
         def real_duration(self):
             duration = Utils.long_value(self.attDuration)
-            timescale = Utils.long_value(self.attTimeScale)
-            if duration < 0 or timescale < 0:
+            if duration < 0:
                 return -1
-            return duration // timescale
+            return duration // self.timescale_val()
 
         def duration_str(self):
             return MP4File.duration_str(self.real_duration())
 
         def print(self):
-            pp = PaddedPrinter.get_pp()
+            pp = Shell.get_pp()
             pp.println("SmoothStreamingMedia")
             pp.pad(2, "")
             pp.println("MajorVersion: " + self.attMajorVersion)
@@ -44,33 +72,34 @@ class ISMManifest:
     class ProtectionHeader:
         def __init__(self):
             self.attSystemID = None
-            self.data = None
-            self.wrmhdr_data = None
-            self.wrmhdr = None
+            self._data = None
+            self._wrmhdr_data = None
+            self._wrmhdr = None
 
         def SystemID(self):
             return self.attSystemID
 
         def data(self):
-            return self.data
+            return self._data
 
         def set_data(self, data):
-            self.data = data
-            self.wrmhdr_data = MSPR.wrmhdr_from_prothdr(data)
-            self.wrmhdr = WRMHeader(self.wrmhdr_data.encode())
+            self._data = data
+            self._wrmhdr = WRMHeader.from_prothdr(data)
+            self._wrmhdr_data = self._wrmhdr.xml() if self._wrmhdr else None
 
         def wrmhdr_data(self):
-            return self.wrmhdr_data
+            return self._wrmhdr_data
 
         def wrmhdr(self):
-            return self.wrmhdr
+            return self._wrmhdr
 
         def print(self):
-            pp = PaddedPrinter.get_pp()
+            pp = Shell.get_pp()
             pp.println("ProtectionHeader")
             pp.pad(2, "")
-            pp.println("SystemID: " + self.attSystemID)
-            self.wrmhdr.print()
+            pp.println(f"SystemID: {self.attSystemID}")
+            if self._wrmhdr:
+                self._wrmhdr.print()
             pp.leave()
 
     class QualityLevel:
@@ -99,7 +128,7 @@ class ISMManifest:
             return self.CodecPrivateData
 
         def print(self):
-            pp = PaddedPrinter.get_pp()
+            pp = Shell.get_pp()
             pp.println("QualityLevel")
             pp.pad(2, "")
             pp.println("Index: " + self.attIndex)
@@ -134,7 +163,7 @@ class ISMManifest:
 
         def print(self):
             super().print()
-            pp = PaddedPrinter.get_pp()
+            pp = Shell.get_pp()
             pp.pad(2, "")
             pp.println("SamplingRate: " + self.attSamplingRate)
             pp.println("Channels: " + self.attChannels)
@@ -157,7 +186,7 @@ class ISMManifest:
 
         def print(self):
             super().print()
-            pp = PaddedPrinter.get_pp()
+            pp = Shell.get_pp()
             pp.pad(2, "")
             pp.println("MaxWidth: " + self.attMaxWidth)
             pp.println("MaxHeight: " + self.attMaxHeight)
@@ -167,6 +196,7 @@ class ISMManifest:
         def __init__(self):
             self.attt = None
             self.attd = None
+            self.attr = None
             self.start_time_val = -1
 
         def start_time(self):
@@ -184,12 +214,233 @@ class ISMManifest:
         def duration_val(self):
             return Utils.long_value(self.attd) if self.attd else 0
 
+        def repeat_val(self):
+            return max(Utils.long_value(self.attr), 1) if self.attr else 1
+
         def print(self):
-            pp = PaddedPrinter.get_pp()
+            pp = Shell.get_pp()
             pp.pad(2, "")
             pp.println(f"Duration: {self.attd} StartTime: {self.attt if self.attt else ''}")
             pp.leave()
 
+    class Timeline:
+        """
+        Run-length chunk timeline in stream timescale units.
+
+        Each run is a sequence of contiguous chunks of equal duration stored as
+        (start, duration, count, index of its first chunk) in array('q') columns,
+        so a stream of uniform chunks is a single run whatever its length.
+        Chunk indexes are absolute: evicting old chunks moves base forward but
+        never renumbers the chunks that remain.
+        """
+
+        def __init__(self):
+            self.run_starts = array('q')
+            self.run_durations = array('q')
+            self.run_counts = array('q')
+            self.run_first = array('q')
+            self.count = 0
+            self.base = 0
+            self.evicted_end = 0
+
+        def __len__(self):
+            return self.count
+
+        def run_cnt(self):
+            return len(self.run_starts)
+
+        def add(self, start, duration, repeat=1):
+            if self.run_starts and self.run_durations[-1] == duration and self.end() == start:
+                self.run_counts[-1] += repeat
+            else:
+                self.run_starts.append(start)
+                self.run_durations.append(duration)
+                self.run_counts.append(repeat)
+                self.run_first.append(self.count)
+            self.count += repeat
+
+        def run_of(self, i):
+            return bisect_right(self.run_first, i) - 1
+
+        def start(self, i):
+            k = self.run_of(i)
+            return self.run_starts[k] + (i - self.run_first[k]) * self.run_durations[k]
+
+        def duration(self, i):
+            return self.run_durations[self.run_of(i)]
+
+        def end(self):
+            if not self.run_starts:
+                return self.evicted_end
+            return self.run_starts[-1] + self.run_counts[-1] * self.run_durations[-1]
+
+        def evict_before(self, t):
+            """Drops chunks starting before timestamp t, returns the evicted index range [first, last)."""
+            first = self.base
+            k = bisect_left(self.run_starts, t)
+            if k > 0 and k == len(self.run_starts):
+                self.evicted_end = self.end()
+            # Runs entirely before t go at once, the run straddling t is shortened
+            full = k
+            if k > 0 and self.run_starts[k - 1] + self.run_counts[k - 1] * self.run_durations[k - 1] > t:
+                full = k - 1
+            del self.run_starts[:full]
+            del self.run_durations[:full]
+            del self.run_counts[:full]
+            del self.run_first[:full]
+            if self.run_starts and self.run_starts[0] < t:
+                duration = self.run_durations[0]
+                off = -((self.run_starts[0] - t) // duration) if duration > 0 else self.run_counts[0]
+                self.run_starts[0] += off * duration
+                self.run_counts[0] -= off
+                self.run_first[0] += off
+            self.base = self.run_first[0] if self.run_starts else self.count
+            return first, self.base
+
+        def evict_to_count(self, keep):
+            """Keeps at most the last keep chunks, returns the evicted index range [first, last)."""
+            if self.count - self.base <= keep:
+                return self.base, self.base
+            if keep <= 0:
+                return self.evict_before(self.end())
+            return self.evict_before(self.start(self.count - keep))
+
+        def index_at(self, t):
+            """Index of the chunk covering timestamp t, -1 if t is outside the timeline."""
+            k = bisect_right(self.run_starts, t) - 1
+            if k < 0:
+                return -1
+            duration = self.run_durations[k]
+            off = (t - self.run_starts[k]) // duration if duration > 0 else 0
+            if off >= self.run_counts[k]:
+                return -1
+            return self.run_first[k] + off
+
+        def first_index_from(self, t):
+            """Index of the chunk covering t or, in a gap, of the chunk preceding it."""
+            k = bisect_right(self.run_starts, t) - 1
+            if k < 0:
+                return self.base
+            duration = self.run_durations[k]
+            off = (t - self.run_starts[k]) // duration if duration > 0 else 0
+            return self.run_first[k] + min(off, self.run_counts[k] - 1)
+
+        def count_before(self, t):
+            """Number of chunks starting before timestamp t."""
+            k = bisect_left(self.run_starts, t) - 1
+            if k < 0:
+                return self.base
+            duration = self.run_durations[k]
+            n = -((self.run_starts[k] - t) // duration) if duration > 0 else self.run_counts[k]
+            return self.run_first[k] + min(n, self.run_counts[k])
+
+        def merge(self, other):
+            """Appends the chunks of other that start at or after the end of this timeline, returns their count."""
+            added = 0
+            for k in range(other.run_cnt()):
+                start = other.run_starts[k]
+                duration = other.run_durations[k]
+                count = other.run_counts[k]
+                skip = 0
+                if self.count and start < self.end():
+                    if duration <= 0:
+                        continue
+                    skip = min(-((start - self.end()) // duration), count)
+                if skip < count:
+                    self.add(start + skip * duration, duration, count - skip)
+                    added += count - skip
+            return added
+
+        def starts_in(self, first, last):
+            """Yields the start times of chunks [first, last), walking the runs instead of bisecting per chunk."""
+            first = max(first, self.base)
+            last = min(last, self.count)
+            if first >= last:
+                return
+            k = self.run_of(first)
+            i = first
+            while i < last:
+                start = self.run_starts[k]
+                duration = self.run_durations[k]
+                run_last = min(self.run_first[k] + self.run_counts[k], last)
+                for j in range(i - self.run_first[k], run_last - self.run_first[k]):
+                    yield start + j * duration
+                i = run_last
+                k += 1
+
+        def range_for(self, start, duration):
+            """Chunk index range [first, last) covering [start, start + duration), duration 0 meaning up to the end."""
+            if self.count == self.base:
+                return self.base, self.base
+            first = self.first_index_from(start)
+            if duration <= 0:
+                return first, self.count
+            return first, self.count_before(start + duration)
+
+    class UrlTemplate:
+        """
+        Fragment URL template of one quality level of a stream, compiled once.
+
+        The bitrate placeholder is substituted at compile time and the template
+        is split around the start time placeholder, so producing a URL is a
+        single string concatenation.
+        """
+
+        BITRATE_KEYS = ("{bitrate}", "{Bitrate}")
+        START_TIME_KEYS = ("{start time}", "{start_time}", "{Start Time}")
+
+        def __init__(self, si, ql, base_url="", assetname=None, quality=None):
+            self.si = si
+            self.ql = ql
+            self.assetname = assetname
+            self.quality = quality if quality is not None else ql.Index()
+            self.qdir_path = None
+
+            template = si.Url() or ""
+            for key in ISMManifest.UrlTemplate.BITRATE_KEYS:
+                template = template.replace(key, ql.Bitrate() or "")
+            self.prefix = base_url + template
+            self.suffix = ""
+            for key in ISMManifest.UrlTemplate.START_TIME_KEYS:
+                pos = template.find(key)
+                if pos >= 0:
+                    self.prefix = base_url + template[:pos]
+                    self.suffix = template[pos + len(key):]
+                    break
+
+        def url(self, i):
+            return self.prefix + str(self.si.timeline.start(i)) + self.suffix
+
+        def urls(self, first, last):
+            prefix = self.prefix
+            suffix = self.suffix
+            return [prefix + str(start) + suffix for start in self.si.timeline.starts_in(first, last)]
+
+        def urls_for(self, td):
+            """Fragment URLs covering an MP4Builder.TimeDesc."""
+            return self.urls(*self.si.chunk_range(td))
+
+        def qdir(self):
+            if self.qdir_path is None:
+                if self.si.Type() == "audio":
+                    self.qdir_path = FileCache.audio_qdir(self.assetname, self.si.Name(), self.quality)
+                else:
+                    self.qdir_path = FileCache.video_qdir(self.assetname, self.quality)
+            return self.qdir_path
+
+        def path(self, i):
+            return os.path.join(self.qdir(), str(i))
+
+        def paths(self, first, last):
+            qdir = self.qdir()
+            first = max(first, self.si.first_chunk())
+            return [os.path.join(qdir, str(i)) for i in range(first, min(last, self.si.chunk_cnt()))]
+
+    @staticmethod
+    def base_url(manifest_url):
+        """Fragment URLs are relative to the directory holding the manifest."""
+        return manifest_url.rsplit("/", 1)[0] + "/" if manifest_url and "/" in manifest_url else ""
+
     class StreamIndex:
         def __init__(self):
             self.attType = None
@@ -199,7 +450,10 @@ class ISMManifest:
             self.attQualityLevels = None
             self.attUrl = None
             self.qlevels = []
-            self.chunks = []
+            self.timeline = ISMManifest.Timeline()
+            self.url_templates = {}
+            # TimeScale is optional on StreamIndex, it then is the SmoothStreamingMedia one
+            self.ssm_timescale = ISMManifest.DEFAULT_TIMESCALE
 
         def Type(self):
             return self.attType
@@ -220,7 +474,8 @@ class ISMManifest:
             return self.attUrl
 
         def timescale_val(self):
-            return Utils.long_value(self.attTimeScale)
+            timescale = Utils.long_value(self.attTimeScale)
+            return timescale if timescale > 0 else self.ssm_timescale
 
         def ql_cnt(self):
             return len(self.qlevels)
@@ -232,16 +487,64 @@ class ISMManifest:
             self.qlevels.append(ql)
 
         def chunk_cnt(self):
-            return len(self.chunks)
+            return len(self.timeline)
+
+        def first_chunk(self):
+            return self.timeline.base
 
         def get_chunk(self, i):
-            return self.chunks[i] if i < len(self.chunks) else None
+            if i < self.timeline.base or i >= len(self.timeline):
+                return None
+            chunk = ISMManifest.Chunk()
+            chunk.attt = str(self.timeline.start(i))
+            chunk.attd = str(self.timeline.duration(i))
+            chunk.set_start_time_val(self.timeline.start(i))
+            return chunk
 
         def add_chunk(self, chunk):
-            self.chunks.append(chunk)
+            start = chunk.start_time_val if chunk.start_time_val >= 0 else Utils.long_value(chunk.attt)
+            self.timeline.add(start, chunk.duration_val(), chunk.repeat_val())
+
+        def key(self):
+            return self.attType, self.attName
+
+        def url_template(self, i, base_url="", assetname=None, quality=None):
+            """Returns the compiled fragment URL template of quality level i, cached per stream."""
+            key = (i, base_url, assetname, quality)
+            template = self.url_templates.get(key)
+            if template is None:
+                template = ISMManifest.UrlTemplate(self, self.qlevels[i], base_url, assetname, quality)
+                self.url_templates[key] = template
+            return template
+
+        def merge(self, other):
+            """Merges new chunks of the same stream from a newer manifest, returns the index range added."""
+            first = self.chunk_cnt()
+            self.timeline.merge(other.timeline)
+            return first, self.chunk_cnt()
+
+        def trim(self, dvr_duration=None, dvr_chunks=None):
+            """
+            Applies a DVR window, dvr_duration in seconds and/or dvr_chunks in chunks,
+            and returns the evicted chunk index range [first, last).
+            """
+            first = self.timeline.base
+            if dvr_duration is not None:
+                self.timeline.evict_before(self.timeline.end() - dvr_duration * self.timescale_val())
+            if dvr_chunks is not None:
+                self.timeline.evict_to_count(dvr_chunks)
+            return first, self.timeline.base
+
+        def chunk_index_at(self, t):
+            return self.timeline.index_at(t)
+
+        def chunk_range(self, td):
+            """Chunk index range [first, last) covering an MP4Builder.TimeDesc (in seconds)."""
+            timescale = self.timescale_val()
+            return self.timeline.range_for(td.start_time() * timescale, td.duration() * timescale)
 
         def print(self):
-            pp = PaddedPrinter.get_pp()
+            pp = Shell.get_pp()
             pp.println("StreamIndex")
             pp.pad(2, "")
             pp.println("Type: " + self.attType)
@@ -256,10 +559,81 @@ class ISMManifest:
                 pp.leave()
             pp.leave()
 
-    def __init__(self, path, data):
+    class StreamParser:
+        """Single pass expat parser filling the manifest objects without building a DOM."""
+
+        def __init__(self, ism):
+            self.ism = ism
+            self.si = None
+            self.start_time = 0
+            self.ph_text = None
+
+        def start_element(self, name, attrs):
+            if name == "c":
+                if self.si is not None:
+                    duration = Utils.long_value(attrs["d"]) if "d" in attrs else 0
+                    repeat = max(Utils.long_value(attrs["r"]), 1) if "r" in attrs else 1
+                    if "t" in attrs:
+                        self.start_time = Utils.long_value(attrs["t"])
+                    self.si.timeline.add(self.start_time, duration, repeat)
+                    self.start_time += duration * repeat
+            elif name == "QualityLevel":
+                if self.si is not None:
+                    self.si.add_ql(XmlUtils.instance_from_attrs(
+                        ISMManifest.AudioQualityLevel if self.si.Type() == "audio" else ISMManifest.VideoQualityLevel, attrs
+                    ))
+            elif name == "StreamIndex":
+                self.si = XmlUtils.instance_from_attrs(ISMManifest.StreamIndex, attrs)
+                if self.ism.ssm is not None:
+                    self.si.ssm_timescale = self.ism.ssm.timescale_val()
+                self.ism.streams.append(self.si)
+                self.start_time = 0
+            elif name == "SmoothStreamingMedia":
+                self.ism.ssm = XmlUtils.instance_from_attrs(ISMManifest.SmoothStreamingMedia, attrs)
+            elif name == "ProtectionHeader":
+                self.ism.ph = XmlUtils.instance_from_attrs(ISMManifest.ProtectionHeader, attrs)
+                self.ph_text = []
+
+        def end_element(self, name):
+            if name == "StreamIndex":
+                self.si = None
+            elif name == "ProtectionHeader":
+                xml_data = "".join(self.ph_text).strip()
+                self.ph_text = None
+                if xml_data:
+                    self.ism.ph.set_data(xml_data)
+
+        def char_data(self, data):
+            if self.ph_text is not None:
+                self.ph_text.append(data)
+
+        def parse(self, data):
+            parser = expat.ParserCreate()
+            parser.buffer_text = True
+            parser.StartElementHandler = self.start_element
+            parser.EndElementHandler = self.end_element
+            parser.CharacterDataHandler = self.char_data
+            parser.Parse(data, True)
+
+    # Manifests are parsed with the streaming parser unless the DOM one is requested
+    USE_DOM = False
+    # TimeScale of a manifest that does not set one
+    DEFAULT_TIMESCALE = 10000000
+
+    def __init__(self, path, data, use_dom=None):
         self.path = path
         self.data = data
-        self.root = XmlUtils.parse_xml(data)
+        self.root = None
+        self.ssm = None
+        self.ph = None
+        self.streams = []
+        if use_dom if use_dom is not None else ISMManifest.USE_DOM:
+            self.parse_dom()
+        else:
+            ISMManifest.StreamParser(self).parse(data)
+
+    def parse_dom(self):
+        self.root = XmlUtils.parse_xml(BytesIO(self.data))
         self.ssm = XmlUtils.instance_from_node(ISMManifest.SmoothStreamingMedia, XmlUtils.first_element(self.root, "SmoothStreamingMedia"))
         self.ph = XmlUtils.instance_from_node(ISMManifest.ProtectionHeader, XmlUtils.select_first(self.root, "SmoothStreamingMedia.Protection.ProtectionHeader"))
         if self.ph:
@@ -267,9 +641,10 @@ class ISMManifest:
             if xml_data:
                 self.ph.set_data(xml_data)
 
-        self.streams = []
         for si_node in XmlUtils.select(self.root, "SmoothStreamingMedia.StreamIndex"):
             si = XmlUtils.instance_from_node(ISMManifest.StreamIndex, si_node)
+            if self.ssm is not None:
+                si.ssm_timescale = self.ssm.timescale_val()
             self.streams.append(si)
             for ql_node in XmlUtils.get_elements(si_node, "QualityLevel"):
                 ql = XmlUtils.instance_from_node(
@@ -279,16 +654,25 @@ class ISMManifest:
             start_time = 0
             for ch_node in XmlUtils.get_elements(si_node, "c"):
                 chunk = XmlUtils.instance_from_node(ISMManifest.Chunk, ch_node)
+                if chunk.attt:
+                    start_time = Utils.long_value(chunk.attt)
                 chunk.set_start_time_val(start_time)
                 si.add_chunk(chunk)
-                start_time += chunk.duration_val()
+                start_time += chunk.duration_val() * chunk.repeat_val()
+
+    def __getstate__(self):
+        # Snapshots keep the parsed objects only, never the raw XML or a DOM
+        state = self.__dict__.copy()
+        state["data"] = None
+        state["root"] = None
+        return state
 
     def get_wrmhdr_data(self):
         return self.ph.wrmhdr_data() if self.ph else None
 
     @staticmethod
-    def from_file(path):
+    def from_file(path, use_dom=None):
         data = Utils.load_file(path)
         if data:
-            return ISMManifest(path, data)
+            return ISMManifest(path, data, use_dom)
         return None
@@ -0,0 +1,238 @@
+import datetime
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from modules.utils import Utils
+from core.file_cache import FileCache
+
+
+class KeyStore:
+    """
+    Content keys indexed by KID: a bounded in-memory LRU backed by an append-only
+    JSON lines log in the content directory. Entries expire with their license.
+
+    The log has a single writer: one process at a time may use a content directory.
+    Compaction on load rewrites the log and would lose the appends of another process.
+    """
+
+    LOG_FILE = "keys.log"
+    CACHE_SIZE = 1024
+    # The log is rewritten on load once it holds this many times more lines than live keys
+    COMPACT_RATIO = 4
+
+    DATE_FORMATS = ["%Y/%m/%d %I:%M:%S %p", "%m/%d/%Y %I:%M:%S %p", "%Y-%m-%d %H:%M:%S"]
+
+    # KID hex -> (content key, expiry as epoch seconds or None)
+    entries = OrderedDict()
+    # KID hex -> offset of its latest record in the log, misses of other KIDs skip the log
+    offsets = {}
+    loaded = False
+    lock = threading.Lock()
+
+    @staticmethod
+    def log_filename() -> str:
+        return os.path.join(FileCache.content_dir(), KeyStore.LOG_FILE)
+
+    @staticmethod
+    def parse_expiration(sdate: Optional[str]) -> Optional[float]:
+        """Converts a license ExpirationDate to epoch seconds, None when absent or unparsable."""
+        if not sdate:
+            return None
+        sdate = sdate.strip()
+        try:
+            date = datetime.datetime.fromisoformat(sdate.replace("Z", "+00:00"))
+        except ValueError:
+            date = None
+            for fmt in KeyStore.DATE_FORMATS:
+                try:
+                    date = datetime.datetime.strptime(sdate, fmt)
+                    break
+                except ValueError:
+                    pass
+            if date is None:
+                return None
+        if date.tzinfo is None:
+            date = date.replace(tzinfo=datetime.timezone.utc)
+        return date.timestamp()
+
+    @staticmethod
+    def expired(entry: Tuple[bytes, Optional[float]], now: float) -> bool:
+        return entry[1] is not None and entry[1] <= now
+
+    @staticmethod
+    def record(kid: str, key: Optional[bytes], expires: Optional[float]) -> bytes:
+        rec = {"kid": kid, "key": Utils.construct_hex_string(key) if key else None, "expires": expires}
+        return (json.dumps(rec) + "\n").encode()
+
+    @staticmethod
+    def parse_record(line: bytes) -> Tuple[Optional[str], Optional[Tuple[bytes, Optional[float]]]]:
+        """Returns (KID hex, entry or None for a removal), (None, None) for a torn line."""
+        try:
+            rec = json.loads(line)
+            kid = rec["kid"]
+        except (ValueError, KeyError, TypeError):
+            # A torn last line from an interrupted append
+            return None, None
+        if not rec.get("key"):
+            return kid, None
+        return kid, (Utils.parse_hex_string(rec["key"]), rec.get("expires"))
+
+    @staticmethod
+    def read_log() -> Tuple[OrderedDict, Dict[str, int], int]:
+        """Replays the log, returns (KID hex -> entry in write order, KID hex -> record offset, number of lines)."""
+        entries = OrderedDict()
+        offsets = {}
+        lines = 0
+        pos = 0
+        try:
+            with open(KeyStore.log_filename(), "rb") as f:
+                for line in f:
+                    offset = pos
+                    pos += len(line)
+                    lines += 1
+                    kid, entry = KeyStore.parse_record(line)
+                    if kid is None:
+                        continue
+                    entries.pop(kid, None)
+                    offsets.pop(kid, None)
+                    if entry is not None:
+                        entries[kid] = entry
+                        offsets[kid] = offset
+        except OSError:
+            pass
+        return entries, offsets, lines
+
+    @staticmethod
+    def read_entry(offset: int) -> Optional[Tuple[bytes, Optional[float]]]:
+        """Reads the single log record at offset."""
+        try:
+            with open(KeyStore.log_filename(), "rb") as f:
+                f.seek(offset)
+                return KeyStore.parse_record(f.readline())[1]
+        except OSError:
+            return None
+
+    @staticmethod
+    def append(kid: str, key: Optional[bytes], expires: Optional[float]) -> int:
+        """Appends a record to the log, returns its offset."""
+        path = KeyStore.log_filename()
+        Utils.mkdir(os.path.dirname(path) or ".")
+        with open(path, "ab+") as f:
+            offset = f.seek(0, os.SEEK_END)
+            if offset:
+                f.seek(offset - 1)
+                if f.read(1) != b"\n":
+                    # Terminate a torn last line, the record would be glued to it and lost on replay
+                    f.write(b"\n")
+                    offset += 1
+            f.write(KeyStore.record(kid, key, expires))
+        return offset
+
+    @staticmethod
+    def compact(entries: OrderedDict) -> Dict[str, int]:
+        """Rewrites the log with the given live entries only, returns their new offsets."""
+        path = KeyStore.log_filename()
+        tmp = path + ".tmp"
+        offsets = {}
+        with open(tmp, "wb") as f:
+            for kid, (key, expires) in entries.items():
+                offsets[kid] = f.tell()
+                f.write(KeyStore.record(kid, key, expires))
+        os.replace(tmp, path)
+        return offsets
+
+    @staticmethod
+    def load():
+        """Fills the memory cache from the log once, dropping expired keys."""
+        if KeyStore.loaded:
+            return
+        now = time.time()
+        entries, offsets, lines = KeyStore.read_log()
+        live = OrderedDict((kid, e) for kid, e in entries.items() if not KeyStore.expired(e, now))
+        offsets = {kid: offsets[kid] for kid in live}
+        if lines > KeyStore.COMPACT_RATIO * max(len(live), 1):
+            try:
+                offsets = KeyStore.compact(live)
+            except OSError:
+                pass
+        # The most recently written keys are the most recently used ones
+        for kid in list(live)[-KeyStore.CACHE_SIZE:]:
+            KeyStore.entries[kid] = live[kid]
+        KeyStore.offsets = offsets
+        KeyStore.loaded = True
+
+    @staticmethod
+    def evict(now: float):
+        """Keeps the cache within CACHE_SIZE, dropping expired keys before the least recently used."""
+        cache = KeyStore.entries
+        if len(cache) <= KeyStore.CACHE_SIZE:
+            return
+        for kid in [kid for kid, e in cache.items() if KeyStore.expired(e, now)]:
+            del cache[kid]
+        while len(cache) > KeyStore.CACHE_SIZE:
+            cache.popitem(last=False)
+
+    @staticmethod
+    def get(kid: bytes) -> Optional[bytes]:
+        """Returns the unexpired content key of a KID, None if unknown or expired."""
+        hkid = Utils.construct_hex_string(kid)
+        now = time.time()
+        with KeyStore.lock:
+            KeyStore.load()
+            cache = KeyStore.entries
+            entry = cache.get(hkid)
+            if entry is None:
+                offset = KeyStore.offsets.get(hkid)
+                if offset is None:
+                    return None
+                # Evicted from memory, read back its own log record
+                entry = KeyStore.read_entry(offset)
+                if entry is None or KeyStore.expired(entry, now):
+                    return None
+                cache[hkid] = entry
+                KeyStore.evict(now)
+            elif KeyStore.expired(entry, now):
+                del cache[hkid]
+                return None
+            cache.move_to_end(hkid)
+            return entry[0]
+
+    @staticmethod
+    def expiration(kid: bytes) -> Optional[float]:
+        """Returns the expiry (epoch seconds) of a stored unexpired key, None if unknown or without expiry."""
+        hkid = Utils.construct_hex_string(kid)
+        if KeyStore.get(kid) is None:
+            return None
+        with KeyStore.lock:
+            entry = KeyStore.entries.get(hkid)
+            return entry[1] if entry else None
+
+    @staticmethod
+    def put(kid: bytes, key: bytes, expiration: Optional[str] = None):
+        """Stores the content key of a KID, valid until the license ExpirationDate if any."""
+        hkid = Utils.construct_hex_string(kid)
+        expires = KeyStore.parse_expiration(expiration)
+        now = time.time()
+        with KeyStore.lock:
+            KeyStore.load()
+            if KeyStore.entries.get(hkid) == (key, expires):
+                KeyStore.entries.move_to_end(hkid)
+                return
+            KeyStore.offsets[hkid] = KeyStore.append(hkid, key, expires)
+            KeyStore.entries[hkid] = (key, expires)
+            KeyStore.entries.move_to_end(hkid)
+            KeyStore.evict(now)
+
+    @staticmethod
+    def remove(kid: bytes):
+        """Forgets a KID, recording the removal in the log."""
+        hkid = Utils.construct_hex_string(kid)
+        with KeyStore.lock:
+            KeyStore.load()
+            KeyStore.entries.pop(hkid, None)
+            KeyStore.offsets.pop(hkid, None)
+            KeyStore.append(hkid, None, None)
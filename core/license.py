@@ -1,17 +1,39 @@
+from xml.parsers import expat
+
 from modules.xml_utils import XmlUtils
 from modules.crypto import Crypto
-from modules.padded_printer import PaddedPrinter
+from modules.shell import Shell
 from core.blicense import BLicense
 from core.device import Device
-from io import ByteArrayInputStream
 
 
 class License:
+    LICENSE_RESPONSE = "soap:Envelope.soap:Body.AcquireLicenseResponse.AcquireLicenseResult.Response.LicenseResponse"
+    LICENSE_PATH = LICENSE_RESPONSE + ".Licenses.License"
+    CUSTOM_DATA_PATH = LICENSE_RESPONSE + ".CustomData"
+    CONTENT_KEY = "OuterContainer.KeyMaterialContainer.ContentKey"
+    # Batched challenges get one License element per KID
+    RESPONSE_FIELDS = XmlUtils.StreamExtractor([CUSTOM_DATA_PATH], multi=[LICENSE_PATH])
+
+    CUSTOM_DATA_ROOT = "LicenseResponseCustomData"
+    CUSTOM_DATA_FIELDS = [
+        "UserToken", "BrandGuid", "ClientId", "LicenseType",
+        "BeginDate", "ExpirationDate", "ErrorCode", "TransactionId"
+    ]
+    CUSTOM_DATA = XmlUtils.StreamExtractor([
+        "LicenseResponseCustomData.UserToken", "LicenseResponseCustomData.BrandGuid",
+        "LicenseResponseCustomData.ClientId", "LicenseResponseCustomData.LicenseType",
+        "LicenseResponseCustomData.BeginDate", "LicenseResponseCustomData.ExpirationDate",
+        "LicenseResponseCustomData.ErrorCode", "LicenseResponseCustomData.TransactionId"
+    ])
+
     def __init__(self, xml_data):
         self.data = xml_data
         self.license_data = None
+        self.licenses_data = []
         self.custom_data = None
         self.content_key = None
+        self.integrity_key = None
         self.UserToken = None
         self.BrandGuid = None
         self.ClientId = None
@@ -21,74 +43,108 @@ class License:
         self.ErrorCode = None
         self.TransactionId = None
         self.blicense = None
+        self.blicenses = []
+        self.error = None
 
-        # Parse the main XML data
-        self.root = XmlUtils.parse_xml(ByteArrayInputStream(xml_data))
-        licresp_node = XmlUtils.select_first(
-            self.root,
-            "soap:Envelope.soap:Body.AcquireLicenseResponse.AcquireLicenseResult.Response.LicenseResponse"
-        )
-
-        if licresp_node is not None:
-            license = XmlUtils.get_value(licresp_node, "Licenses.License")
-            custom = XmlUtils.get_value(licresp_node, "CustomData")
+        # Only the license blob and the custom data are needed, no DOM is built
+        try:
+            fields = License.RESPONSE_FIELDS.extract(xml_data)
+        except expat.ExpatError as e:
+            self.error = f"{type(e).__name__}: {e}"
+            Shell.report_error(f"parsing license response: {self.error}")
+            return
+        licenses = fields[License.LICENSE_PATH]
+        custom = fields[License.CUSTOM_DATA_PATH]
 
+        if licenses or custom is not None:
             try:
-                self.license_data = Crypto.base64_decode(license)
-                self.custom_data = Crypto.base64_decode(custom)
+                self.licenses_data = [Crypto.base64_decode(lic) for lic in licenses if lic]
+                self.license_data = self.licenses_data[0] if self.licenses_data else None
+                self.custom_data = Crypto.base64_decode(custom) if custom else None
                 self.parse_customdata()
                 self.parse_license()
             except Exception as e:
-                print(f"Error decoding license data: {e}")
+                self.error = f"{type(e).__name__}: {e}"
+                Shell.report_error(f"decoding license data: {self.error}")
 
     def parse_customdata(self):
         """Parse custom data fields if custom data is available."""
         if self.custom_data is not None:
-            self.custom_root = XmlUtils.parse_xml(ByteArrayInputStream(self.custom_data))
-            licresp_cdata_node = XmlUtils.select_first(self.custom_root, "LicenseResponseCustomData")
-
-            if licresp_cdata_node is not None:
-                self.UserToken = XmlUtils.get_value(self.custom_root, "UserToken")
-                self.BrandGuid = XmlUtils.get_value(self.custom_root, "BrandGuid")
-                self.ClientId = XmlUtils.get_value(self.custom_root, "ClientId")
-                self.LicenseType = XmlUtils.get_value(self.custom_root, "LicenseType")
-                self.BeginDate = XmlUtils.get_value(self.custom_root, "BeginDate")
-                self.ExpirationDate = XmlUtils.get_value(self.custom_root, "ExpirationDate")
-                self.ErrorCode = XmlUtils.get_value(self.custom_root, "ErrorCode")
-                self.TransactionId = XmlUtils.get_value(self.custom_root, "TransactionId")
+            values = License.CUSTOM_DATA.extract(self.custom_data)
+            for name in License.CUSTOM_DATA_FIELDS:
+                setattr(self, name, values[f"{License.CUSTOM_DATA_ROOT}.{name}"])
 
     def parse_license(self):
-        """Initialize BLicense from license data if available."""
-        if self.license_data is not None:
-            self.blicense = BLicense(self.license_data)
+        """Initialize a BLicense per license of the response, blicense being the first one."""
+        self.blicenses = [BLicense(data) for data in self.licenses_data]
+        if self.blicenses:
+            self.blicense = self.blicenses[0]
+
+    def get_blicenses(self):
+        """Yields every XMR license of the response."""
+        yield from self.blicenses
 
     def get_key_id(self):
         """Retrieve the key ID from the license's content key."""
-        ck = self.blicense.get_attr("OuterContainer.KeyMaterialContainer.ContentKey")
+        ck = self.blicense.get_attr(License.CONTENT_KEY)
         if isinstance(ck, BLicense.ContentKey):
-            return ck.key_id()
+            return ck.key_id
+        return None
+
+    def get_security_level(self):
+        """Retrieve the minimum security level required by the license."""
+        sl = self.blicense.get_attr("OuterContainer.GlobalPolicy.SecurityLevel")
+        if isinstance(sl, BLicense.SecurityLevel):
+            return sl.security_level
         return None
 
     def get_encrypted_data(self):
         """Retrieve the encrypted data from the license's content key."""
-        ck = self.blicense.get_attr("OuterContainer.KeyMaterialContainer.ContentKey")
+        ck = self.blicense.get_attr(License.CONTENT_KEY)
         if isinstance(ck, BLicense.ContentKey):
-            return ck.enc_data()
+            return ck.enc_data
         return None
 
+    @staticmethod
+    def decrypt_keys(blicense):
+        """Decrypt the (integrity key, content key) pair of a BLicense, (None, None) without key material."""
+        ck = blicense.get_attr(License.CONTENT_KEY)
+        if not isinstance(ck, BLicense.ContentKey) or not ck.enc_data:
+            return None, None
+        cur_dev = Device.cur_device()
+        plaintext = Crypto.ecc_decrypt(ck.enc_data, cur_dev.enc_key().prv())
+        if plaintext is None:
+            return None, None
+        return plaintext[0x00:0x10], plaintext[0x10:0x20]
+
     def get_content_key(self):
         """Decrypt and return the content key if not already retrieved."""
-        if self.content_key is None:
-            encrypted_data = self.get_encrypted_data()
-            if encrypted_data:
-                cur_dev = Device.cur_device()
-                plaintext = Crypto.ecc_decrypt(encrypted_data, cur_dev.enc_key().prv())
-                self.content_key = plaintext[0x10:0x20]
+        if self.content_key is None and self.blicense is not None:
+            self.integrity_key, self.content_key = License.decrypt_keys(self.blicense)
         return self.content_key
 
+    def get_content_keys(self):
+        """Return KID -> content key for every license of the response with a valid signature."""
+        keys = {}
+        for blicense in self.blicenses:
+            integrity_key, content_key = License.decrypt_keys(blicense)
+            if content_key is not None and blicense.verify_signature(integrity_key):
+                keys[blicense.get_attr(License.CONTENT_KEY).key_id] = content_key
+        return keys
+
+    def verify_signature(self):
+        """Verify the XMR license signature with the integrity key."""
+        if self.blicense is None:
+            return False
+        # A license verified before needs no ECC decryption of its keys
+        if self.blicense.verified_integrity_key() is not None:
+            return True
+        self.get_content_key()
+        return self.blicense.verify_signature(self.integrity_key)
+
     def print(self):
         """Display the license data."""
-        pp = PaddedPrinter(Shell.get_pp())
+        pp = Shell.get_pp()
 
         pp.println("LICENSE")
         pp.pad(2, "")
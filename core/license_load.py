@@ -0,0 +1,130 @@
+import argparse
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import requests
+
+from modules.crypto import Crypto
+from modules.utils import Utils
+from core.device import Device
+from core.license import License
+from core.license_server import LicenseServer
+from core.ls import LS
+from core.mspr import MSPR
+
+
+class LicenseLoad:
+    """Load generator for the whole acquisition path: challenge, license request, parsing and key decryption."""
+
+    PERCENTILES = (50, 90, 99)
+
+    @staticmethod
+    def percentile(values: List[float], pct: float) -> float:
+        """Nearest-rank percentile of sorted values."""
+        if not values:
+            return 0.0
+        idx = min(len(values) - 1, max(0, int(round(pct / 100.0 * len(values) + 0.5)) - 1))
+        return values[idx]
+
+    @staticmethod
+    def wrmheader(kid: bytes, ls_url: str) -> str:
+        return MSPR.BATCH_WRMHEADER(MSPR.KID_ENTRY(Crypto.base64_encode(kid), "AESCTR"), ls_url)
+
+    @staticmethod
+    def acquire(dev, ls_url: str, seed: Optional[bytes]) -> None:
+        """One license acquisition for a random KID, raises on any failure."""
+        kid = os.urandom(0x10)
+        req = MSPR.get_license_request(dev, LicenseLoad.wrmheader(kid, ls_url))
+        resp = LS.send_license_req_once(ls_url, dev, req)
+        keys = License(resp.encode()).get_content_keys()
+        if kid not in keys:
+            raise ValueError("no valid license for the requested KID")
+        if seed is not None and keys[kid] != LicenseServer.content_key(seed, kid):
+            raise ValueError("wrong content key")
+
+    @staticmethod
+    def run(ls_url: str, count: int, concurrency: int, seed: Optional[bytes] = None) -> Dict:
+        """Runs count acquisitions on concurrency threads, returns throughput and latency figures."""
+        dev = Device.cur_device()
+        # Built once up front, the lazy cert chain generation is not thread-safe
+        dev.get_cert_chain()
+
+        latencies = []
+        errors = {}
+        lock = threading.Lock()
+
+        def job(_):
+            start = time.perf_counter()
+            try:
+                LicenseLoad.acquire(dev, ls_url, seed)
+                err = None
+            except Exception as e:
+                err = type(e).__name__
+            elapsed = time.perf_counter() - start
+            with lock:
+                if err is None:
+                    latencies.append(elapsed)
+                else:
+                    errors[err] = errors.get(err, 0) + 1
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(job, range(count)))
+        elapsed = time.perf_counter() - start
+
+        latencies.sort()
+        report = {
+            "requests": count,
+            "ok": len(latencies),
+            "errors": errors,
+            "seconds": round(elapsed, 3),
+            "req_per_sec": round(count / elapsed, 1) if elapsed > 0 else 0.0,
+        }
+        for pct in LicenseLoad.PERCENTILES:
+            report[f"p{pct}_ms"] = round(LicenseLoad.percentile(latencies, pct) * 1000, 1)
+        report["max_ms"] = round(latencies[-1] * 1000, 1) if latencies else 0.0
+        return report
+
+    @staticmethod
+    def main(argv: Optional[List[str]] = None) -> int:
+        parser = argparse.ArgumentParser(description="Load test license acquisition against a license server")
+        parser.add_argument("--url", default=None, help="license server URL (default: start a local stand-in)")
+        parser.add_argument("--requests", type=int, default=200)
+        parser.add_argument("--concurrency", type=int, default=8)
+        parser.add_argument("--seed", default=None, help="stand-in seed, to check the returned content keys")
+        parser.add_argument("--latency-ms", type=float, default=0.0, help="local stand-in delay per request")
+        parser.add_argument("--error-rate", type=float, default=0.0, help="local stand-in fault rate")
+        args = parser.parse_args(argv)
+
+        server = None
+        url = args.url
+        seed = args.seed.encode() if args.seed is not None else None
+        if url is None:
+            seed = seed if seed is not None else b""
+            server = LicenseServer(seed, args.latency_ms / 1000, 0.0, args.error_rate)
+            url = server.start()
+        try:
+            # Challenges must be encrypted to the WMRM key of the server under test
+            wmrm = requests.get(url.rstrip("/") + "/wmrm", timeout=10)
+            if wmrm.ok:
+                MSPR.set_wmrm_pubkey(Utils.parse_hex_string(wmrm.text.strip()))
+            report = LicenseLoad.run(url, args.requests, args.concurrency, seed)
+        finally:
+            if server is not None:
+                server.stop()
+
+        pcts = " ".join(f"p{pct}={report[f'p{pct}_ms']}ms" for pct in LicenseLoad.PERCENTILES)
+        print(
+            f"{report['ok']}/{report['requests']} ok in {report['seconds']}s [{report['req_per_sec']} req/s] "
+            f"{pcts} max={report['max_ms']}ms errors={report['errors']}",
+            file=sys.stderr
+        )
+        return 0 if not report["errors"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(LicenseLoad.main())
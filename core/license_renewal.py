@@ -0,0 +1,181 @@
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+from typing import Dict, List, Optional
+
+from modules.shell import Shell
+from modules.utils import Utils
+from modules.vars import Vars
+from core.asset import Asset
+from core.file_cache import FileCache
+from core.key_store import KeyStore
+
+
+class LicenseRenewal:
+    """
+    Background renewal of stored licenses before they expire.
+
+    Tracked assets sit in a min-heap ordered by renewal time, which is the key
+    expiration minus the lead window minus a random jitter, so that licenses
+    expiring together do not hit the license server at the same instant.
+    """
+
+    # Seconds, overridden by MSPR_RENEW_LEAD / MSPR_RENEW_JITTER
+    LEAD = 3600
+    JITTER = 600
+    # Delay before retrying a failed renewal, doubled on every failure
+    RETRY_DELAY = 60
+
+    def __init__(self, scheduler=None, lead: Optional[int] = None, jitter: Optional[int] = None):
+        self.scheduler = scheduler  # LicenseScheduler, renewals run inline when None
+        self.lead = lead if lead is not None else LicenseRenewal.setting("MSPR_RENEW_LEAD", LicenseRenewal.LEAD)
+        self.jitter = jitter if jitter is not None else LicenseRenewal.setting("MSPR_RENEW_JITTER", LicenseRenewal.JITTER)
+        self.heap = []
+        # Asset id -> its live heap entry [renew_at, seq, asset id, expiry, retry delay], older entries are skipped
+        self.entries = {}
+        self.assets = {}
+        self.seq = itertools.count()
+        self.cond = threading.Condition()
+        self.thread = None
+        self.running = False
+        self.renewed = 0
+        self.failed = 0
+
+    @staticmethod
+    def setting(name: str, default: int) -> int:
+        val = Vars.get_int(name)
+        return val if val >= 0 else default
+
+    def renew_at(self, expires: float) -> float:
+        return expires - self.lead - random.uniform(0, self.jitter)
+
+    def schedule(self, asset_id: str, when: float, expires: float, retry: int = 0):
+        entry = [when, next(self.seq), asset_id, expires, retry]
+        with self.cond:
+            self.entries[asset_id] = entry
+            heapq.heappush(self.heap, entry)
+            if self.heap[0] is entry:
+                self.cond.notify()
+
+    @staticmethod
+    def expiration(asset: Asset) -> Optional[float]:
+        kid = asset.get_kid()
+        return KeyStore.expiration(kid) if kid is not None else None
+
+    def track(self, asset: Asset) -> bool:
+        """Schedules the renewal of an asset whose stored key expires, returns False if there is nothing to renew."""
+        expires = LicenseRenewal.expiration(asset)
+        if expires is None:
+            return False
+        with self.cond:
+            self.assets[asset.id] = asset
+        self.schedule(asset.id, self.renew_at(expires), expires)
+        return True
+
+    def track_all(self, content_dir: Optional[str] = None) -> int:
+        """Tracks every asset of the content directory with a stored expiring key, returns their count."""
+        content_dir = content_dir or FileCache.content_dir()
+        try:
+            names = sorted(os.listdir(content_dir))
+        except OSError:
+            return 0
+        cnt = 0
+        for name in names:
+            if name == FileCache.TMP_DIR or not Utils.file_exists(FileCache.manifest_filename(name)):
+                continue
+            if self.track(Asset(name)):
+                cnt += 1
+        return cnt
+
+    def untrack(self, asset_id: str):
+        with self.cond:
+            self.entries.pop(asset_id, None)
+            self.assets.pop(asset_id, None)
+
+    def pending(self) -> List[tuple]:
+        """Returns (renewal time, asset id) of every tracked asset, soonest first."""
+        with self.cond:
+            return sorted((e[0], e[2]) for e in self.entries.values())
+
+    def next_due(self) -> Optional[list]:
+        """Pops the earliest live entry once it is due, waiting for it; None when stopped."""
+        with self.cond:
+            while self.running:
+                while self.heap and self.entries.get(self.heap[0][2]) is not self.heap[0]:
+                    heapq.heappop(self.heap)
+                if not self.heap:
+                    self.cond.wait()
+                    continue
+                delay = self.heap[0][0] - time.time()
+                if delay <= 0:
+                    entry = heapq.heappop(self.heap)
+                    del self.entries[entry[2]]
+                    return entry
+                self.cond.wait(delay)
+            return None
+
+    def renew(self, entry: list):
+        asset_id, old_expires, retry = entry[2], entry[3], entry[4]
+        with self.cond:
+            asset = self.assets.get(asset_id)
+        if asset is None:
+            return
+        if self.scheduler is not None:
+            # Runs on the scheduler pool, so due renewals of different assets proceed concurrently
+            fut = self.scheduler.submit(asset, renew=True)
+            fut.add_done_callback(lambda f: self.finish(asset, old_expires, retry, f.exception() is None and f.result() is not None))
+            return
+        try:
+            ok = asset.renew_license() is not None
+        except Exception as e:
+            Shell.report_error(f"License renewal of {asset_id} failed: {e}")
+            ok = False
+        self.finish(asset, old_expires, retry, ok)
+
+    def finish(self, asset: Asset, old_expires: float, retry: int, ok: bool):
+        """Schedules the next renewal after a successful one, or a retry with backoff after a failure."""
+        asset_id = asset.id
+        expires = LicenseRenewal.expiration(asset)
+        if ok and expires is not None and expires > old_expires:
+            with self.cond:
+                self.renewed += 1
+            self.schedule(asset_id, self.renew_at(expires), expires)
+            return
+        with self.cond:
+            self.failed += 1
+        retry = retry * 2 if retry else LicenseRenewal.RETRY_DELAY
+        # Keep retrying while the stored key is still valid
+        if expires is not None and time.time() + retry < expires:
+            self.schedule(asset_id, time.time() + retry, expires, retry)
+        else:
+            self.untrack(asset_id)
+
+    def run(self):
+        while True:
+            entry = self.next_due()
+            if entry is None:
+                return
+            self.renew(entry)
+
+    def start(self):
+        with self.cond:
+            if self.running:
+                return
+            self.running = True
+        self.thread = threading.Thread(target=self.run, name="license-renewal", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def stats(self) -> Dict[str, int]:
+        with self.cond:
+            return {"tracked": len(self.entries), "renewed": self.renewed, "failed": self.failed}
@@ -0,0 +1,138 @@
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from modules.utils import Utils
+from core.file_cache import FileCache
+from core.license import License
+
+
+class LicenseScan:
+    """Bulk inspection of license responses stored under the content directory."""
+
+    LICENSE_FILE = "lic_resp.txt"
+    CHUNK_SIZE = 16
+
+    FIELDS = [
+        "asset", "kid", "security_level", "license_type",
+        "begin_date", "expiration_date", "error_code", "transaction_id", "size"
+    ]
+
+    @staticmethod
+    def license_files(content_dir: str) -> Iterator[Tuple[str, str]]:
+        """Yields (asset id, path) for every stored license response."""
+        try:
+            entries = sorted(os.listdir(content_dir))
+        except OSError:
+            return
+        for assetname in entries:
+            if assetname == FileCache.TMP_DIR:
+                continue
+            path = os.path.join(content_dir, assetname, FileCache.DEBUG_DIR, LicenseScan.LICENSE_FILE)
+            if Utils.file_exists(path):
+                yield assetname, path
+
+    @staticmethod
+    def inspect(job: Tuple[str, str]) -> Tuple[Optional[Dict], Optional[Dict]]:
+        """Parses one license response, returns (record, None) or (None, error)."""
+        assetname, path = job
+        try:
+            data = Utils.load_file(path)
+            if not data:
+                return None, {"asset": assetname, "file": path, "error": "empty or unreadable file"}
+
+            lic = License(data)
+            if lic.error is not None:
+                return None, {"asset": assetname, "file": path, "error": lic.error}
+            if lic.blicense is None:
+                return None, {"asset": assetname, "file": path, "error": f"no XMR license (ErrorCode: {lic.ErrorCode})"}
+
+            kid = lic.get_key_id()
+            record = {
+                "asset": assetname,
+                "kid": Utils.construct_hex_string(kid) if kid else None,
+                "security_level": lic.get_security_level(),
+                "license_type": lic.LicenseType,
+                "begin_date": lic.BeginDate,
+                "expiration_date": lic.ExpirationDate,
+                "error_code": lic.ErrorCode,
+                "transaction_id": lic.TransactionId,
+                "size": len(data),
+            }
+            return record, None
+        except Exception as e:
+            return None, {"asset": assetname, "file": path, "error": f"{type(e).__name__}: {e}"}
+
+    @staticmethod
+    def run(content_dir: str, out, err, fmt: str = "jsonl", workers: Optional[int] = None) -> Dict:
+        """Scans all licenses in a process pool, writes records to out and errors to err."""
+        jobs = list(LicenseScan.license_files(content_dir))
+        writer = None
+        if fmt == "csv":
+            writer = csv.DictWriter(out, fieldnames=LicenseScan.FIELDS)
+            writer.writeheader()
+
+        ok_cnt = 0
+        err_cnt = 0
+        total_bytes = 0
+        start = time.perf_counter()
+
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for record, error in pool.map(LicenseScan.inspect, jobs, chunksize=LicenseScan.CHUNK_SIZE):
+                if error is not None:
+                    err.write(json.dumps(error) + "\n")
+                    err_cnt += 1
+                    continue
+                total_bytes += record["size"]
+                if writer is not None:
+                    writer.writerow(record)
+                else:
+                    out.write(json.dumps(record) + "\n")
+                ok_cnt += 1
+
+        elapsed = time.perf_counter() - start
+        return {
+            "files": len(jobs),
+            "parsed": ok_cnt,
+            "errors": err_cnt,
+            "bytes": total_bytes,
+            "seconds": round(elapsed, 3),
+            "files_per_sec": round(len(jobs) / elapsed, 1) if elapsed > 0 else 0.0,
+        }
+
+    @staticmethod
+    def main(argv: Optional[List[str]] = None) -> int:
+        parser = argparse.ArgumentParser(description="Inspect stored PlayReady license responses")
+        parser.add_argument("--content-dir", default=None, help="content directory (default: CONTENT_DIR)")
+        parser.add_argument("--format", choices=["jsonl", "csv"], default="jsonl")
+        parser.add_argument("--output", default=None, help="record output file (default: stdout)")
+        parser.add_argument("--errors", default=None, help="error output file, JSON lines (default: stderr)")
+        parser.add_argument("--workers", type=int, default=None)
+        args = parser.parse_args(argv)
+
+        content_dir = args.content_dir or FileCache.content_dir()
+        out = open(args.output, "w", newline="") if args.output else sys.stdout
+        err = open(args.errors, "w") if args.errors else sys.stderr
+        try:
+            report = LicenseScan.run(content_dir, out, err, args.format, args.workers)
+        finally:
+            if args.output:
+                out.close()
+            if args.errors:
+                err.close()
+
+        print(
+            f"scanned {report['files']} licenses ({report['parsed']} ok, {report['errors']} errors, "
+            f"{report['bytes']} bytes) in {report['seconds']}s [{report['files_per_sec']} files/s]",
+            file=sys.stderr
+        )
+        return 0 if report["errors"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(LicenseScan.main())
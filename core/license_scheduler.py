@@ -0,0 +1,137 @@
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import wait as wait_futures
+from typing import Dict, Iterable, Optional
+
+from modules.vars import Vars
+from core.asset import Asset
+from core.device import Device
+from core.license import License
+from core.key_store import KeyStore
+
+
+class LicenseScheduler:
+    """
+    Concurrent license acquisition for many assets on a thread pool, with a
+    concurrency cap and a request rate limit per license server.
+    """
+
+    WORKERS = 32
+    # Per license server, overridden by MSPR_LS_CONCURRENCY / MSPR_LS_RATE
+    MAX_CONCURRENT = 4
+    MAX_RATE = 10  # requests per second, 0 for no limit
+
+    class Limiter:
+        """Caps in-flight requests to one license server and spaces their starts by 1 / rate."""
+
+        def __init__(self, max_concurrent: int, rate: float):
+            self.sem = threading.BoundedSemaphore(max_concurrent)
+            self.interval = 1.0 / rate if rate > 0 else 0.0
+            self.lock = threading.Lock()
+            self.next_slot = 0.0
+            self.requests = 0
+
+        def __enter__(self):
+            self.sem.acquire()
+            with self.lock:
+                now = time.monotonic()
+                slot = max(now, self.next_slot)
+                self.next_slot = slot + self.interval
+                self.requests += 1
+            if slot > now:
+                time.sleep(slot - now)
+            return self
+
+        def __exit__(self, exc_type, exc, tb):
+            self.sem.release()
+            return False
+
+    @staticmethod
+    def setting(name: str, default: int) -> int:
+        val = Vars.get_int(name)
+        return val if val >= 0 else default
+
+    def __init__(self, workers: Optional[int] = None, max_concurrent: Optional[int] = None, rate: Optional[float] = None):
+        self.max_concurrent = max(max_concurrent or LicenseScheduler.setting("MSPR_LS_CONCURRENCY", LicenseScheduler.MAX_CONCURRENT), 1)
+        self.rate = rate if rate is not None else LicenseScheduler.setting("MSPR_LS_RATE", LicenseScheduler.MAX_RATE)
+        self.pool = ThreadPoolExecutor(max_workers=workers or LicenseScheduler.WORKERS, thread_name_prefix="license")
+        self.limiters = {}
+        self.futures = {}
+        self.lock = threading.Lock()
+        self.prepare_lock = threading.Lock()
+        self.prepared = False
+
+    def limiter(self, ls_url: str) -> "LicenseScheduler.Limiter":
+        with self.lock:
+            lim = self.limiters.get(ls_url)
+            if lim is None:
+                lim = LicenseScheduler.Limiter(self.max_concurrent, self.rate)
+                self.limiters[ls_url] = lim
+            return lim
+
+    def prepare(self):
+        # The device cert chain is generated lazily and is not safe to build from several threads
+        with self.prepare_lock:
+            if not self.prepared:
+                Device.cur_device().get_cert_chain()
+                self.prepared = True
+
+    def acquire(self, asset: Asset) -> Optional[bytes]:
+        """Returns the content key of an asset, only stored-key misses count against the server limits."""
+        kid = asset.get_kid()
+        if kid is not None:
+            content_key = KeyStore.get(kid)
+            if content_key is not None:
+                return content_key
+        ls_url = asset.get_ls_url()
+        if not ls_url:
+            return asset.get_content_key()
+        with self.limiter(ls_url):
+            return asset.get_content_key()
+
+    def renew(self, asset: Asset) -> Optional[License]:
+        """Requests a fresh license for an asset within the limits of its license server."""
+        ls_url = asset.get_ls_url()
+        if not ls_url:
+            return asset.renew_license()
+        with self.limiter(ls_url):
+            return asset.renew_license()
+
+    def submit(self, asset: Asset, renew: bool = False) -> Future:
+        """Schedules an asset, an asset already in flight shares its pending future."""
+        self.prepare()
+        # Checked and set under one lock, two submits of an asset must not both schedule it
+        with self.lock:
+            fut = self.futures.get(asset.id)
+            if fut is not None and not fut.done():
+                return fut
+            fut = self.pool.submit(self.renew if renew else self.acquire, asset)
+            self.futures[asset.id] = fut
+            return fut
+
+    def submit_all(self, assets: Iterable[Asset]) -> Dict[str, Future]:
+        """Schedules many assets, returns asset id -> future of its content key."""
+        return {asset.id: self.submit(asset) for asset in assets}
+
+    @staticmethod
+    def wait_all(futures: Dict[str, Future], timeout: Optional[float] = None) -> Dict:
+        """Waits for scheduled assets, returns counts of keys obtained, failures and unfinished ones."""
+        done, not_done = wait_futures(list(futures.values()), timeout=timeout)
+        ok_cnt = sum(1 for f in done if f.exception() is None and f.result() is not None)
+        return {"ok": ok_cnt, "failed": len(done) - ok_cnt, "pending": len(not_done)}
+
+    def stats(self) -> Dict[str, int]:
+        """Returns license server -> number of requests sent."""
+        with self.lock:
+            return {ls_url: lim.requests for ls_url, lim in self.limiters.items()}
+
+    def shutdown(self, wait: bool = True):
+        self.pool.shutdown(wait=wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.shutdown()
+        return False
@@ -0,0 +1,248 @@
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional, Tuple
+from xml.parsers import expat
+
+from modules.byte_input import ByteInput
+from modules.crypto import Crypto
+from modules.ecc import ECC
+from modules.utils import Utils
+from modules.xml_utils import XmlUtils
+from core.bcert import BCert
+from core.blicense import BLicense
+from core.mspr import MSPR
+from core.wrm_header import WRMHeader
+
+
+class LicenseServer:
+    """
+    Local stand-in for a PlayReady license server, for load tests of the acquisition path.
+
+    It accepts AcquireLicense challenges encrypted to its own WMRM key (served on
+    GET /wmrm, install it with MSPR.set_wmrm_pubkey), checks the challenge
+    signature, and answers with one XMR license per requested KID, wrapped to the
+    encryption key of the challenger's certificate. Content keys are derived from
+    the server seed and the KID, so clients can check them with content_key().
+    """
+
+    CHALLENGE = "soap:Envelope.soap:Body.AcquireLicense.challenge.Challenge"
+    KEY_DATA = CHALLENGE + ".LA.EncryptedData.KeyInfo.EncryptedKey.CipherData.CipherValue"
+    CIPHER_DATA = CHALLENGE + ".LA.EncryptedData.CipherData.CipherValue"
+    SIGNATURE_VALUE = CHALLENGE + ".Signature.SignatureValue"
+    PUBLIC_KEY = CHALLENGE + ".Signature.KeyInfo.KeyValue.ECCKeyValue.PublicKey"
+    CHALLENGE_FIELDS = XmlUtils.StreamExtractor([KEY_DATA, CIPHER_DATA, SIGNATURE_VALUE, PUBLIC_KEY])
+    CERT_CHAIN = "Data.CertificateChains.CertificateChain"
+    CERT_CHAIN_FIELDS = XmlUtils.StreamExtractor([CERT_CHAIN])
+
+    RESPONSE_START = (
+        '<?xml version="1.0" encoding="utf-8"?>'
+        '<soap:Envelope xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/"><soap:Body>'
+        '<AcquireLicenseResponse xmlns="http://schemas.microsoft.com/DRM/2007/03/protocols">'
+        '<AcquireLicenseResult><Response><LicenseResponse xmlns="http://schemas.microsoft.com/DRM/2007/03/protocols/messages">'
+        '<Version>1</Version><Licenses>'
+    )
+    RESPONSE_END = "</LicenseResponse></Response></AcquireLicenseResult></AcquireLicenseResponse></soap:Body></soap:Envelope>"
+    FAULT = (
+        '<?xml version="1.0" encoding="utf-8"?>'
+        '<soap:Envelope xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/"><soap:Body>'
+        "<soap:Fault><faultcode>soap:Server</faultcode><faultstring>{}</faultstring></soap:Fault>"
+        "</soap:Body></soap:Envelope>"
+    )
+    CUSTOM_DATA = (
+        "<LicenseResponseCustomData><LicenseType>{}</LicenseType><BeginDate>{}</BeginDate>"
+        "<ExpirationDate>{}</ExpirationDate><TransactionId>{}</TransactionId></LicenseResponseCustomData>"
+    )
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, fmt, *args):
+            pass
+
+        def reply(self, code: int, body: bytes, ctype: str = "text/xml; charset=utf-8"):
+            self.send_response(code)
+            self.send_header("Content-Type", ctype)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path.rstrip("/") == "/wmrm":
+                self.reply(200, Utils.construct_hex_string(self.server.ls.wmrm_pubkey).encode(), "text/plain")
+            else:
+                self.reply(404, b"")
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            code, resp = self.server.ls.handle(body)
+            self.reply(code, resp)
+
+    def __init__(self, seed: bytes = b"", latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0,
+                 lifetime: int = 86400, security_level: int = MSPR.SL2000):
+        self.seed = seed
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.lifetime = lifetime
+        self.security_level = security_level
+        self.wmrm_key = ECC.ECKey()
+        self.wmrm_pubkey = self.wmrm_key.pub_bytes()
+        self.lock = threading.Lock()
+        self.served = 0
+        self.faults = 0
+        self.httpd = None
+
+    @staticmethod
+    def content_key(seed: bytes, kid: bytes) -> bytes:
+        return Crypto.SHA256(seed + kid)[:0x10]
+
+    @staticmethod
+    def element(data: bytes, tag: bytes) -> Optional[bytes]:
+        """The raw bytes of the first <tag ...>...</tag> element, as signed or hashed by the client."""
+        start = data.find(b"<" + tag)
+        end = data.find(b"</" + tag + b">", start)
+        if start < 0 or end < 0:
+            return None
+        return data[start:end + len(tag) + 3]
+
+    def parse_challenge(self, data: bytes) -> Tuple[List[bytes], bytes]:
+        """Returns (requested KIDs, challenger encryption public key) of a verified challenge."""
+        try:
+            fields = LicenseServer.CHALLENGE_FIELDS.extract(data)
+        except expat.ExpatError as e:
+            raise ValueError(f"malformed challenge: {e}")
+        if None in fields.values():
+            raise ValueError("incomplete challenge")
+
+        la = LicenseServer.element(data, b"LA")
+        signed_info = LicenseServer.element(data, b"SignedInfo")
+        if la is None or signed_info is None:
+            raise ValueError("unsigned challenge")
+        digest = Crypto.base64_encode(Crypto.SHA256(la))
+        if b"<DigestValue>" + digest.encode() + b"</DigestValue>" not in signed_info:
+            raise ValueError("challenge digest mismatch")
+        pubkey = Crypto.base64_decode(fields[LicenseServer.PUBLIC_KEY])
+        if not Crypto.ecdsa_verify(signed_info, Crypto.base64_decode(fields[LicenseServer.SIGNATURE_VALUE]), pubkey):
+            raise ValueError("bad challenge signature")
+
+        header = LicenseServer.element(la, b"WRMHEADER")
+        kids = WRMHeader(header).kids if header else []
+        if not kids:
+            raise ValueError("no KID in content header")
+
+        xml_key = Crypto.ecc_decrypt(Crypto.base64_decode(fields[LicenseServer.KEY_DATA]), self.wmrm_key.prv())
+        cipher = Crypto.base64_decode(fields[LicenseServer.CIPHER_DATA])
+        iv, aes_key = xml_key[:MSPR.AES_KEY_SIZE], xml_key[MSPR.AES_KEY_SIZE:MSPR.AES_KEY_SIZE * 2]
+        plain = Crypto.aes_cbc_decrypt(cipher[MSPR.AES_KEY_SIZE:], iv, aes_key)
+        try:
+            chain_b64 = LicenseServer.CERT_CHAIN_FIELDS.extract(plain)[LicenseServer.CERT_CHAIN]
+        except expat.ExpatError as e:
+            raise ValueError(f"malformed challenge data: {e}")
+        if not chain_b64:
+            raise ValueError("no certificate chain")
+        chain = BCert.CertificateChain(ByteInput("challenge", Crypto.base64_decode(chain_b64)))
+        leaf = chain.get(0)
+        enc_key = leaf.get_pubkey_for_encryption() if leaf else None
+        if not enc_key:
+            raise ValueError("no encryption key in device certificate")
+        return kids, enc_key
+
+    def issue(self, kid: bytes, enc_key: bytes) -> bytes:
+        """One XMR license for a KID, with its keys ECC encrypted to the device."""
+        pubkey = ECC.ECPoint.from_bytes(enc_key)
+        content_key = LicenseServer.content_key(self.seed, kid)
+        while True:
+            # The integrity || content key pair is sent as the x coordinate of a curve point
+            integrity_key = os.urandom(0x10)
+            if ECC.point_from_x(int.from_bytes(integrity_key + content_key, "big")) is not None:
+                break
+        enc_data = Crypto.ecc_encrypt(integrity_key + content_key, pubkey)
+        return BLicense.build(kid, enc_data, integrity_key, self.security_level, os.urandom(0x10))
+
+    def response(self, licenses: List[bytes]) -> bytes:
+        now = time.time()
+        custom = LicenseServer.CUSTOM_DATA.format(
+            "Rental",
+            time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(now)),
+            time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(now + self.lifetime)),
+            Utils.construct_hex_string(os.urandom(8))
+        )
+        return (
+            LicenseServer.RESPONSE_START
+            + "".join(f"<License>{Crypto.base64_encode(lic)}</License>" for lic in licenses)
+            + f"</Licenses><CustomData>{Crypto.base64_encode(custom.encode())}</CustomData>"
+            + LicenseServer.RESPONSE_END
+        ).encode()
+
+    def handle(self, data: bytes) -> Tuple[int, bytes]:
+        """Answers one challenge, returns (HTTP status, SOAP body)."""
+        delay = self.latency + random.uniform(0, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+        if self.error_rate and random.random() < self.error_rate:
+            with self.lock:
+                self.faults += 1
+            return 500, LicenseServer.FAULT.format("injected error").encode()
+        try:
+            kids, enc_key = self.parse_challenge(data)
+            body = self.response([self.issue(kid, enc_key) for kid in kids])
+        except Exception as e:
+            with self.lock:
+                self.faults += 1
+            return 500, LicenseServer.FAULT.format(f"{type(e).__name__}: {e}").encode()
+        with self.lock:
+            self.served += 1
+        return 200, body
+
+    def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Serves from a background thread, returns the license URL."""
+        self.httpd = ThreadingHTTPServer((host, port), LicenseServer.Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.ls = self
+        threading.Thread(target=self.httpd.serve_forever, name="license-server", daemon=True).start()
+        return self.url()
+
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def stop(self):
+        if self.httpd is not None:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
+
+    @staticmethod
+    def main(argv: Optional[List[str]] = None) -> int:
+        parser = argparse.ArgumentParser(description="Local PlayReady license server stand-in")
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8088)
+        parser.add_argument("--seed", default="", help="content key derivation seed")
+        parser.add_argument("--latency-ms", type=float, default=0.0, help="fixed delay per request")
+        parser.add_argument("--jitter-ms", type=float, default=0.0, help="extra uniform random delay per request")
+        parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with a SOAP fault")
+        parser.add_argument("--lifetime", type=int, default=86400, help="license lifetime in seconds")
+        args = parser.parse_args(argv)
+
+        ls = LicenseServer(args.seed.encode(), args.latency_ms / 1000, args.jitter_ms / 1000, args.error_rate, args.lifetime)
+        ls.httpd = ThreadingHTTPServer((args.host, args.port), LicenseServer.Handler)
+        ls.httpd.daemon_threads = True
+        ls.httpd.ls = ls
+        print(f"license server on {ls.url()} (WMRM key at {ls.url()}wmrm)", file=sys.stderr)
+        try:
+            ls.httpd.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            ls.httpd.server_close()
+        print(f"served {ls.served} licenses, {ls.faults} faults", file=sys.stderr)
+        return 0
+
+
+if __name__ == "__main__":
+    sys.exit(LicenseServer.main())
@@ -0,0 +1,119 @@
+import threading
+from typing import Callable, Iterator, List, Optional
+
+from modules.shell import Shell
+from modules.utils import Utils
+from core.cdn import CDN
+from core.file_cache import FileCache
+from core.ism_manifest import ISMManifest
+
+
+class LiveManifest:
+    """Follows a live Smooth Streaming manifest, merging only new chunks into the timeline."""
+
+    MIN_POLL_INTERVAL = 1.0
+    DEFAULT_POLL_INTERVAL = 2.0
+
+    class Fragment:
+        def __init__(self, si: "ISMManifest.StreamIndex", index: int):
+            self.si = si
+            self.index = index
+            self.start = si.timeline.start(index)
+            self.duration = si.timeline.duration(index)
+
+        def __repr__(self):
+            return f"Fragment({self.si.Type()}:{self.si.Name()} #{self.index} t={self.start} d={self.duration})"
+
+    def __init__(self, serial: str, url: str, path: Optional[str] = None, dvr_duration: Optional[int] = None,
+                 dvr_chunks: Optional[int] = None, assetname: Optional[str] = None):
+        """
+        Parameters:
+            serial (str): Device serial used for CDN authorization.
+            url (str): Manifest URL.
+            path (str): Optional file the latest manifest is saved to.
+            dvr_duration (int): Optional DVR window in seconds, older chunks are evicted.
+            dvr_chunks (int): Optional DVR window in chunks per stream.
+            assetname (str): When set, cached fragment files of evicted chunks are removed from FileCache.
+        """
+        self.serial = serial
+        self.url = url
+        self.path = path
+        self.dvr_duration = dvr_duration
+        self.dvr_chunks = dvr_chunks
+        self.assetname = assetname
+        self.ism = None
+        self.etag = None
+        self.last_modified = None
+        self.listeners = []
+        self.stop_event = threading.Event()
+
+    def add_listener(self, listener: Callable[[List["LiveManifest.Fragment"]], None]):
+        self.listeners.append(listener)
+
+    def merge(self, ism: ISMManifest) -> List["LiveManifest.Fragment"]:
+        """Merges a freshly parsed manifest, returns the fragments it made available."""
+        if self.ism is None:
+            self.ism = ism
+            return [LiveManifest.Fragment(si, i) for si in ism.streams for i in range(si.chunk_cnt())]
+
+        streams = {si.key(): si for si in self.ism.streams}
+        fragments = []
+        for new_si in ism.streams:
+            si = streams.get(new_si.key())
+            if si is None:
+                self.ism.streams.append(new_si)
+                fragments.extend(LiveManifest.Fragment(new_si, i) for i in range(new_si.chunk_cnt()))
+                continue
+            first, last = si.merge(new_si)
+            fragments.extend(LiveManifest.Fragment(si, i) for i in range(first, last))
+        return fragments
+
+    def trim(self):
+        """Applies the DVR window to every stream, dropping evicted fragment files when an asset is set."""
+        if self.ism is None or (self.dvr_duration is None and self.dvr_chunks is None):
+            return
+        for si in self.ism.streams:
+            first, last = si.trim(self.dvr_duration, self.dvr_chunks)
+            if self.assetname and last > first:
+                FileCache.remove_fragments(self.assetname, si.Type(), si.Name(), first, last)
+
+    def poll(self) -> List["LiveManifest.Fragment"]:
+        """Fetches the manifest if it changed and returns the newly available fragments."""
+        status, data, self.etag, self.last_modified = CDN.download_if_modified(
+            self.serial, self.url, self.etag, self.last_modified
+        )
+        if data is None:
+            return []
+        if self.path:
+            Utils.save_file(self.path, data)
+
+        fragments = self.merge(ISMManifest(self.path, data))
+        self.trim()
+        fragments = [f for f in fragments if f.index >= f.si.first_chunk()]
+        if fragments:
+            for listener in self.listeners:
+                listener(fragments)
+        return fragments
+
+    def poll_interval(self) -> float:
+        """Polls once per chunk duration of the first stream, the rate at which new fragments appear."""
+        if self.ism:
+            for si in self.ism.streams:
+                timescale = si.timescale_val()
+                if si.chunk_cnt() and timescale > 0:
+                    duration = si.timeline.duration(si.chunk_cnt() - 1) / timescale
+                    return max(duration, LiveManifest.MIN_POLL_INTERVAL)
+        return LiveManifest.DEFAULT_POLL_INTERVAL
+
+    def follow(self) -> Iterator["LiveManifest.Fragment"]:
+        """Yields fragments as they become available until stop() is called."""
+        while not self.stop_event.is_set():
+            try:
+                for fragment in self.poll():
+                    yield fragment
+            except Exception as e:
+                Shell.report_error(f"Live manifest poll failed [{self.url}]: {e}")
+            self.stop_event.wait(self.poll_interval())
+
+    def stop(self):
+        self.stop_event.set()
@@ -0,0 +1,50 @@
+from typing import Optional
+
+from modules.crypto import Crypto
+from modules.snapshot import Snapshot
+from modules.utils import Utils
+from core.ism_manifest import ISMManifest
+
+
+class ManifestCache:
+    """Parsed ISMManifest snapshots stored next to the manifest file."""
+
+    SNAPSHOT_EXT = ".snap"
+
+    @staticmethod
+    def snapshot_filename(path: str) -> str:
+        return path + ManifestCache.SNAPSHOT_EXT
+
+    @staticmethod
+    def load(path: str) -> Optional[ISMManifest]:
+        """
+        Returns the manifest at path, from its snapshot when still valid.
+
+        A snapshot whose recorded size/mtime match the manifest is used without
+        reading the XML. Otherwise the manifest digest is compared with the
+        snapshot key, and only a changed manifest is parsed again.
+        """
+        stamp = Snapshot.stamp(path)
+        if stamp is None:
+            return None
+
+        snappath = ManifestCache.snapshot_filename(path)
+        key = Snapshot.read_key(snappath)
+        entry = Snapshot.read(snappath, key) if key else None
+        if entry is not None and entry[0] == stamp:
+            ism = entry[1]
+            ism.path = path
+            return ism
+
+        data = Utils.load_file(path)
+        if not data:
+            return None
+        digest = Crypto.SHA256(data)
+        if entry is not None and key == digest:
+            ism = entry[1]
+            ism.path = path
+            ism.data = data
+        else:
+            ism = ISMManifest(path, data)
+        Snapshot.write(snappath, digest, (stamp, ism))
+        return ism
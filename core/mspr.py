@@ -1,16 +1,15 @@
 import base64
+import os
 import time
-from Crypto.Cipher import AES
-from Crypto.PublicKey import ECC
-from Crypto.Util.Padding import pad, unpad
+from collections import OrderedDict
+from typing import List, Tuple
 from modules.utils import Utils
 from modules.error import ERR
 from modules.crypto import Crypto
-from modules.padded_printer import PaddedPrinter
+from modules.ecc import ECC
 from modules.shell import Shell
 from modules.vars import Vars
-from core.device import Device
-from core.bcert import BCert
+from core.wrm_header import WRMHeader
 
 class MSPR:
     WMRMECC256PubKey = "C8B6AF16EE941AADAA5389B4AF2C10E356BE42AF175EF3FACE93254E7B0B3D9B982B27B5CB2341326E56AA857DBFD5C634CE2CF9EA74FCA8F2AF5957EFEEA562"
@@ -26,8 +25,16 @@ class MSPR:
     AES_KEY_SIZE = 16
     NONCE_SIZE = 16
 
-    xmlkey = None
-    WMRMpubkey = ECC.construct(curve="P-256", point_x=int(WMRMECC256PubKey[:64], 16), point_y=int(WMRMECC256PubKey[64:], 16))
+    # KIDs packed into the v4.3 WRMHEADER of one batched challenge (MSPR_BATCH_KIDS overrides, 1 disables batching)
+    BATCH_MAX_KIDS = 16
+
+    challenge_template = None
+    WMRMpubkey = ECC.ECPoint(int(WMRMECC256PubKey[:64], 16), int(WMRMECC256PubKey[64:], 16))
+
+    @staticmethod
+    def set_wmrm_pubkey(pubkey):
+        """Replaces the WMRM server key (64 byte X || Y), e.g. to talk to a local license server stand-in."""
+        MSPR.WMRMpubkey = ECC.ECPoint.from_bytes(bytes(pubkey[:ECC.POINT_SIZE]))
 
     @staticmethod
     def fixed_identity():
@@ -43,16 +50,16 @@ class MSPR:
 
     class XmlKey:
         def __init__(self):
-            self.shared_point = ECC.generate(curve="P-256")
-            self.shared_key = self.shared_point.pointQ.x
+            self.shared_point = ECC.ECKey()
+            self.shared_key = self.shared_point.pub().x
             self.aes_iv = None
             self.aes_key = None
 
         def pub(self):
-            return self.shared_point.public_key().export_key(format="DER")
+            return self.shared_point.pub_bytes()
 
         def prv(self):
-            return self.shared_point.d
+            return self.shared_point.prv()
 
         def setup_aes_key(self):
             shared_data = self.shared_key.to_bytes(32, 'big')
@@ -90,11 +97,74 @@ class MSPR:
         def bytes(self):
             return self.aes_iv + self.aes_key
 
+    class ChallengeTemplate:
+        """
+        The static XML of a license challenge rendered and encoded once. Rendering a
+        request only joins the pre-encoded parts with its per-request slot values.
+        """
+
+        SLOT = "\x00"
+
+        @staticmethod
+        def parts(xml):
+            return [part.encode() for part in xml.split(MSPR.ChallengeTemplate.SLOT)]
+
+        @staticmethod
+        def fill(parts, values):
+            out = [parts[0]]
+            for value, part in zip(values, parts[1:]):
+                out.append(value)
+                out.append(part)
+            return b"".join(out)
+
+        def __init__(self):
+            slot = MSPR.ChallengeTemplate.SLOT
+            self.head = (MSPR.XML_HEADER_START() + MSPR.SOAP_BODY_START() + MSPR.ACQUIRE_LICENSE_HEADER_START()).encode()
+            # Slots: content header, nonce, client time, wrapped key, cipher data
+            self.la = MSPR.ChallengeTemplate.parts(MSPR.build_digest_content(slot, slot, slot, slot, slot))
+            # Slot: digest
+            self.signed_info = MSPR.ChallengeTemplate.parts(MSPR.SIGNED_INFO(slot))
+            # Slots: signed info, signature, public key
+            self.tail = MSPR.ChallengeTemplate.parts(
+                MSPR.SIGNATURE_START() + slot + MSPR.SIGNATURE(slot) + MSPR.PUBLIC_KEY(slot) + MSPR.SIGNATURE_END()
+                + MSPR.ACQUIRE_LICENSE_HEADER_END() + MSPR.SOAP_BODY_END() + MSPR.XML_HEADER_END()
+            )
+
+        def la_data(self, wrmheader, nonce, client_time, keydata, cipherdata):
+            """The signed LA element, all values as encoded bytes."""
+            return MSPR.ChallengeTemplate.fill(self.la, (wrmheader, nonce, client_time, keydata, cipherdata))
+
+        def signed_info_data(self, la):
+            return MSPR.ChallengeTemplate.fill(self.signed_info, (base64.b64encode(Crypto.SHA256(la)),))
+
+        def render(self, la, signed_info, signature, pubkey):
+            """The complete challenge around an LA element and its signed info, signature and public key in base64."""
+            return b"".join((self.head, la, MSPR.ChallengeTemplate.fill(self.tail, (signed_info, signature, pubkey))))
+
+    class PreparedChallenge:
+        """The content independent part of a challenge: nonce, wrapped XML key and encrypted device chain."""
+
+        def __init__(self, dev, xmlkey, chain=None):
+            self.created = time.monotonic()
+            self.chain = chain if chain is not None else dev.get_cert_chain()
+            self.nonce = base64.b64encode(os.urandom(MSPR.NONCE_SIZE))
+            self.keydata = MSPR.build_key_data(xmlkey).encode()
+            self.cipherdata = MSPR.build_cipher_data(dev, xmlkey, self.chain).encode()
+
+        def age(self):
+            return time.monotonic() - self.created
+
     @staticmethod
-    def getXmlKey():
-        if MSPR.xmlkey is None:
-            MSPR.xmlkey = MSPR.XmlKey()
-        return MSPR.xmlkey
+    def get_challenge_template():
+        if MSPR.challenge_template is None:
+            MSPR.challenge_template = MSPR.ChallengeTemplate()
+        return MSPR.challenge_template
+
+    @staticmethod
+    def wrmhdr_from_prothdr(prothdr):
+        """Returns the WRMHEADER XML of a base64 PlayReady Object, None if it has none."""
+        hdr = WRMHeader.from_prothdr(prothdr)
+        return hdr.xml() if hdr else None
 
     @staticmethod
     def XML_HEADER_START():
@@ -123,6 +193,39 @@ class MSPR:
             '<Version>1</Version>'
         )
 
+    @staticmethod
+    def LA_HEADER_END():
+        return "</LA>"
+
+    @staticmethod
+    def ACQUIRE_LICENSE_HEADER_END():
+        return "</Challenge></challenge></AcquireLicense>"
+
+    @staticmethod
+    def SOAP_BODY_END():
+        return "</soap:Body>"
+
+    @staticmethod
+    def XML_HEADER_END():
+        return "</soap:Envelope>"
+
+    @staticmethod
+    def BATCH_WRMHEADER(kids, la_url):
+        la = f"<LA_URL>{la_url}</LA_URL>" if la_url else ""
+        return (
+            '<WRMHEADER xmlns="http://schemas.microsoft.com/DRM/2007/03/PlayReadyHeader" version="4.3.0.0">'
+            f"<DATA><PROTECTINFO><KIDS>{kids}</KIDS></PROTECTINFO>{la}</DATA></WRMHEADER>"
+        )
+
+    @staticmethod
+    def KID_ENTRY(kid, algid):
+        alg = f' ALGID="{algid}"' if algid else ""
+        return f'<KID{alg} VALUE="{kid}"></KID>'
+
+    @staticmethod
+    def CERT_CHAIN_DATA(chain):
+        return f"<Data><CertificateChains><CertificateChain>{chain}</CertificateChain></CertificateChains></Data>"
+
     @staticmethod
     def CONTENT_HEADER(wrmheader):
         return f"<ContentHeader>{wrmheader}</ContentHeader>"
@@ -140,8 +243,10 @@ class MSPR:
         )
 
     @staticmethod
-    def LICENSE_NONCE(nonce):
-        return f"<LicenseNonce>{nonce}</LicenseNonce><ClientTime>{int(time.time())}</ClientTime>"
+    def LICENSE_NONCE(nonce, client_time=None):
+        if client_time is None:
+            client_time = int(time.time())
+        return f"<LicenseNonce>{nonce}</LicenseNonce><ClientTime>{client_time}</ClientTime>"
 
     @staticmethod
     def ENCRYPTED_DATA_START():
@@ -167,12 +272,12 @@ class MSPR:
         return f"<CipherData><CipherValue>{cipherdata}</CipherValue></CipherData>"
 
     @staticmethod
-    def build_digest_content(wrmheader, nonce, keydata, cipherdata):
+    def build_digest_content(wrmheader, nonce, keydata, cipherdata, client_time=None):
         return (
             MSPR.LA_HEADER_START()
             + MSPR.CONTENT_HEADER(wrmheader)
             + MSPR.CLIENT_INFO()
-            + MSPR.LICENSE_NONCE(nonce)
+            + MSPR.LICENSE_NONCE(nonce, client_time)
             + MSPR.ENCRYPTED_DATA_START()
             + MSPR.KEY_INFO(keydata)
             + MSPR.CIPHER_DATA(cipherdata)
@@ -180,6 +285,18 @@ class MSPR:
             + MSPR.LA_HEADER_END()
         )
 
+    @staticmethod
+    def SIGNED_INFO(digest):
+        return (
+            '<SignedInfo xmlns="http://www.w3.org/2000/09/xmldsig#">'
+            '<CanonicalizationMethod Algorithm="http://www.w3.org/TR/2001/REC-xml-c14n-20010315"></CanonicalizationMethod>'
+            '<SignatureMethod Algorithm="http://schemas.microsoft.com/DRM/2007/03/protocols#ecdsa-sha256"></SignatureMethod>'
+            '<Reference URI="#SignedData">'
+            '<DigestMethod Algorithm="http://schemas.microsoft.com/DRM/2007/03/protocols#sha256"></DigestMethod>'
+            f'<DigestValue>{digest}</DigestValue>'
+            '</Reference></SignedInfo>'
+        )
+
     @staticmethod
     def SIGNATURE_START():
         return '<Signature xmlns="http://www.w3.org/2000/09/xmldsig#">'
@@ -224,4 +341,101 @@ class MSPR:
         pp.leave()
         return MSPR.SIGNATURE(signature) + MSPR.PUBLIC_KEY(pubkey) + MSPR.SIGNATURE_END()
 
-    # Additional methods and internal methods for handling cryptographic operations...
+    @staticmethod
+    def build_key_data(xmlkey):
+        """The XML AES key (iv + key) ECC encrypted for the WMRM server."""
+        if xmlkey.aes_key is None:
+            xmlkey.setup_aes_key()
+        return Crypto.base64_encode(Crypto.ecc_encrypt(xmlkey.bytes(), MSPR.WMRMpubkey))
+
+    @staticmethod
+    def build_cipher_data(dev, xmlkey, chain=None):
+        """The device certificate chain (or the given one) encrypted with the XML AES key, prefixed with the iv."""
+        if xmlkey.aes_key is None:
+            xmlkey.setup_aes_key()
+        chain = Crypto.base64_encode((chain if chain is not None else dev.get_cert_chain()).body())
+        data = MSPR.CERT_CHAIN_DATA(chain).encode()
+        return Crypto.base64_encode(xmlkey.aes_iv + Crypto.aes_cbc_encrypt(data, xmlkey.aes_iv, xmlkey.aes_key))
+
+    @staticmethod
+    def get_license_challenge(dev, wrmheader, prepared=None):
+        """
+        Builds the signed SOAP AcquireLicense challenge for a WRMHEADER, as bytes.
+
+        With a PreparedChallenge only the content header, client time, digest and
+        signature are computed here.
+        """
+        if prepared is None:
+            # A fresh XML key per challenge, as with the prepared ones
+            prepared = MSPR.PreparedChallenge(dev, MSPR.XmlKey())
+        template = MSPR.get_challenge_template()
+        la = template.la_data(
+            wrmheader.encode(),
+            prepared.nonce,
+            str(int(time.time())).encode(),
+            prepared.keydata,
+            prepared.cipherdata
+        )
+        signed_info = template.signed_info_data(la)
+        cert = dev.get_cert()
+        signature = base64.b64encode(Crypto.ecdsa(signed_info, cert.get_prvkey_for_signing()))
+        pubkey = base64.b64encode(cert.get_pubkey_for_signing())
+        return template.render(la, signed_info, signature, pubkey)
+
+    @staticmethod
+    def get_license_request(dev, wrmheader, prepared=None):
+        """Builds the signed SOAP AcquireLicense challenge for a WRMHEADER."""
+        return MSPR.get_license_challenge(dev, wrmheader, prepared).decode()
+
+    @staticmethod
+    def batch_max_kids():
+        cnt = Vars.get_int("MSPR_BATCH_KIDS")
+        return cnt if cnt > 0 else MSPR.BATCH_MAX_KIDS
+
+    @staticmethod
+    def batch_wrmheader(headers: List[WRMHeader]) -> str:
+        """Builds a v4.3 WRMHEADER listing the KIDs of several headers that share one LA_URL."""
+        kids = OrderedDict()
+        for hdr in headers:
+            for kid, algid in zip(hdr.kids, hdr.kid_algids):
+                kids.setdefault(kid, algid)
+        entries = "".join(MSPR.KID_ENTRY(Crypto.base64_encode(kid), algid) for kid, algid in kids.items())
+        return MSPR.BATCH_WRMHEADER(entries, headers[0].la_url)
+
+    @staticmethod
+    def batches(headers: List[WRMHeader], max_kids: int) -> List[List[WRMHeader]]:
+        """Groups headers by LA_URL, then splits every group into batches of at most max_kids KIDs."""
+        groups = OrderedDict()
+        for hdr in headers:
+            groups.setdefault(hdr.la_url, []).append(hdr)
+        batches = []
+        for group in groups.values():
+            batch = []
+            kid_cnt = 0
+            for hdr in group:
+                cnt = max(len(hdr.kids), 1)
+                if batch and kid_cnt + cnt > max_kids:
+                    batches.append(batch)
+                    batch = []
+                    kid_cnt = 0
+                batch.append(hdr)
+                kid_cnt += cnt
+            if batch:
+                batches.append(batch)
+        return batches
+
+    @staticmethod
+    def batch_license_requests(dev, headers: List[WRMHeader], build=None) -> List[Tuple[List[WRMHeader], str]]:
+        """
+        Builds as few challenges as possible for several headers, one signature each.
+
+        Headers sharing an LA_URL are packed into one v4.3 multi-KID WRMHEADER; a batch
+        of a single header keeps its original WRMHEADER. build(dev, wrmheader) makes
+        each request, get_license_request by default.
+        """
+        build = build or MSPR.get_license_request
+        reqs = []
+        for batch in MSPR.batches(headers, MSPR.batch_max_kids()):
+            wrmheader = batch[0].xml() if len(batch) == 1 else MSPR.batch_wrmheader(batch)
+            reqs.append((batch, build(dev, wrmheader)))
+        return reqs
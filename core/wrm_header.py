@@ -1,10 +1,31 @@
-from io import ByteArrayInputStream
+from collections import OrderedDict
+from typing import Optional
+from xml.parsers import expat
+
+from modules.byte_input import ByteInput
 from modules.crypto import Crypto
-from modules.xml_utils import XmlUtils
 from modules.padded_printer import PaddedPrinter
 from modules.shell import Shell
 
 class WRMHeader:
+    KEYLEN = "WRMHEADER.DATA.PROTECTINFO.KEYLEN"
+    ALGID = "WRMHEADER.DATA.PROTECTINFO.ALGID"
+    KID = "WRMHEADER.DATA.KID"
+    LA_URL = "WRMHEADER.DATA.LA_URL"
+    DS_ID = "WRMHEADER.DATA.DS_ID"
+    # v4.1 carries a single KID element, v4.2+ a KIDS list, both with VALUE/ALGID attributes
+    KID_V41 = "WRMHEADER.DATA.PROTECTINFO.KID"
+    KID_V42 = "WRMHEADER.DATA.PROTECTINFO.KIDS.KID"
+    TEXT_FIELDS = (KEYLEN, ALGID, KID, LA_URL, DS_ID)
+
+    # PlayReady Object record types
+    PRO_RECORD_WRMHEADER = 1
+    PRO_RECORD_LICENSE_STORE = 3
+
+    CACHE_SIZE = 256
+    # SHA256 of the raw PlayReady Object -> parsed WRMHeader
+    headers = OrderedDict()
+
     def __init__(self, data: bytes) -> None:
         """
         Initialize WRMHeader with data, parsing XML to retrieve values.
@@ -13,20 +34,127 @@ class WRMHeader:
         - data (bytes): The WRMHeader XML data in bytes.
         """
         self.data = data
-        self.root = XmlUtils.parse_xml(ByteArrayInputStream(data))
+        self.version = None
+        self.kids = []
+        self.kid_algids = []
 
-        # Initialize fields
-        self.keylen = XmlUtils.get_value(self.root, "WRMHEADER.DATA.PROTECTINFO.KEYLEN") or None
-        self.algid = XmlUtils.get_value(self.root, "WRMHEADER.DATA.PROTECTINFO.ALGID") or None
+        # All fields of every header version are collected in a single expat pass
+        values = dict.fromkeys(WRMHeader.TEXT_FIELDS)
+        stack = []
+        text = []
 
-        kid_val = XmlUtils.get_value(self.root, "WRMHEADER.DATA.KID")
-        self.kid = Crypto.base64_decode(kid_val) if kid_val else None
+        def start_element(name, attrs):
+            path = stack[-1] + "." + name if stack else name
+            stack.append(path)
+            text.clear()
+            if path == "WRMHEADER":
+                self.version = attrs.get("version")
+            elif path == WRMHeader.KID_V41 or path == WRMHeader.KID_V42:
+                value = attrs.get("VALUE")
+                if value:
+                    self.kids.append(Crypto.base64_decode(value))
+                    self.kid_algids.append(attrs.get("ALGID"))
 
-        self.la_url = XmlUtils.get_value(self.root, "WRMHEADER.DATA.LA_URL") or None
+        def end_element(name):
+            path = stack.pop()
+            if path in values and values[path] is None:
+                values[path] = "".join(text).strip()
 
-        ds_id_val = XmlUtils.get_value(self.root, "WRMHEADER.DATA.DS_ID")
+        parser = expat.ParserCreate("UTF-8")
+        parser.buffer_text = True
+        parser.StartElementHandler = start_element
+        parser.EndElementHandler = end_element
+        parser.CharacterDataHandler = text.append
+        try:
+            parser.Parse(data, True)
+        except expat.ExpatError as e:
+            Shell.report_error(f"Cannot parse WRMHEADER: {e}")
+
+        kid_val = values[WRMHeader.KID]
+        if kid_val:
+            self.kids.insert(0, Crypto.base64_decode(kid_val))
+            self.kid_algids.insert(0, values[WRMHeader.ALGID] or None)
+        self.kid = self.kids[0] if self.kids else None
+
+        self.keylen = values[WRMHeader.KEYLEN] or None
+        self.algid = values[WRMHeader.ALGID] or (self.kid_algids[0] if self.kid_algids else None)
+        self.la_url = values[WRMHeader.LA_URL] or None
+
+        ds_id_val = values[WRMHeader.DS_ID]
         self.ds_id = Crypto.base64_decode(ds_id_val) if ds_id_val else None
 
+    def xml(self) -> str:
+        return self.data.decode()
+
+    @staticmethod
+    def pro_records(pro: bytes) -> dict:
+        """
+        Splits a PlayReady Object into its records.
+
+        Parameters:
+        - pro (bytes): The binary PlayReady Object (little endian length, record count, records).
+
+        Returns:
+        - dict: record type -> record value (the last one wins for repeated types).
+        """
+        bi = ByteInput("PRO", pro)
+        bi.le = True
+        total_len = bi.read_4()
+        if total_len > len(pro):
+            raise ValueError(f"Truncated PlayReady Object: {len(pro)} of {total_len} bytes")
+        records = {}
+        for _ in range(bi.read_2()):
+            rtype = bi.read_2()
+            rlen = bi.read_2()
+            if bi.off + rlen > total_len:
+                raise ValueError(f"PlayReady Object record {rtype} overruns the object")
+            records[rtype] = bi.read_n(rlen)
+        return records
+
+    @staticmethod
+    def from_pro(pro: bytes) -> Optional["WRMHeader"]:
+        """
+        Parses the WRMHEADER record of a binary PlayReady Object.
+
+        Headers are memoized by the digest of the raw object, as many assets share the same one.
+
+        Parameters:
+        - pro (bytes): The binary PlayReady Object.
+
+        Returns:
+        - WRMHeader: The parsed header, or None when the object has no WRMHEADER record.
+        """
+        digest = Crypto.SHA256(pro)
+        cache = WRMHeader.headers
+        hdr = cache.get(digest)
+        if hdr is not None:
+            cache.move_to_end(digest)
+            return hdr
+
+        record = WRMHeader.pro_records(pro).get(WRMHeader.PRO_RECORD_WRMHEADER)
+        if record is None:
+            return None
+        xml = record.decode("utf-16-le").lstrip("\ufeff")
+        hdr = WRMHeader(xml.encode())
+
+        cache[digest] = hdr
+        if len(cache) > WRMHeader.CACHE_SIZE:
+            cache.popitem(last=False)
+        return hdr
+
+    @staticmethod
+    def from_prothdr(prothdr: str) -> Optional["WRMHeader"]:
+        """
+        Parses the base64 PlayReady Object of a manifest ProtectionHeader.
+
+        Parameters:
+        - prothdr (str): The base64 encoded PlayReady Object.
+
+        Returns:
+        - WRMHeader: The parsed header, or None when the object has no WRMHEADER record.
+        """
+        return WRMHeader.from_pro(Crypto.base64_decode(prothdr))
+
     def keylen(self) -> str:
         return self.keylen
 
@@ -52,7 +180,12 @@ class WRMHeader:
 
         pp.println(f"keylen: {self.keylen}")
         pp.println(f"algid:  {self.algid}")
-        pp.printhex("kid", self.kid)
+        pp.println(f"version: {self.version}")
+        if len(self.kids) > 1:
+            for i, kid in enumerate(self.kids):
+                pp.printhex(f"kid[{i}]", kid)
+        else:
+            pp.printhex("kid", self.kid)
         pp.println(f"la_url: {self.la_url}")
         pp.printhex("ds_id: ", self.ds_id)
 
@@ -1,8 +1,15 @@
 import base64
 import hashlib
 from Crypto.Cipher import AES
+from Crypto.Hash import CMAC
 from Crypto.Util.Padding import unpad, pad
-from typing import Optional
+from typing import Optional, Union
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.hazmat.primitives.asymmetric.utils import decode_dss_signature, encode_dss_signature
+
+from modules.ecc import ECC
 
 class Crypto:
     @staticmethod
@@ -59,27 +66,59 @@ class Crypto:
         decrypted_data = cipher.decrypt(input_data)
         return unpad(decrypted_data, AES.block_size)
 
+    @staticmethod
+    def aes_omac1(input_data: bytes, key: bytes) -> bytes:
+        mac = CMAC.new(key, ciphermod=AES)
+        mac.update(input_data)
+        return mac.digest()
+
     @staticmethod
     def xor(input1: bytes, input2: bytes) -> bytes:
         if len(input1) != len(input2):
             raise ValueError("Invalid arguments length to xor")
         return bytes(a ^ b for a, b in zip(input1, input2))
 
+    @staticmethod
+    def prv_value(prvkey: Union["ECC.ECKey", int, bytes]) -> int:
+        """The private scalar of an ECKey, a 32 byte key or an int."""
+        if isinstance(prvkey, ECC.ECKey):
+            return prvkey.prv()
+        if isinstance(prvkey, (bytes, bytearray)):
+            return ECC.make_bi(bytes(prvkey))
+        return int(prvkey)
+
     @staticmethod
     def ecdsa(data: bytes, prvkey) -> bytes:
-        digest = Crypto.SHA256(data)
-        # Placeholder for ECC signature generation:
-        # Replace with actual ECC signature creation method, e.g., using an ECC library.
-        signature = prvkey.sign(digest)
-        return signature
+        """ECDSA-SHA256 signature of data as 64 bytes (r || s)."""
+        key = ec.derive_private_key(Crypto.prv_value(prvkey), ec.SECP256R1())
+        r, s = decode_dss_signature(key.sign(data, ec.ECDSA(hashes.SHA256())))
+        return ECC.int_to_bytes(r) + ECC.int_to_bytes(s)
+
+    @staticmethod
+    def ecdsa_verify(data: bytes, signature: bytes, pubkey: bytes) -> bool:
+        if len(signature) != 64 or len(pubkey) != 64:
+            return False
+        try:
+            numbers = ec.EllipticCurvePublicNumbers(
+                int.from_bytes(pubkey[:32], 'big'), int.from_bytes(pubkey[32:], 'big'), ec.SECP256R1()
+            )
+            der = encode_dss_signature(int.from_bytes(signature[:32], 'big'), int.from_bytes(signature[32:], 'big'))
+            numbers.public_key().verify(der, data, ec.ECDSA(hashes.SHA256()))
+            return True
+        except (InvalidSignature, ValueError):
+            return False
 
     @staticmethod
     def ecc_encrypt(input_data: bytes, pubkey) -> Optional[bytes]:
+        """
+        ElGamal encrypts 32 bytes to a public key (ECPoint or 64 bytes X || Y).
+        The data must be the x coordinate of a curve point, None is returned otherwise.
+        """
         if len(input_data) != 32:
             return None
-        # Encrypt using ECC (implementation of ECC required here)
-        plaintext = ECC.make_bi(input_data, 0, 32)
-        points = ECC.encrypt(plaintext, pubkey)
+        if isinstance(pubkey, (bytes, bytearray)):
+            pubkey = ECC.ECPoint.from_bytes(bytes(pubkey))
+        points = ECC.encrypt(input_data, pubkey)
         if points is None:
             return None
         p1 = points[0].bytes()
@@ -90,10 +129,8 @@ class Crypto:
     def ecc_decrypt(input_data: bytes, prvkey) -> Optional[bytes]:
         if len(input_data) != 128:
             return None
-        # Decrypt using ECC (implementation of ECC required here)
         p1_data = input_data[:64]
         p2_data = input_data[64:]
-        p1 = ECC.ECPoint(p1_data)
-        p2 = ECC.ECPoint(p2_data)
-        decrypted_point = ECC.decrypt([p1, p2], prvkey)
-        return decrypted_point.bytes() if decrypted_point else None
+        p1 = ECC.ECPoint.from_bytes(p1_data)
+        p2 = ECC.ECPoint.from_bytes(p2_data)
+        return ECC.decrypt((p1, p2), Crypto.prv_value(prvkey))
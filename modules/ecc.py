@@ -1,11 +1,8 @@
-from cryptography.hazmat.primitives.asymmetric import ec
-from cryptography.hazmat.backends import default_backend
-from cryptography.hazmat.primitives import serialization, hashes
-from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
-import random
-import hashlib
-from typing import Optional, Tuple
-from math import isqrt
+import os
+import secrets
+from typing import Optional, Tuple, Union
+
+from modules.shell import Shell
 
 # Class to handle ECC operations for NIST P-256 Curve
 class ECC:
@@ -17,12 +14,16 @@ class ECC:
     GY = int("4fe342e2fe1a7f9b8ee7eb4a7c0f9e162bce33576b315ececbb6406837bf51f5", 16)
     ORDER = int("ffffffff00000000ffffffffffffffffbce6faada7179e84f3b9cac2fc632551", 16)
     MOD_BITS = 256
-    MOD_FACTOR_256 = 2 ** MOD_BITS % P
+    COORD_SIZE = 0x20
+    POINT_SIZE = 0x40
+
+    # Fixed value returned by random(), for reproducible debug identities (see set_random)
+    fixed_random = None
 
     @staticmethod
-    def int_to_bytes(val: int) -> bytes:
-        """Converts an integer to bytes."""
-        return val.to_bytes((val.bit_length() + 7) // 8, 'big')
+    def int_to_bytes(val: int, size: int = COORD_SIZE) -> bytes:
+        """Converts an integer to big endian bytes of a fixed size."""
+        return val.to_bytes(size, 'big')
 
     @staticmethod
     def bytes_to_int(data: bytes) -> int:
@@ -30,9 +31,34 @@ class ECC:
         return int.from_bytes(data, 'big')
 
     @staticmethod
-    def sha256(data: bytes) -> bytes:
-        """Generates SHA-256 hash."""
-        return hashlib.sha256(data).digest()
+    def make_bi(data: Union[bytes, str], off: int = 0, length: Optional[int] = None) -> int:
+        """Big integer from bytes (or a hex string), optionally from a slice of them."""
+        if isinstance(data, str):
+            data = bytes.fromhex(data)
+        end = off + length if length is not None else len(data)
+        return ECC.bytes_to_int(data[off:end])
+
+    @staticmethod
+    def bi_bytes(val: int) -> bytes:
+        """Minimal big endian encoding of a non negative integer."""
+        return val.to_bytes(max(1, (val.bit_length() + 7) // 8), 'big')
+
+    @staticmethod
+    def set_random(val: Optional[int]):
+        """Makes random() return val (None restores real randomness)."""
+        ECC.fixed_random = val
+
+    @staticmethod
+    def random(bits: int) -> int:
+        if ECC.fixed_random is not None:
+            return ECC.fixed_random & ((1 << bits) - 1)
+        return secrets.randbits(bits)
+
+    @staticmethod
+    def random_scalar() -> int:
+        """A random scalar in [1, ORDER - 1]."""
+        k = ECC.random(ECC.MOD_BITS) % ECC.ORDER
+        return k if k else 1
 
     class ECPoint:
         def __init__(self, x: int, y: int):
@@ -42,6 +68,25 @@ class ECC:
         def __eq__(self, other):
             return isinstance(other, ECC.ECPoint) and self.x == other.x and self.y == other.y
 
+        def __hash__(self):
+            return hash((self.x, self.y))
+
+        def __repr__(self):
+            return f"ECPoint({self.x:#x}, {self.y:#x})"
+
+        @staticmethod
+        def from_bytes(data: bytes) -> 'ECC.ECPoint':
+            """Point from its 64 byte X || Y encoding."""
+            if len(data) != ECC.POINT_SIZE:
+                raise ValueError(f"Invalid EC point length: {len(data)}")
+            return ECC.ECPoint(ECC.bytes_to_int(data[:ECC.COORD_SIZE]), ECC.bytes_to_int(data[ECC.COORD_SIZE:]))
+
+        def bytes(self) -> bytes:
+            return ECC.int_to_bytes(self.x) + ECC.int_to_bytes(self.y)
+
+        def on_curve(self) -> bool:
+            return ECC.on_curve(self)
+
         def add(self, other: 'ECC.ECPoint') -> 'ECC.ECPoint':
             # Implement point addition using P-256 rules
             if self == other:  # Point doubling
@@ -53,18 +98,17 @@ class ECC:
             # Implement point doubling using curve parameters
             return ECC.point_double(self)
 
-        def multiply(self, k: int) -> 'ECC.ECPoint':
-            # Implement scalar multiplication using double-and-add
-            result = ECC.INFINITY
-            addend = self
-
-            while k:
-                if k & 1:
-                    result = result.add(addend)
-                addend = addend.double()
-                k >>= 1
+        def negate(self) -> 'ECC.ECPoint':
+            if self == ECC.INFINITY:
+                return self
+            return ECC.ECPoint(self.x, (-self.y) % ECC.P)
 
-            return result
+        def multiply(self, k: int) -> 'ECC.ECPoint':
+            # Double-and-add in Jacobian coordinates, a single inversion at the end
+            k %= ECC.ORDER
+            if k == 0 or self == ECC.INFINITY:
+                return ECC.INFINITY
+            return ECC.from_jacobian(ECC.jacobian_multiply((self.x, self.y, 1), k))
 
     @staticmethod
     def point_addition(p: 'ECC.ECPoint', q: 'ECC.ECPoint') -> 'ECC.ECPoint':
@@ -75,6 +119,9 @@ class ECC:
             return p
         if p == q:
             return ECC.point_double(p)
+        if p.x == q.x:
+            # q == -p
+            return ECC.INFINITY
 
         # Lambda for addition of different points
         m = ((q.y - p.y) * pow(q.x - p.x, -1, ECC.P)) % ECC.P
@@ -85,7 +132,7 @@ class ECC:
     @staticmethod
     def point_double(p: 'ECC.ECPoint') -> 'ECC.ECPoint':
         """Doubles a point on the elliptic curve."""
-        if p == ECC.INFINITY:
+        if p == ECC.INFINITY or p.y == 0:
             return ECC.INFINITY
 
         # Lambda for point doubling
@@ -94,30 +141,105 @@ class ECC:
         y_r = (m * (p.x - x_r) - p.y) % ECC.P
         return ECC.ECPoint(x_r, y_r)
 
-    # Generator point on the curve
+    # Generator point on the curve; (0, 0) is not on P-256 and stands for the point at infinity
     G = ECPoint(GX, GY)
     INFINITY = ECPoint(0, 0)
 
     @staticmethod
-    def verify_modular_params():
-        """Verifies if modular curve parameters are correct."""
-        a_res = (ECC.A * ECC.MOD_FACTOR_256) % ECC.P
-        b_res = (ECC.B * ECC.MOD_FACTOR_256) % ECC.P
-        if a_res != ECC.A or b_res != ECC.B:
-            raise ValueError("Invalid modular curve parameters")
+    def jacobian_double(p: Tuple[int, int, int]) -> Tuple[int, int, int]:
+        x, y, z = p
+        if y == 0 or z == 0:
+            return 0, 1, 0
+        mod = ECC.P
+        yy = y * y % mod
+        s = 4 * x * yy % mod
+        zz = z * z % mod
+        m = (3 * x * x + ECC.A * zz * zz) % mod
+        x3 = (m * m - 2 * s) % mod
+        y3 = (m * (s - x3) - 8 * yy * yy) % mod
+        z3 = 2 * y * z % mod
+        return x3, y3, z3
+
+    @staticmethod
+    def jacobian_add(p: Tuple[int, int, int], q: Tuple[int, int, int]) -> Tuple[int, int, int]:
+        if p[2] == 0:
+            return q
+        if q[2] == 0:
+            return p
+        mod = ECC.P
+        x1, y1, z1 = p
+        x2, y2, z2 = q
+        z1z1 = z1 * z1 % mod
+        z2z2 = z2 * z2 % mod
+        u1 = x1 * z2z2 % mod
+        u2 = x2 * z1z1 % mod
+        s1 = y1 * z2 * z2z2 % mod
+        s2 = y2 * z1 * z1z1 % mod
+        if u1 == u2:
+            return ECC.jacobian_double(p) if s1 == s2 else (0, 1, 0)
+        h = (u2 - u1) % mod
+        r = (s2 - s1) % mod
+        hh = h * h % mod
+        hhh = h * hh % mod
+        v = u1 * hh % mod
+        x3 = (r * r - hhh - 2 * v) % mod
+        y3 = (r * (v - x3) - s1 * hhh) % mod
+        z3 = h * z1 * z2 % mod
+        return x3, y3, z3
+
+    @staticmethod
+    def jacobian_multiply(p: Tuple[int, int, int], k: int) -> Tuple[int, int, int]:
+        result = (0, 1, 0)
+        for bit in bin(k)[2:]:
+            result = ECC.jacobian_double(result)
+            if bit == "1":
+                result = ECC.jacobian_add(result, p)
+        return result
+
+    @staticmethod
+    def from_jacobian(p: Tuple[int, int, int]) -> 'ECC.ECPoint':
+        x, y, z = p
+        if z == 0:
+            return ECC.INFINITY
+        zinv = pow(z, -1, ECC.P)
+        zinv2 = zinv * zinv % ECC.P
+        return ECC.ECPoint(x * zinv2 % ECC.P, y * zinv2 * zinv % ECC.P)
+
+    @staticmethod
+    def GEN() -> 'ECC.ECPoint':
+        return ECC.G
+
+    @staticmethod
+    def on_curve(p: 'ECC.ECPoint') -> bool:
+        """Checks y^2 = x^3 + ax + b (mod p)."""
+        if not (0 <= p.x < ECC.P and 0 <= p.y < ECC.P):
+            return False
+        return (p.y * p.y - (p.x * p.x * p.x + ECC.A * p.x + ECC.B)) % ECC.P == 0
+
+    @staticmethod
+    def verify_curve_params():
+        """Verifies that the generator lies on the curve."""
+        if not ECC.on_curve(ECC.G):
+            raise ValueError("Invalid curve parameters")
 
     @staticmethod
     def point_from_x(x: int) -> Optional['ECC.ECPoint']:
         """Finds the corresponding point on the curve given x."""
+        if not 0 <= x < ECC.P:
+            return None
         y_squared = (x * x * x + ECC.A * x + ECC.B) % ECC.P
         y = pow(y_squared, (ECC.P + 1) // 4, ECC.P)
         return ECC.ECPoint(x, y) if y_squared == (y * y) % ECC.P else None
 
     @staticmethod
-    def encrypt(plaintext: bytes, pubkey: 'ECC.ECPoint') -> Tuple['ECC.ECPoint', 'ECC.ECPoint']:
-        k = random.randint(1, ECC.ORDER - 1)
+    def encrypt(plaintext: bytes, pubkey: 'ECC.ECPoint') -> Optional[Tuple['ECC.ECPoint', 'ECC.ECPoint']]:
+        """ElGamal encryption of a 32 byte value that is the x coordinate of a curve point, None otherwise."""
+        msg_point = ECC.point_from_x(ECC.bytes_to_int(plaintext))
+        if msg_point is None:
+            return None
+        k = ECC.random_scalar()
         point1 = ECC.G.multiply(k)
-        point2 = pubkey.multiply(k).add(ECC.point_from_x(ECC.bytes_to_int(plaintext)))
+        point2 = pubkey.multiply(k).add(msg_point)
         return point1, point2
 
     @staticmethod
@@ -127,6 +249,58 @@ class ECC:
         plaintext_point = point2.add(neg_point1)
         return ECC.int_to_bytes(plaintext_point.x)
 
-# ECC Class instantiation with curve checks
-ecc = ECC()
-ecc.verify_modular_params()
+    class ECKey:
+        """A P-256 key pair, the private key being a 32 byte big endian scalar."""
+
+        def __init__(self, prv: Optional[bytes] = None):
+            self.prv_val = ECC.make_bi(prv) if prv is not None else ECC.random_scalar()
+            if not 0 < self.prv_val < ECC.ORDER:
+                raise ValueError("Invalid ECC private key")
+            self.pub_point = None
+
+        @staticmethod
+        def from_file(path: str) -> Optional['ECC.ECKey']:
+            """Loads a raw private key file (32 bytes), None if missing or too short."""
+            try:
+                with open(path, 'rb') as f:
+                    data = f.read()
+            except OSError:
+                return None
+            if len(data) < ECC.COORD_SIZE:
+                return None
+            return ECC.ECKey(data[:ECC.COORD_SIZE])
+
+        def save(self, path: str) -> bool:
+            try:
+                os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+                with open(path, 'wb') as f:
+                    f.write(self.prv_bytes())
+                return True
+            except OSError:
+                return False
+
+        def prv(self) -> int:
+            return self.prv_val
+
+        def prv_bytes(self) -> bytes:
+            return ECC.int_to_bytes(self.prv_val)
+
+        def pub(self) -> 'ECC.ECPoint':
+            if self.pub_point is None:
+                self.pub_point = ECC.G.multiply(self.prv_val)
+            return self.pub_point
+
+        def pub_bytes(self) -> bytes:
+            return self.pub().bytes()
+
+        def print(self, label: str):
+            pp = Shell.get_pp()
+            pp.println(label)
+            pp.pad(2, "")
+            pp.printhex("prv", self.prv_bytes())
+            pp.printhex("pub", self.pub_bytes())
+            pp.leave()
+
+
+# Curve sanity check at import
+ECC.verify_curve_params()
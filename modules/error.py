@@ -11,3 +11,7 @@ class ERROR:
         """
         print(f"ERROR: {s}")
         sys.exit(1)
+
+
+# Short alias used across core/
+ERR = ERROR
@@ -30,7 +30,7 @@ class PaddedPrinter:
 
     def __init__(self):
         self.lvl = 0
-        self.pad = 0
+        self._pad = 0
 
     def pad(self, cnt: int, header: str = "", prefix: str = ""):
         """
@@ -41,13 +41,13 @@ class PaddedPrinter:
             header (str): Optional header text to print.
             prefix (str): Optional prefix to add to the next printed lines.
         """
-        self.pad += cnt
-        level = self.PrintLevel(self.pad, header, prefix)
+        self._pad += cnt
+        level = self.PrintLevel(self._pad, header, prefix)
         self.levels.append(level)
         self.lvl += 1
 
         if header:
-            line = Utils.pad(self.pad) + header
+            line = Utils.pad(self._pad) + header
             Utils.outputln(line)
 
     def leave(self) -> 'PaddedPrinter.PrintLevel':
@@ -59,9 +59,9 @@ class PaddedPrinter:
         """
         level = self.levels.pop()
         if self.levels:
-            self.pad = self.levels[-1].pad()
+            self._pad = self.levels[-1].pad()
         else:
-            self.pad = 0
+            self._pad = 0
         self.lvl -= 1
         return level
 
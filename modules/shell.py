@@ -33,5 +33,7 @@ class Shell:
     @classmethod
     def get_pp(cls):
         if cls.pp is None:
+            # Imported here, PaddedPrinter prints through Utils which prints through Shell
+            from modules.padded_printer import PaddedPrinter
             cls.pp = PaddedPrinter.getInstance()
         return cls.pp
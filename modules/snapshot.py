@@ -0,0 +1,148 @@
+import dis
+import importlib
+import io
+import os
+import pickle
+from typing import Any, Dict, List, Optional
+
+from modules.crypto import Crypto
+from modules.utils import Utils
+
+
+class Snapshot:
+    """
+    Binary snapshots of parsed objects, bound to a key derived from their source
+    and to the field layout of the classes they hold.
+
+    The classes met while pickling are recorded with the snapshot. A snapshot is
+    only loaded when the current layout of every one of them (slots and fields
+    assigned in __init__, through the MRO) still matches, so changing a
+    snapshotted class invalidates the snapshots written before.
+    """
+
+    MAGIC = b"PRSN"
+    # Bumped when the snapshot file format itself changes
+    VERSION = 4
+    KEY_SIZE = 0x20
+    HDR_SIZE = 4 + 4 + KEY_SIZE
+    LAYOUT_HDR_SIZE = 0x20 + 4
+
+    # Class -> layout description
+    layouts = {}
+
+    class Pickler(pickle.Pickler):
+        """Pickler recording the classes of the pickled instances."""
+
+        def __init__(self, f):
+            super().__init__(f, pickle.HIGHEST_PROTOCOL)
+            self.classes = {}
+
+        def reducer_override(self, obj):
+            cls = type(obj)
+            if cls.__module__ != "builtins" and not isinstance(obj, type):
+                self.classes.setdefault(f"{cls.__module__}:{cls.__qualname__}", cls)
+            return NotImplemented
+
+    @staticmethod
+    def class_layout(cls: type) -> str:
+        """Qualified name and sorted instance fields (slots and attributes set in __init__) of a class."""
+        layout = Snapshot.layouts.get(cls)
+        if layout is None:
+            fields = set()
+            for c in cls.__mro__[:-1]:
+                slots = c.__dict__.get("__slots__", ())
+                fields.update([slots] if isinstance(slots, str) else slots)
+                code = getattr(c.__dict__.get("__init__"), "__code__", None)
+                if code is not None:
+                    fields.update(ins.argval for ins in dis.get_instructions(code) if ins.opname == "STORE_ATTR")
+            layout = f"{cls.__module__}:{cls.__qualname__}({','.join(sorted(fields))})"
+            Snapshot.layouts[cls] = layout
+        return layout
+
+    @staticmethod
+    def layout_digest(classes: Dict[str, type]) -> bytes:
+        return Crypto.SHA256("\n".join(Snapshot.class_layout(classes[name]) for name in sorted(classes)).encode())
+
+    @staticmethod
+    def resolve(names: List[str]) -> Optional[Dict[str, type]]:
+        """Looks up recorded "module:qualname" class names, None if one no longer exists."""
+        classes = {}
+        try:
+            for name in names:
+                module, qualname = name.split(":")
+                obj = importlib.import_module(module)
+                for part in qualname.split("."):
+                    obj = getattr(obj, part)
+                classes[name] = obj
+        except (ImportError, AttributeError, ValueError):
+            return None
+        return classes
+
+    @staticmethod
+    def stamp(path: str) -> Optional[tuple]:
+        """(size, mtime) of a source file, None if missing."""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return st.st_size, st.st_mtime_ns
+
+    @staticmethod
+    def read_key(path: str) -> Optional[bytes]:
+        """Returns the key a snapshot was stored under, without loading it."""
+        try:
+            with open(path, 'rb') as f:
+                hdr = f.read(Snapshot.HDR_SIZE)
+        except OSError:
+            return None
+        if len(hdr) < Snapshot.HDR_SIZE or hdr[:4] != Snapshot.MAGIC:
+            return None
+        return hdr[8:]
+
+    @staticmethod
+    def read(path: str, key: bytes) -> Optional[Any]:
+        """Returns the object stored in path, or None if missing, stale (key or class layout) or corrupt."""
+        data = Utils.load_file(path)
+        if data is None or len(data) < Snapshot.HDR_SIZE + Snapshot.LAYOUT_HDR_SIZE:
+            return None
+        if data[:4] != Snapshot.MAGIC or int.from_bytes(data[4:8], "big") != Snapshot.VERSION:
+            return None
+        if data[8:Snapshot.HDR_SIZE] != key:
+            return None
+        pos = Snapshot.HDR_SIZE
+        digest = data[pos:pos + 0x20]
+        names_len = int.from_bytes(data[pos + 0x20:pos + Snapshot.LAYOUT_HDR_SIZE], "big")
+        pos += Snapshot.LAYOUT_HDR_SIZE
+        try:
+            names = data[pos:pos + names_len].decode().split("\n") if names_len else []
+        except UnicodeDecodeError:
+            return None
+        classes = Snapshot.resolve(names)
+        if classes is None or Snapshot.layout_digest(classes) != digest:
+            return None
+        try:
+            return pickle.loads(data[pos + names_len:])
+        except Exception:
+            return None
+
+    @staticmethod
+    def write(path: str, key: bytes, obj: Any) -> bool:
+        """Stores obj under key, replacing the file atomically so concurrent readers never see a partial write."""
+        if len(key) != Snapshot.KEY_SIZE:
+            raise ValueError("Invalid snapshot key length")
+        out = io.BytesIO()
+        pickler = Snapshot.Pickler(out)
+        pickler.dump(obj)
+        names = "\n".join(sorted(pickler.classes)).encode()
+        data = (
+            Snapshot.MAGIC + Snapshot.VERSION.to_bytes(4, "big") + key
+            + Snapshot.layout_digest(pickler.classes) + len(names).to_bytes(4, "big") + names + out.getvalue()
+        )
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        if not Utils.save_file(tmp_path, data):
+            return False
+        try:
+            os.replace(tmp_path, path)
+            return True
+        except OSError:
+            return False
@@ -4,6 +4,8 @@ import binascii
 import datetime
 from typing import List, Optional
 
+from modules.shell import Shell
+
 class Utils:
     LINESIZE = 16
     allowed_chars = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ01234567890!@#$%^&*()_+-={}[]|:\";',.<>?/"
@@ -12,21 +14,21 @@ class Utils:
     def parse_hex_value(s: str) -> int:
         try:
             return int(s, 16)
-        except ValueError:
+        except (TypeError, ValueError):
             return -1
 
     @staticmethod
     def int_value(s: str) -> int:
         try:
             return int(s)
-        except ValueError:
+        except (TypeError, ValueError):
             return -1
 
     @staticmethod
     def long_value(s: str) -> int:
         try:
             return int(s)
-        except ValueError:
+        except (TypeError, ValueError):
             return -1
 
     @staticmethod
@@ -68,7 +70,7 @@ class Utils:
 
     @staticmethod
     def outputln(line: str):
-        Shell.println(line)  # Assuming Shell class is defined elsewhere
+        Shell.println(line)
 
     @staticmethod
     def output_buf(s: Optional[str], data: bytes):
@@ -5,6 +5,7 @@ class Vars:
     VAR_STR = 0x02
     MAXVARNAME = 20
     UNKNOWN_VAL = -1
+    UNKNOWN_STR = "<not set>"
 
     class Proto:
         def __init__(self, name: str, var_type: int):
@@ -99,7 +100,7 @@ class Vars:
             var = cls.get_var(name_or_var)
         else:
             var = name_or_var
-        return str(var.val()) if var and isinstance(var.val(), str) else "<not set>"
+        return str(var.val()) if var and isinstance(var.val(), str) else Vars.UNKNOWN_STR
 
     @classmethod
     def print_vars(cls):
@@ -1,7 +1,14 @@
 import requests
+import threading
 import time
+from collections import deque
+from contextlib import contextmanager
 from typing import List, Dict, Optional, Tuple, Union
 from io import BytesIO
+from urllib.parse import urlsplit
+
+from modules.shell import Shell
+from modules.vars import Vars
 
 class MessageHeader:
     def __init__(self):
@@ -21,6 +28,148 @@ class Web:
     USER_AGENT = "Mozilla/5.0 (ADB)"
     BUFSIZE = 0x100000  # Buffer size for downloads
     TIMEOUT_VAL = 2  # Timeout in seconds
+    RETRIES = 5  # Attempts of a retried request, overridden by MSPR_WEB_RETRIES
+
+    class SessionPool:
+        """
+        Process-wide keep-alive sessions per origin (scheme://host:port).
+
+        A session serves one request at a time and is returned to its origin's
+        pool afterwards, so its connection (and TLS session) is reused by the
+        next request. At most POOL_SIZE idle sessions are kept per origin and
+        sessions unused for IDLE_TIMEOUT seconds are closed.
+        """
+
+        # Overridden by MSPR_WEB_POOL_SIZE / MSPR_WEB_POOL_IDLE (seconds)
+        POOL_SIZE = 8
+        IDLE_TIMEOUT = 60
+
+        # Origin -> deque of (session, last use), most recently used last
+        idle = {}
+        # Origin -> counters
+        counters = {}
+        lock = threading.Lock()
+
+        @staticmethod
+        def setting(name: str, default: int) -> int:
+            val = Vars.get_int(name)
+            return val if val > 0 else default
+
+        @staticmethod
+        def pool_size() -> int:
+            return Web.SessionPool.setting("MSPR_WEB_POOL_SIZE", Web.SessionPool.POOL_SIZE)
+
+        @staticmethod
+        def idle_timeout() -> int:
+            return Web.SessionPool.setting("MSPR_WEB_POOL_IDLE", Web.SessionPool.IDLE_TIMEOUT)
+
+        @staticmethod
+        def origin(url: str) -> str:
+            parts = urlsplit(url)
+            return f"{parts.scheme}://{parts.netloc}".lower()
+
+        @staticmethod
+        def connections(session: requests.Session) -> int:
+            """Number of connections opened so far by a session."""
+            count = 0
+            for adapter in session.adapters.values():
+                pools = adapter.poolmanager.pools
+                for key in pools.keys():
+                    pool = pools.get(key)
+                    if pool is not None:
+                        count += pool.num_connections
+            return count
+
+        @staticmethod
+        def stats_for(origin: str) -> Dict[str, int]:
+            cnt = Web.SessionPool.counters.get(origin)
+            if cnt is None:
+                cnt = {"requests": 0, "reused": 0, "created": 0, "evicted": 0, "connections": 0}
+                Web.SessionPool.counters[origin] = cnt
+            return cnt
+
+        @staticmethod
+        def evict(now: float) -> List[requests.Session]:
+            """Removes the idle sessions past the idle timeout, returns them to be closed. Call with the lock held."""
+            expired = []
+            timeout = Web.SessionPool.idle_timeout()
+            for origin, sessions in Web.SessionPool.idle.items():
+                while sessions and now - sessions[0][1] > timeout:
+                    expired.append(sessions.popleft()[0])
+                    Web.SessionPool.stats_for(origin)["evicted"] += 1
+            return expired
+
+        @staticmethod
+        def acquire(origin: str) -> Tuple[requests.Session, int]:
+            """Returns an idle session of the origin (or a new one) and its opened connection count."""
+            with Web.SessionPool.lock:
+                expired = Web.SessionPool.evict(time.monotonic())
+                cnt = Web.SessionPool.stats_for(origin)
+                cnt["requests"] += 1
+                sessions = Web.SessionPool.idle.get(origin)
+                session = sessions.pop()[0] if sessions else None
+                if session is not None:
+                    cnt["reused"] += 1
+                else:
+                    cnt["created"] += 1
+            for old in expired:
+                old.close()
+            if session is None:
+                session = requests.Session()
+            return session, Web.SessionPool.connections(session)
+
+        @staticmethod
+        def release(origin: str, session: requests.Session, opened: int, reusable: bool):
+            # Cookies must not leak from one request to the next
+            session.cookies.clear()
+            opened = Web.SessionPool.connections(session) - opened
+            with Web.SessionPool.lock:
+                cnt = Web.SessionPool.stats_for(origin)
+                cnt["connections"] += opened
+                sessions = Web.SessionPool.idle.setdefault(origin, deque())
+                if reusable and len(sessions) < Web.SessionPool.pool_size():
+                    sessions.append((session, time.monotonic()))
+                    return
+                cnt["evicted"] += 1
+            session.close()
+
+        @staticmethod
+        @contextmanager
+        def session(url: str):
+            """Checks out a pooled session for a request to url. Sessions of failed requests are closed, not reused."""
+            origin = Web.SessionPool.origin(url)
+            session, opened = Web.SessionPool.acquire(origin)
+            reusable = False
+            try:
+                yield session
+                reusable = True
+            finally:
+                Web.SessionPool.release(origin, session, opened, reusable)
+
+        @staticmethod
+        def clear():
+            """Closes every idle session."""
+            with Web.SessionPool.lock:
+                sessions = [s for pool in Web.SessionPool.idle.values() for s, _ in pool]
+                Web.SessionPool.idle.clear()
+            for session in sessions:
+                session.close()
+
+        @staticmethod
+        def stats() -> Dict[str, Dict[str, float]]:
+            """Per origin request/reuse/connection counters, with the session and connection reuse rates."""
+            with Web.SessionPool.lock:
+                result = {}
+                for origin, cnt in Web.SessionPool.counters.items():
+                    entry = dict(cnt)
+                    entry["idle"] = len(Web.SessionPool.idle.get(origin, ()))
+                    entry["reuse_rate"] = round(cnt["reused"] / cnt["requests"], 3) if cnt["requests"] else 0.0
+                    # Requests served without opening a new connection (no TCP / TLS handshake)
+                    entry["conn_reuse_rate"] = (
+                        round(1 - min(cnt["connections"], cnt["requests"]) / cnt["requests"], 3) if cnt["requests"] else 0.0
+                    )
+                    result[origin] = entry
+                return result
 
     @staticmethod
     def sleep(time_seconds: int):
@@ -28,52 +177,66 @@ class Web:
         time.sleep(time_seconds)
 
     @staticmethod
-    def set_headers(session: requests.Session, headers: List[Tuple[str, str]]) -> MessageHeader:
-        """Sets the headers in a session and returns a MessageHeader object."""
+    def retries() -> int:
+        return Web.SessionPool.setting("MSPR_WEB_RETRIES", Web.RETRIES)
+
+    @staticmethod
+    def with_retries(url: str, request, *args):
+        """Calls request(url, *args) up to retries() times one second apart, the last error is reported and raised."""
+        attempts = Web.retries()
+        for attempt in range(1, attempts + 1):
+            try:
+                return request(url, *args)
+            except Exception as e:
+                last_error = e
+                if attempt < attempts:
+                    Web.sleep(1)
+        Shell.report_error(f"{url}: giving up after {attempts} attempts: {type(last_error).__name__}: {last_error}")
+        raise last_error
+
+    @staticmethod
+    def request_headers(headers: List[Tuple[str, str]]) -> MessageHeader:
+        """Returns the MessageHeader of a request, pooled sessions keep no per-request headers."""
         msg_header = MessageHeader()
         for key, value in headers:
             msg_header.add(key, value)
         msg_header.add("User-Agent", Web.USER_AGENT)
+        return msg_header
+
+    @staticmethod
+    def set_headers(session: requests.Session, headers: List[Tuple[str, str]]) -> MessageHeader:
+        """Sets the headers in a session and returns a MessageHeader object."""
+        msg_header = Web.request_headers(headers)
         session.headers.update(msg_header.get())
         return msg_header
 
     @staticmethod
     def https_post(url: str, data: str, headers: List[Tuple[str, str]]) -> str:
         """Performs an HTTPS POST request with retries."""
-        while True:
-            try:
-                return Web.https_post_internal(url, data, headers)
-            except Exception as e:
-                Web.sleep(1)
+        return Web.with_retries(url, Web.https_post_internal, data, headers)
 
     @staticmethod
     def https_post_internal(url: str, data: str, headers: List[Tuple[str, str]]) -> str:
         """Internal method for performing an HTTPS POST request."""
-        with requests.Session() as session:
-            Web.set_headers(session, headers)
-            session.headers.update({
-                "Content-Length": str(len(data)),
-                "Accept-Language": "en, *"
-            })
-            response = session.post(url, data=data, timeout=Web.TIMEOUT_VAL)
+        msg_header = Web.request_headers(headers)
+        msg_header.add("Content-Length", str(len(data)))
+        msg_header.add("Accept-Language", "en, *")
+        with Web.SessionPool.session(url) as session:
+            response = session.post(url, data=data, headers=msg_header.get(), timeout=Web.TIMEOUT_VAL)
             response.raise_for_status()
             return response.text
 
     @staticmethod
     def http_get(url: str, headers: List[Tuple[str, str]], output: Union[str, BytesIO]) -> int:
         """Performs an HTTP GET request, writes the response to a file or stream, and returns the byte count."""
-        while True:
-            try:
-                return Web.http_get_internal(url, headers, output)
-            except Exception as e:
-                Web.sleep(1)
+        return Web.with_retries(url, Web.http_get_internal, headers, output)
 
     @staticmethod
     def http_get_internal(url: str, headers: List[Tuple[str, str]], output: Union[str, BytesIO]) -> int:
         """Internal method for performing an HTTP GET request and writing to an output stream."""
-        with requests.Session() as session:
-            Web.set_headers(session, headers)
-            with session.get(url, stream=True, timeout=Web.TIMEOUT_VAL) as response:
+        with Web.SessionPool.session(url) as session:
+            with session.get(url, stream=True, headers=Web.request_headers(headers).get(),
+                             timeout=Web.TIMEOUT_VAL) as response:
                 response.raise_for_status()
                 count = 0
                 if isinstance(output, str):
@@ -87,6 +250,29 @@ class Web:
                         count += len(chunk)
                 return count
 
+    @staticmethod
+    def http_get_conditional(url: str, headers: List[Tuple[str, str]], etag: Optional[str] = None,
+                             last_modified: Optional[str] = None) -> Tuple[int, Optional[bytes], Optional[str], Optional[str]]:
+        """Performs a conditional HTTP GET, returns (status, body or None if not modified, etag, last_modified)."""
+        return Web.with_retries(url, Web.http_get_conditional_internal, headers, etag, last_modified)
+
+    @staticmethod
+    def http_get_conditional_internal(url: str, headers: List[Tuple[str, str]], etag: Optional[str],
+                                      last_modified: Optional[str]) -> Tuple[int, Optional[bytes], Optional[str], Optional[str]]:
+        """Internal method for performing a conditional HTTP GET."""
+        msg_header = Web.request_headers(headers)
+        if etag:
+            msg_header.add("If-None-Match", etag)
+        if last_modified:
+            msg_header.add("If-Modified-Since", last_modified)
+        with Web.SessionPool.session(url) as session:
+            response = session.get(url, headers=msg_header.get(), timeout=Web.TIMEOUT_VAL)
+            if response.status_code == 304:
+                return 304, None, etag, last_modified
+            response.raise_for_status()
+            return (response.status_code, response.content,
+                    response.headers.get("ETag", etag), response.headers.get("Last-Modified", last_modified))
+
     @staticmethod
     def http_get_to_file(url: str, headers: List[Tuple[str, str]], file_path: str) -> int:
         """Fetches a URL's contents and saves it to a file."""
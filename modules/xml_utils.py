@@ -1,8 +1,109 @@
 from xml.dom import minidom
-from typing import List, Optional, Type
+from xml.parsers import expat
+from typing import Dict, Iterable, List, Optional, Type
 import inspect
 
 class XmlUtils:
+    # Class -> tuple of (field name, XML attribute name) for its att* fields
+    binders = {}
+    # Path -> compiled Selector
+    selectors = {}
+
+    class Selector:
+        """A dotted tag path tokenized once and matched by walking child lists with early exit."""
+
+        def __init__(self, path: str):
+            self.path = path
+            self.tags = tuple(XmlUtils.tokenize_path(path))
+
+        @staticmethod
+        def children(node: minidom.Node, tag: str) -> Iterable[minidom.Node]:
+            if isinstance(node, minidom.Document):
+                # Keeps the document-wide search semantics of get_elements, with a fast path for the root
+                root = node.documentElement
+                if root is not None and root.nodeName == tag:
+                    return (root,)
+                return node.getElementsByTagName(tag)
+            return (child for child in node.childNodes if child.nodeName == tag)
+
+        def select(self, node: minidom.Node) -> List[minidom.Node]:
+            for tag in self.tags[:-1]:
+                node = next(iter(XmlUtils.Selector.children(node, tag)), None)
+                if node is None:
+                    return []
+            return list(XmlUtils.Selector.children(node, self.tags[-1]))
+
+        def select_first(self, node: minidom.Node) -> Optional[minidom.Node]:
+            for tag in self.tags:
+                node = next(iter(XmlUtils.Selector.children(node, tag)), None)
+                if node is None:
+                    return None
+            return node
+
+        def value(self, node: minidom.Node) -> Optional[str]:
+            found = self.select_first(node)
+            return XmlUtils.get_value(found) if found else None
+
+    class StreamExtractor:
+        """
+        Expat based extraction of the text of a few dotted paths (rooted at the
+        document element, qualified names as written) without building a DOM.
+        Parsing stops as soon as every single-valued path has been captured, so
+        malformed XML after the last wanted path goes unnoticed; before that it
+        raises expat.ExpatError and the caller decides how to report it.
+        """
+
+        class Done(Exception):
+            pass
+
+        def __init__(self, paths: Iterable[str], multi: Iterable[str] = ()):
+            self.paths = list(paths)
+            self.multi = set(multi)
+            self.targets = set(self.paths) | self.multi
+
+        def extract(self, data: bytes) -> Dict[str, object]:
+            """Returns path -> text of the first match (None when absent), or the list of all matches for multi paths."""
+            values = {path: [] if path in self.multi else None for path in self.targets}
+            pending = len(self.targets) - len(self.multi)
+            stack = [""]
+            capture = []
+            capture_path = [None]
+
+            def start_element(name, attrs):
+                path = stack[-1] + "." + name if len(stack) > 1 else name
+                stack.append(path)
+                if capture_path[0] is None and path in self.targets and (path in self.multi or values[path] is None):
+                    capture_path[0] = path
+                    capture.clear()
+
+            def end_element(name):
+                nonlocal pending
+                path = stack.pop()
+                if path == capture_path[0]:
+                    capture_path[0] = None
+                    value = "".join(capture).strip()
+                    if path in self.multi:
+                        values[path].append(value)
+                    else:
+                        values[path] = value
+                        pending -= 1
+                        if pending == 0 and not self.multi:
+                            raise XmlUtils.StreamExtractor.Done()
+
+            def char_data(text):
+                if capture_path[0] is not None:
+                    capture.append(text)
+
+            parser = expat.ParserCreate()
+            parser.buffer_text = True
+            parser.StartElementHandler = start_element
+            parser.EndElementHandler = end_element
+            parser.CharacterDataHandler = char_data
+            try:
+                parser.Parse(data, True)
+            except XmlUtils.StreamExtractor.Done:
+                pass
+            return values
 
     @staticmethod
     def tokenize_path(path: str) -> List[str]:
@@ -46,21 +147,24 @@ class XmlUtils:
             return node.getAttribute(attr)
         return None
 
+    @staticmethod
+    def selector(path: str) -> "XmlUtils.Selector":
+        """Returns the compiled selector for a path, compiling it on first use."""
+        sel = XmlUtils.selectors.get(path)
+        if sel is None:
+            sel = XmlUtils.Selector(path)
+            XmlUtils.selectors[path] = sel
+        return sel
+
     @staticmethod
     def select(from_node: minidom.Node, path: str) -> List[minidom.Node]:
         """Selects nodes based on a path of tags separated by periods."""
-        tags = XmlUtils.tokenize_path(path)
-        for tag in tags[:-1]:
-            from_node = XmlUtils.first_element(from_node, tag)
-            if from_node is None:
-                return []
-        return XmlUtils.get_elements(from_node, tags[-1])
+        return XmlUtils.selector(path).select(from_node)
 
     @staticmethod
     def select_first(from_node: minidom.Node, path: str) -> Optional[minidom.Node]:
         """Selects the first node that matches the specified path."""
-        nodes = XmlUtils.select(from_node, path)
-        return nodes[0] if nodes else None
+        return XmlUtils.selector(path).select_first(from_node)
 
     @staticmethod
     def get_value(node: minidom.Node) -> str:
@@ -70,8 +174,7 @@ class XmlUtils:
     @staticmethod
     def get_value_by_path(from_node: minidom.Node, path: str) -> Optional[str]:
         """Gets the text content of the first node matching the specified path."""
-        node = XmlUtils.select_first(from_node, path)
-        return XmlUtils.get_value(node) if node else None
+        return XmlUtils.selector(path).value(from_node)
 
     @staticmethod
     def fill_instance(instance: object, clazz: Type, node: minidom.Node):
@@ -83,9 +186,61 @@ class XmlUtils:
                 if value is not None:
                     setattr(instance, name, value)
 
+    @staticmethod
+    def slot_fields(clazz: Type) -> Optional[List[str]]:
+        """Returns the att* slots of a fully slotted class hierarchy, None if any class has a __dict__."""
+        fields = []
+        for cls in clazz.__mro__[:-1]:
+            slots = cls.__dict__.get("__slots__")
+            if slots is None:
+                return None
+            if isinstance(slots, str):
+                slots = [slots]
+            fields.extend(name for name in slots if name.startswith("att"))
+        return fields
+
+    @staticmethod
+    def get_binder(clazz: Type) -> tuple:
+        """Returns the cached (field, attribute) list of a class, computing it on first use."""
+        binder = XmlUtils.binders.get(clazz)
+        if binder is None:
+            fields = XmlUtils.slot_fields(clazz)
+            if fields is None:
+                # att* fields are assigned in __init__, so look at a sample instance
+                fields = [name for name in vars(clazz()) if name.startswith("att")]
+            binder = tuple((name, name[3:]) for name in dict.fromkeys(fields))
+            XmlUtils.binders[clazz] = binder
+        return binder
+
+    @staticmethod
+    def instance_from_attrs(clazz: Type, attrs: dict) -> object:
+        """Creates an instance of a class and populates its att* fields from an attribute dict."""
+        instance = clazz()
+        for name, attr_name in XmlUtils.get_binder(clazz):
+            value = attrs.get(attr_name)
+            if value is not None:
+                setattr(instance, name, value)
+        return instance
+
     @staticmethod
     def instance_from_node(clazz: Type, node: minidom.Node) -> Optional[object]:
-        """Creates an instance of a class and populates it with XML data."""
+        """Creates an instance of a class and populates its att* fields from the node attributes."""
+        try:
+            instance = clazz()
+            if isinstance(node, minidom.Element):
+                attrs = node.attributes
+                for name, attr_name in XmlUtils.get_binder(clazz):
+                    attr = attrs.get(attr_name)
+                    if attr is not None:
+                        setattr(instance, name, attr.value)
+            return instance
+        except Exception as e:
+            print(f"Error creating instance from XML node: {e}")
+            return None
+
+    @staticmethod
+    def instance_from_node_reflective(clazz: Type, node: minidom.Node) -> Optional[object]:
+        """Reflective variant scanning every class in the MRO per node, kept for comparison."""
         try:
             instance = clazz()
             current_class = clazz
@@ -97,7 +252,6 @@ class XmlUtils:
             print(f"Error creating instance from XML node: {e}")
             return None
 
-
 # from io import StringIO
 
 # xml_data = """
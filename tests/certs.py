@@ -0,0 +1,43 @@
+"""Hand-built BCert data for the tests, laid out like the PlayReady group certs."""
+import struct
+
+from core.bcert import BCert
+from modules.crypto import Crypto
+from modules.ecc import ECC
+
+SL3000 = 3000
+
+
+def attr(tag, data):
+    return struct.pack(">II", tag, len(data) + 8) + data
+
+
+def cert_bytes(cert_key, issuer_key, seclevel, usages, extra=b""):
+    ids = (b"\x11" * 0x10 + struct.pack(">III", seclevel, 0, BCert.CERT_TYPE_DEVICE)
+           + Crypto.SHA256(cert_key.pub_bytes()) + struct.pack(">I", BCert.NO_EXPIRATION) + b"\x22" * 0x10)
+    keyinfo = struct.pack(">IHHI", 1, BCert.KEY_TYPE_ECC256, 512, 0) + cert_key.pub_bytes()
+    keyinfo += struct.pack(">I", len(usages)) + b"".join(struct.pack(">I", u) for u in usages)
+    attrs = attr(BCert.TAG_IDS, ids) + attr(BCert.TAG_KEYINFO, keyinfo) + extra
+    cert_len = 0x10 + len(attrs)
+    sig_len = 8 + 4 + BCert.SIGNATURE_SIZE + 4 + BCert.PUB_KEY_SIZE
+    signed = struct.pack(">IIII", BCert.BCERT_CERT, BCert.CERT_VERSION, cert_len + sig_len, cert_len) + attrs
+    sig = Crypto.ecdsa(signed, issuer_key)
+    sig_attr = struct.pack(">HH", BCert.SIGNATURE_TYPE_ECDSA, BCert.SIGNATURE_SIZE) + sig
+    sig_attr += struct.pack(">I", 512) + issuer_key.pub_bytes()
+    return signed + attr(BCert.TAG_SIGNATURE, sig_attr)
+
+
+def chain_bytes(certs):
+    body = b"".join(certs)
+    return struct.pack(">IIIII", BCert.BCERT_CHAIN, 1, len(body) + 0x14, 0, len(certs)) + body
+
+
+def group_chain(root=None):
+    """A model cert issuing device certs under a self-signed root, returns (chain data, model key)."""
+    root, model = root or ECC.ECKey(), ECC.ECKey()
+    data = chain_bytes([
+        cert_bytes(model, root, SL3000, [BCert.KEY_USAGE_ISSUER_DEVICE], extra=attr(0x00010005, b"model\x00\x00\x00")),
+        cert_bytes(root, root, SL3000, [BCert.KEY_USAGE_ISSUER_ALL]),
+    ])
+    return data, model
+
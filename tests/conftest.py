@@ -0,0 +1,51 @@
+import os
+import sys
+from collections import OrderedDict
+
+import pytest
+
+# Tests import core.* and modules.* the way the tools do, from the repo root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import certs  # noqa: E402
+
+
+@pytest.fixture
+def device(tmp_path, monkeypatch):
+    """The current Device, its group chain g1, group key z1 and trusted root key in a temporary BCert.BASE_DIR."""
+    from core.bcert import BCert
+    from core.cert_validator import CertValidator
+    from core.device import Device
+    from modules.ecc import ECC
+    from modules.vars import Vars
+
+    root = ECC.ECKey()
+    data, group_key = certs.group_chain(root)
+    (tmp_path / "g1").write_bytes(data)
+    group_key.save(str(tmp_path / "z1"))
+    (tmp_path / CertValidator.ROOT_KEY_FILE).write_bytes(root.pub_bytes())
+    monkeypatch.setattr(CertValidator, "root_key", None)
+    monkeypatch.setattr(BCert, "BASE_DIR", str(tmp_path))
+    monkeypatch.setattr(Device, "group_key", group_key)
+    monkeypatch.setattr(Device, "group_cert", None)
+    monkeypatch.setattr(Device, "curdev", None)
+    Vars.set("SERIAL", "0123456789abcdefXYZ")
+    Vars.set("MAC", "001122aabbcc")
+    return Device.cur_device()
+
+
+@pytest.fixture
+def content_dir(tmp_path, monkeypatch):
+    """A temporary CONTENT_DIR with an empty key store and synchronous debug artifacts."""
+    from core.key_store import KeyStore
+    from modules.vars import Vars
+
+    path = tmp_path / "content"
+    Vars.set("CONTENT_DIR", str(path))
+    Vars.set("MSPR_DEBUG_SINK", "sync")
+    monkeypatch.setattr(KeyStore, "entries", OrderedDict())
+    monkeypatch.setattr(KeyStore, "loaded", False)
+    monkeypatch.setattr(KeyStore, "offsets", {})
+    yield str(path)
+    Vars.clear("CONTENT_DIR")
+    Vars.clear("MSPR_DEBUG_SINK")
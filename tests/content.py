@@ -0,0 +1,42 @@
+"""Smooth Streaming manifests with a PlayReady protection header, for the tests."""
+import struct
+
+from core.wrm_header import WRMHeader
+from modules.crypto import Crypto
+
+SYSTEM_ID = "9a04f079-9840-4286-ab92-e65be0885f95"
+
+
+def wrmheader(kid, la_url="https://example.com/rightsmanager.asmx"):
+    return (
+        '<WRMHEADER xmlns="http://schemas.microsoft.com/DRM/2007/03/PlayReadyHeader" version="4.0.0.0">'
+        "<DATA><PROTECTINFO><KEYLEN>16</KEYLEN><ALGID>AESCTR</ALGID></PROTECTINFO>"
+        f"<KID>{Crypto.base64_encode(kid)}</KID><LA_URL>{la_url}</LA_URL></DATA></WRMHEADER>"
+    )
+
+
+def pro(xml):
+    """A PlayReady Object holding a single WRMHEADER record."""
+    record = xml.encode("utf-16-le")
+    return struct.pack("<IHHH", 4 + 2 + 4 + len(record), 1, WRMHeader.PRO_RECORD_WRMHEADER, len(record)) + record
+
+
+def attr(name, value):
+    return f' {name}="{value}"' if value is not None else ""
+
+
+def manifest(prothdr=None, chunks=((0, 20000000), (None, 20000000)), timescale="10000000", si_timescale="10000000"):
+    """A single video stream manifest, the TimeScale attributes are left out when None."""
+    protection = (
+        f'<Protection><ProtectionHeader SystemID="{SYSTEM_ID}">{prothdr}</ProtectionHeader></Protection>'
+    ) if prothdr is not None else ""
+    c = "".join(f'<c t="{t}" d="{d}"/>' if t is not None else f'<c d="{d}"/>' for t, d in chunks)
+    return (
+        '<?xml version="1.0" encoding="utf-8"?>'
+        f'<SmoothStreamingMedia MajorVersion="2" MinorVersion="0"{attr("TimeScale", timescale)} Duration="40000000">'
+        f"{protection}"
+        f'<StreamIndex Type="video" Name="video" Chunks="{len(chunks)}"{attr("TimeScale", si_timescale)} '
+        'Url="QualityLevels({bitrate})/Fragments(video={start time})">'
+        '<QualityLevel Index="0" Bitrate="1000000" FourCC="AVC1" CodecPrivateData="00000001"/>'
+        f"{c}</StreamIndex></SmoothStreamingMedia>"
+    ).encode()
@@ -0,0 +1,90 @@
+from types import SimpleNamespace
+
+import pytest
+
+import core.asset
+from content import wrmheader
+from core.asset import Asset
+from core.challenge_queue import ChallengeQueue
+from core.key_store import KeyStore
+from core.ls import LS
+from core.wrm_header import WRMHeader
+from modules.vars import Vars
+
+LS1 = "https://one.example.com/ls"
+LS2 = "https://two.example.com/ls"
+
+
+def kid(i):
+    return bytes([i]) * 0x10
+
+
+def key(i):
+    return bytes([0x80 + i]) * 0x10
+
+
+class FakeAsset:
+    def __init__(self, i, ls_url):
+        self.id = i
+        self.ls_url = ls_url
+        self.ism = SimpleNamespace(ph=SimpleNamespace(wrmhdr=lambda: WRMHeader(wrmheader(kid(i), ls_url).encode())))
+        self.key = None
+
+    def get_kid(self):
+        return kid(self.id)
+
+    def get_ls_url(self):
+        return self.ls_url
+
+    def cache_key(self, content_key):
+        self.key = content_key
+
+
+class FakeLicense:
+    """Grants a key to every KID of the WRMHEADER the fake request carries."""
+    ExpirationDate = None
+
+    def __init__(self, data):
+        self.kids = WRMHeader(data).kids
+
+    def get_content_keys(self):
+        return {k: key(k[0]) for k in self.kids}
+
+
+@pytest.fixture
+def requests(device, content_dir, monkeypatch):
+    """(ls_url, KIDs) of the license requests sent."""
+    sent = []
+
+    def send_license_req(ls_url, dev, req):
+        sent.append((ls_url, WRMHeader(req.encode()).kids))
+        return req
+
+    monkeypatch.setattr(ChallengeQueue, "license_request", lambda dev, wrmheader: wrmheader)
+    monkeypatch.setattr(LS, "send_license_req", send_license_req)
+    monkeypatch.setattr(core.asset, "License", FakeLicense)
+    return sent
+
+
+def test_acquire_keys_groups_by_ls_url(requests):
+    assets = [FakeAsset(1, LS1), FakeAsset(2, LS2), FakeAsset(3, LS1), FakeAsset(4, LS1)]
+    Vars.set("MSPR_BATCH_KIDS", 2)
+    try:
+        assert Asset.acquire_keys(assets) == 4
+    finally:
+        Vars.clear("MSPR_BATCH_KIDS")
+
+    assert requests == [(LS1, [kid(1), kid(3)]), (LS1, [kid(4)]), (LS2, [kid(2)])]
+    assert [a.key for a in assets] == [key(1), key(2), key(3), key(4)]
+    assert KeyStore.get(kid(3)) == key(3)
+
+
+def test_acquire_keys_skips_stored_kids(requests):
+    KeyStore.put(kid(1), key(1))
+    KeyStore.put(kid(2), key(2))
+    assets = [FakeAsset(1, LS1), FakeAsset(2, LS2), FakeAsset(3, LS1)]
+
+    assert Asset.acquire_keys(assets) == 3
+
+    assert requests == [(LS1, [kid(3)])]
+    assert [a.key for a in assets] == [key(1), key(2), key(3)]
@@ -0,0 +1,53 @@
+from certs import attr, cert_bytes, chain_bytes
+from core.bcert import BCert
+from modules.byte_input import ByteInput
+from modules.crypto import Crypto
+from modules.ecc import ECC
+
+
+def make_chain():
+    root, model, leaf = ECC.ECKey(), ECC.ECKey(), ECC.ECKey()
+    data = chain_bytes([
+        cert_bytes(leaf, model, 2000, [BCert.KEY_USAGE_SIGN]),
+        cert_bytes(model, root, 2000, [BCert.KEY_USAGE_ISSUER_DEVICE], extra=attr(0x00010005, b"model\x00\x00\x00")),
+    ])
+    return data, root, model, leaf
+
+
+def test_parse_chain():
+    data, root, model, leaf = make_chain()
+    chain = BCert.CertificateChain(ByteInput("chain", data))
+
+    assert chain.cert_cnt == 2
+    cert = chain.get(0)
+    assert cert.get_seclevel() == 2000
+    assert cert.get_pubkey_for_signing() == leaf.pub_bytes()
+    assert cert.signing_key == model.pub_bytes()
+    assert Crypto.ecdsa_verify(cert.get_signed_data(), cert.signature, cert.signing_key)
+    assert chain.get(1).get_pubkey_for_signing() == model.pub_bytes()
+
+
+def test_reserialize_byte_for_byte():
+    data, _, _, _ = make_chain()
+    chain = BCert.CertificateChain(ByteInput("chain", data))
+    for cert in chain.certs:
+        cert.invalidate()
+
+    assert chain.body() == data
+
+
+def test_resign_leaf():
+    data, _, model, _ = make_chain()
+    chain = BCert.CertificateChain(ByteInput("chain", data))
+    leaf = chain.get(0)
+    new_key = ECC.ECKey()
+
+    leaf.set_seclevel(3000)
+    leaf.sign(model, new_key)
+
+    assert Crypto.ecdsa_verify(leaf.get_signed_data(), leaf.signature, model.pub_bytes())
+    reparsed = BCert.CertificateChain(ByteInput("chain", chain.body())).get(0)
+    assert reparsed.get_seclevel() == 3000
+    assert reparsed.get_pubkey_for_signing() == new_key.pub_bytes()
+    assert Crypto.ecdsa_verify(reparsed.get_signed_data(), reparsed.signature, reparsed.signing_key)
+    assert not Crypto.ecdsa_verify(data[:0x100], reparsed.signature, reparsed.signing_key)
@@ -0,0 +1,99 @@
+import os
+
+import pytest
+
+from core.blicense import BLicense
+from core.license import License
+from modules.crypto import Crypto
+from modules.ecc import ECC
+
+KID = bytes(range(0x10))
+CONTENT_KEY = bytes.fromhex("00112233445566778899aabbccddeeff")
+
+
+def keys_for(enc_key):
+    """An integrity key and the ECC encrypted integrity || content keys, as a license server sends them."""
+    while True:
+        integrity_key = os.urandom(0x10)
+        enc_data = Crypto.ecc_encrypt(integrity_key + CONTENT_KEY, enc_key)
+        if enc_data is not None:
+            return integrity_key, enc_data
+
+
+def response(licenses):
+    lics = "".join(f"<License>{Crypto.base64_encode(lic)}</License>" for lic in licenses)
+    return (
+        '<soap:Envelope xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/"><soap:Body>'
+        "<AcquireLicenseResponse><AcquireLicenseResult><Response><LicenseResponse>"
+        f"<Licenses>{lics}</Licenses></LicenseResponse></Response></AcquireLicenseResult>"
+        "</AcquireLicenseResponse></soap:Body></soap:Envelope>"
+    )
+
+
+@pytest.fixture(autouse=True)
+def clear_verified():
+    BLicense.verified.clear()
+
+
+@pytest.fixture
+def license_data():
+    integrity_key, enc_data = keys_for(ECC.ECKey().pub())
+    return BLicense.build(KID, enc_data, integrity_key, 2000, os.urandom(0x10)), integrity_key
+
+
+def test_aes_omac1_rfc4493():
+    key = bytes.fromhex("2b7e151628aed2a6abf7158809cf4f3c")
+    msg = bytes.fromhex("6bc1bee22e409f96e93d7e117393172a")
+    assert Crypto.aes_omac1(msg, key) == bytes.fromhex("070a16b46b4d4144f79bdd9dd04a287c")
+
+
+def test_parse(license_data):
+    data, _ = license_data
+    lic = BLicense(data)
+
+    assert lic.version == BLicense.XMR_VERSION
+    assert lic.get_attr("OuterContainer.GlobalPolicy.SecurityLevel").security_level == 2000
+    ck = lic.get_attr(License.CONTENT_KEY)
+    assert ck.key_id == KID and len(ck.enc_data) == 128
+    assert lic.get_signature().sig_type == BLicense.SIGNATURE_AES_OMAC1
+    assert lic.get_attr("OuterContainer.SecurityLevel") is None
+
+
+def test_verify_signature(license_data):
+    data, integrity_key = license_data
+    assert BLicense(data).verify_signature(integrity_key)
+
+
+def test_tampered_license_rejected(license_data):
+    data, integrity_key = license_data
+    tampered = bytearray(data)
+    tampered[-0x40] ^= 0x01
+
+    assert not BLicense(bytes(tampered)).verify_signature(integrity_key)
+
+
+def test_failed_check_not_cached(license_data):
+    data, integrity_key = license_data
+    lic = BLicense(data)
+
+    assert not lic.verify_signature(os.urandom(0x10))
+    assert lic.verify_signature(integrity_key)
+    assert not lic.verify_signature(os.urandom(0x10))
+
+
+def test_truncated_license_raises(license_data):
+    data, _ = license_data
+    with pytest.raises(ValueError):
+        BLicense(data[:-5])
+
+
+def test_license_content_keys(device, monkeypatch):
+    integrity_key, enc_data = keys_for(device.enc_key().pub())
+    xml = response([BLicense.build(KID, enc_data, integrity_key, 2000, os.urandom(0x10))])
+
+    assert License(xml).get_content_keys() == {KID: CONTENT_KEY}
+    assert License(xml).verify_signature()
+
+    # Verified licenses are recognized before their keys are decrypted
+    monkeypatch.setattr(Crypto, "ecc_decrypt", staticmethod(lambda *args: pytest.fail("decrypted")))
+    assert License(xml).verify_signature()
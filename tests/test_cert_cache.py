@@ -0,0 +1,104 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+import certs
+from core.bcert import BCert
+from core.cert_cache import CertCache
+from core.device import Device
+from modules.utils import Utils
+
+
+@pytest.fixture
+def base_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(BCert, "BASE_DIR", str(tmp_path))
+    return tmp_path
+
+
+@pytest.fixture
+def loads(monkeypatch):
+    """Names of the certs parsed from their source file."""
+    names = []
+    from_file = BCert.from_file
+
+    def counting_from_file(name):
+        names.append(name)
+        return from_file(name)
+
+    monkeypatch.setattr(BCert, "from_file", counting_from_file)
+    return names
+
+
+def test_hit_skips_source(base_dir, loads, monkeypatch):
+    data, _ = certs.group_chain()
+    (base_dir / "g1").write_bytes(data)
+
+    chain = CertCache.group_cert("g1")
+    assert loads == ["g1"] and chain.cert_cnt == 2
+    assert os.path.exists(CertCache.cache_filename(str(base_dir / "g1")))
+
+    # Unchanged size and mtime: neither parsed nor read
+    source_reads = []
+    load_file = Utils.load_file
+    monkeypatch.setattr(Utils, "load_file", lambda path: source_reads.append(path) or load_file(path))
+    chain = CertCache.group_cert("g1")
+    assert loads == ["g1"] and chain.body() == data
+    assert str(base_dir / "g1") not in source_reads
+
+
+def test_touched_source_not_reparsed(base_dir, loads):
+    data, _ = certs.group_chain()
+    path = base_dir / "g1"
+    path.write_bytes(data)
+    CertCache.group_cert("g1")
+
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+
+    assert CertCache.group_cert("g1").body() == data
+    assert loads == ["g1"]
+
+
+def test_source_changed(base_dir, loads):
+    path = base_dir / "g1"
+    path.write_bytes(certs.group_chain()[0])
+    CertCache.group_cert("g1")
+
+    data, _ = certs.group_chain()
+    path.write_bytes(data)
+
+    assert CertCache.group_cert("g1").body() == data
+    assert loads == ["g1", "g1"]
+
+
+def test_miss(base_dir, loads):
+    assert CertCache.group_cert("g1") is None
+    (base_dir / "g1").write_bytes(b"not a cert chain")
+    assert CertCache.group_cert("g1") is None
+    assert not os.path.exists(CertCache.cache_filename(str(base_dir / "g1")))
+
+
+def test_group_key_lazy_and_not_cached(base_dir, monkeypatch):
+    _, key = certs.group_chain()
+    key.save(str(base_dir / "z1"))
+    # Left by the versions that cached the key
+    (base_dir / "z1.cache").write_bytes(key.prv_bytes())
+    monkeypatch.setattr(Device, "group_key", None)
+
+    assert Device.get_group_key().prv() == key.prv()
+    assert sorted(os.listdir(base_dir)) == ["z1"]
+
+
+def test_import_reads_no_secrets(tmp_path):
+    (tmp_path / "secrets").mkdir()
+    (tmp_path / "secrets" / "z1").write_bytes(bytes(range(1, 0x21)))
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    out = subprocess.run(
+        [sys.executable, "-c", "from core.device import Device; print(Device.group_key)"],
+        cwd=tmp_path, env={**os.environ, "PYTHONPATH": root}, capture_output=True, text=True, check=True
+    ).stdout
+
+    assert out.strip() == "None"
+    assert os.listdir(tmp_path / "secrets") == ["z1"]
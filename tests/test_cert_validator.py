@@ -0,0 +1,105 @@
+from collections import OrderedDict
+
+import pytest
+
+from certs import attr, cert_bytes, chain_bytes
+from core.bcert import BCert
+from core.cert_validator import CertValidator
+from core.device import Device
+from modules.byte_input import ByteInput
+from modules.crypto import Crypto
+from modules.ecc import ECC
+from modules.vars import Vars
+
+
+@pytest.fixture
+def verifies(monkeypatch):
+    """Counts the ECDSA verifications, with an empty result cache."""
+    calls = []
+    ecdsa_verify = Crypto.ecdsa_verify
+    monkeypatch.setattr(CertValidator, "results", OrderedDict())
+    monkeypatch.setattr(Crypto, "ecdsa_verify", lambda *args: calls.append(args) or ecdsa_verify(*args))
+    return calls
+
+
+def make_chain(root):
+    model, leaf = ECC.ECKey(), ECC.ECKey()
+    return chain_bytes([
+        cert_bytes(leaf, model, 2000, [BCert.KEY_USAGE_SIGN, BCert.KEY_USAGE_ENCRYPT_KEY]),
+        cert_bytes(model, root, 2000, [BCert.KEY_USAGE_ISSUER_DEVICE], extra=attr(0x00010005, b"model\x00\x00\x00")),
+        cert_bytes(root, root, 3000, [BCert.KEY_USAGE_ISSUER_ALL]),
+    ])
+
+
+def parse(data):
+    return BCert.CertificateChain(ByteInput("chain", bytes(data)))
+
+
+def test_second_validation_skips_verify(verifies):
+    root = ECC.ECKey()
+    data = make_chain(root)
+
+    assert CertValidator.validate(parse(data), root.pub_bytes()) == []
+    assert len(verifies) == 3
+    # A fresh parse of the same bytes still hits the digest-keyed results
+    assert CertValidator.validate(parse(data), root.pub_bytes()) == []
+    assert len(verifies) == 3
+
+
+def test_tampered_chain_rejected(verifies):
+    root = ECC.ECKey()
+    data = bytearray(make_chain(root))
+    assert CertValidator.validate(parse(data), root.pub_bytes()) == []
+
+    # Security level in the IDS attribute of the leaf: chain header, cert header, attr header, random
+    pos = 0x14 + 0x10 + 0x08 + 0x10
+    data[pos:pos + 4] = (3000).to_bytes(4, "big")
+
+    errors = CertValidator.validate(parse(data), root.pub_bytes())
+    assert "cert 0: invalid signature" in errors
+    assert len(verifies) == 4
+
+
+def test_chain_must_end_at_pinned_root(verifies):
+    rogue = ECC.ECKey()
+    chain = parse(make_chain(rogue))
+
+    # Self-consistent, so only the pinned root tells it apart
+    assert CertValidator.validate(chain) == []
+    assert CertValidator.validate(chain, ECC.ECKey().pub_bytes()) == ["cert 2: not signed by its issuer key"]
+
+
+def test_device_chain_checked_against_pinned_root(device, tmp_path, monkeypatch):
+    Vars.set("MSPR_VERIFY_CHAIN", 1)
+    try:
+        assert device.get_cert_chain().cert_cnt == 3
+
+        device.cert_chain = None
+        monkeypatch.setattr(CertValidator, "root_key", None)
+        (tmp_path / CertValidator.ROOT_KEY_FILE).write_bytes(ECC.ECKey().pub_bytes())
+        with pytest.raises(SystemExit):
+            device.get_cert_chain()
+
+        device.cert_chain = None
+        monkeypatch.setattr(CertValidator, "root_key", None)
+        (tmp_path / CertValidator.ROOT_KEY_FILE).unlink()
+        with pytest.raises(SystemExit):
+            device.get_cert_chain()
+    finally:
+        Vars.clear("MSPR_VERIFY_CHAIN")
+
+
+def test_fake_root_is_pinned(device, monkeypatch):
+    monkeypatch.setattr(Device, "group_cert", None)
+    monkeypatch.setattr(device, "cert", None)
+    monkeypatch.setattr(device, "cert_chain", None)
+    Vars.set("MSPR_FAKE_ROOT", 1)
+    Vars.set("MSPR_VERIFY_CHAIN", 1)
+    try:
+        chain = device.get_cert_chain()
+    finally:
+        Vars.clear("MSPR_FAKE_ROOT")
+        Vars.clear("MSPR_VERIFY_CHAIN")
+
+    assert CertValidator.root_key == chain.get(2).signing_key
+    assert CertValidator.validate(chain, CertValidator.root_key) == []
@@ -0,0 +1,111 @@
+import threading
+import time
+
+import pytest
+
+from core.challenge_queue import ChallengeQueue
+from core.device import Device
+
+
+def wait_for(predicate, timeout=10):
+    end = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < end, "timed out"
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def chain_builds(device, monkeypatch):
+    """Names of the threads that generated the device cert chain."""
+    threads = []
+    get_cert_chain = Device.get_cert_chain
+
+    def recording_get_cert_chain(self):
+        if self.chain_stale():
+            threads.append(threading.current_thread().name)
+        return get_cert_chain(self)
+
+    monkeypatch.setattr(Device, "get_cert_chain", recording_get_cert_chain)
+    return threads
+
+
+def test_hit_miss_stale_accounting(device):
+    queue = ChallengeQueue(device, depth=4, max_age=60)
+    fresh = queue.prepare()
+    old = queue.prepare()
+    old.created -= 120
+    queue.items.extend([old, fresh])
+
+    assert queue.take() is fresh
+    assert queue.take() is not fresh
+
+    stats = queue.stats()
+    assert (stats["hits"], stats["misses"], stats["stale"], stats["depth"]) == (1, 1, 1, 0)
+    assert queue.request("<WRMHEADER/>").startswith("<?xml")
+
+
+def test_refill_replaces_expired_entries(device):
+    queue = ChallengeQueue(device, depth=2, max_age=0.2)
+    queue.start()
+    try:
+        wait_for(lambda: queue.stats()["stale"] >= 2)
+        wait_for(lambda: queue.stats()["depth"] == 2)
+    finally:
+        queue.stop()
+    assert queue.stats()["generated"] >= 4
+
+
+def test_stop(device):
+    queue = ChallengeQueue(device, depth=1, max_age=60)
+    queue.start()
+    wait_for(lambda: queue.stats()["depth"] == 1)
+    thread = queue.thread
+
+    queue.stop()
+
+    assert not thread.is_alive() and queue.thread is None
+    generated = queue.stats()["generated"]
+    queue.take()
+    time.sleep(0.05)
+    assert queue.stats()["generated"] == generated
+
+
+def test_refill_survives_errors(device, monkeypatch, capsys):
+    monkeypatch.setattr(ChallengeQueue, "RETRY_DELAY", 0.01)
+    queue = ChallengeQueue(device, depth=1, max_age=60)
+    prepare = queue.prepare
+    failures = [RuntimeError("no entropy")]
+
+    def failing_prepare(chain=None):
+        if failures:
+            raise failures.pop()
+        return prepare(chain)
+
+    queue.prepare = failing_prepare
+    queue.start()
+    try:
+        wait_for(lambda: queue.stats()["depth"] == 1)
+    finally:
+        queue.stop()
+    assert queue.stats()["errors"] == 1
+    assert "no entropy" in capsys.readouterr().err
+
+
+def test_chain_only_built_by_callers(device, chain_builds):
+    queue = ChallengeQueue(device, depth=2, max_age=60)
+    queue.start()
+    try:
+        wait_for(lambda: queue.stats()["depth"] == 2)
+        # Invalidates the chain, as a device or security level change does
+        device.cert_chain = None
+        time.sleep(0.05)
+        assert queue.stats()["generated"] == 2
+
+        queue.take()
+        wait_for(lambda: queue.stats()["depth"] == 2)
+    finally:
+        queue.stop()
+    stats = queue.stats()
+    assert (stats["hits"], stats["misses"], stats["stale"]) == (0, 1, 2)
+    # Built when the queue was created, then rebuilt by take()
+    assert chain_builds == [threading.current_thread().name] * 2
@@ -0,0 +1,86 @@
+import atexit
+import os
+
+import pytest
+
+from core.debug_sink import DebugSink
+from core.file_cache import FileCache
+from modules.utils import Utils
+from modules.vars import Vars
+
+
+@pytest.fixture
+def sink(content_dir, monkeypatch):
+    monkeypatch.setattr(DebugSink, "written", 0)
+    monkeypatch.setattr(DebugSink, "failed", 0)
+    monkeypatch.setattr(DebugSink, "dropped", 0)
+    return content_dir
+
+
+def mode(name):
+    Vars.set("MSPR_DEBUG_SINK", name)
+
+
+def saved(assetname, name):
+    return Utils.load_file(os.path.join(FileCache.debug_dir(assetname), name))
+
+
+def test_sync(sink):
+    DebugSink.write("a1", "lic_req.txt", b"req")
+
+    assert saved("a1", "lic_req.txt") == b"req"
+    assert DebugSink.stats()["written"] == 1
+
+
+def test_failed_save_not_counted(sink, monkeypatch):
+    monkeypatch.setattr(Utils, "save_file", staticmethod(lambda path, data: False))
+    DebugSink.write("a1", "lic_req.txt", b"req")
+
+    stats = DebugSink.stats()
+    assert (stats["written"], stats["failed"]) == (0, 1)
+
+
+def test_async_writer_survives_errors(sink, monkeypatch):
+    mode(DebugSink.MODE_ASYNC)
+    save_file = Utils.save_file
+
+    def flaky(path, data):
+        if data == b"bad":
+            raise RuntimeError("disk on fire")
+        return save_file(path, data)
+
+    monkeypatch.setattr(Utils, "save_file", staticmethod(flaky))
+    DebugSink.write("a1", "lic_req.txt", b"bad")
+    DebugSink.write("a1", "lic_resp.txt", b"good")
+    DebugSink.flush()
+
+    assert saved("a1", "lic_resp.txt") == b"good"
+    stats = DebugSink.stats()
+    assert (stats["written"], stats["failed"], stats["pending_bytes"]) == (1, 1, 0)
+
+
+def test_async_flushed_at_exit(sink, monkeypatch):
+    mode(DebugSink.MODE_ASYNC)
+    registered = []
+    monkeypatch.setattr(DebugSink, "writer", None)
+    monkeypatch.setattr(atexit, "register", registered.append)
+
+    DebugSink.write("a1", "lic_req.txt", b"req")
+    DebugSink.write("a1", "lic_resp.txt", b"resp")
+
+    assert registered == [DebugSink.flush]
+    registered[0]()
+    assert saved("a1", "lic_resp.txt") == b"resp"
+
+
+def test_ring_dump(sink):
+    mode(DebugSink.MODE_RING)
+    DebugSink.ring.clear()
+    DebugSink.write("a1", "lic_resp.txt", b"old")
+    DebugSink.write("a1", "lic_resp.txt", b"new")
+    DebugSink.write("a2", "lic_resp.txt", b"other")
+
+    assert saved("a1", "lic_resp.txt") is None
+    assert DebugSink.dump("a1") == 1
+    assert saved("a1", "lic_resp.txt") == b"new"
+    assert saved("a2", "lic_resp.txt") is None
@@ -0,0 +1,37 @@
+from core.bcert import BCert
+from core.cert_validator import CertValidator
+from core.device import Device
+from modules.byte_input import ByteInput
+from modules.crypto import Crypto
+from modules.vars import Vars
+
+
+def test_leaf_signed_with_group_key(device):
+    cert = device.get_cert()
+
+    assert cert.signing_key == Device.group_key.pub_bytes()
+    assert Crypto.ecdsa_verify(cert.get_signed_data(), cert.signature, cert.signing_key)
+
+
+def test_generated_chain_is_valid(device):
+    Vars.set("MSPR_VERIFY_CHAIN", 1)
+    try:
+        chain = device.get_cert_chain()
+    finally:
+        Vars.clear("MSPR_VERIFY_CHAIN")
+
+    assert chain.cert_cnt == 3
+    assert CertValidator.validate(chain, chain.get(2).signing_key) == []
+
+
+def test_modified_chain_is_rejected(device):
+    data = bytearray(device.get_cert_chain().body())
+    # Security level in the IDS attribute of the leaf: chain header, cert header, attr header, random
+    pos = 0x14 + 0x10 + 0x08 + 0x10
+    assert int.from_bytes(data[pos:pos + 4], "big") == Device.DEFAULT_SL
+    data[pos:pos + 4] = (3000).to_bytes(4, "big")
+
+    chain = BCert.CertificateChain(ByteInput("modified", bytes(data)))
+
+    assert chain.get(0).get_seclevel() == 3000
+    assert CertValidator.validate(chain, chain.get(2).signing_key) == ["cert 0: invalid signature"]
@@ -0,0 +1,98 @@
+import os
+
+import pytest
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.hazmat.primitives.asymmetric.utils import decode_dss_signature
+
+from modules.crypto import Crypto
+from modules.ecc import ECC
+
+
+def affine_multiply(p, k):
+    """Reference double-and-add on affine points, one inversion per step."""
+    result = ECC.INFINITY
+    while k:
+        if k & 1:
+            result = ECC.point_addition(result, p)
+        p = ECC.point_double(p)
+        k >>= 1
+    return result
+
+
+def test_jacobian_multiply_matches_affine():
+    p = ECC.G.multiply(0x1234)
+    for k in (1, 2, 3, 7, 0x10001, ECC.ORDER - 2, int.from_bytes(os.urandom(0x20), "big") % ECC.ORDER):
+        q = p.multiply(k)
+        assert q == affine_multiply(p, k)
+        assert q.on_curve()
+
+
+def test_point_edge_cases():
+    p = ECC.G.multiply(5)
+    assert p.add(p.negate()) == ECC.INFINITY
+    assert p.add(ECC.INFINITY) == p and ECC.INFINITY.add(p) == p
+    assert ECC.G.multiply(ECC.ORDER) == ECC.INFINITY
+    assert ECC.G.multiply(ECC.ORDER - 1) == ECC.G.negate()
+    assert ECC.G.multiply(ECC.ORDER + 3) == ECC.G.multiply(3)
+
+    assert ECC.G.on_curve()
+    assert not ECC.ECPoint(ECC.GX, ECC.GY + 1).on_curve()
+    assert not ECC.ECPoint(ECC.GX + ECC.P, ECC.GY).on_curve()
+
+
+def test_public_key_matches_cryptography():
+    key = ECC.ECKey()
+    numbers = ec.derive_private_key(key.prv(), ec.SECP256R1()).public_key().public_numbers()
+
+    assert (key.pub().x, key.pub().y) == (numbers.x, numbers.y)
+
+
+def test_eckey_round_trip(tmp_path):
+    # A scalar with leading zero bytes still stores as 32 bytes
+    key = ECC.ECKey((5).to_bytes(0x20, "big"))
+    path = str(tmp_path / "keys" / "z1")
+
+    assert key.save(path)
+    assert len(key.prv_bytes()) == ECC.COORD_SIZE
+    loaded = ECC.ECKey.from_file(path)
+    assert loaded.prv() == 5 and loaded.pub() == ECC.G.multiply(5)
+    assert ECC.ECPoint.from_bytes(key.pub_bytes()) == key.pub()
+
+    (tmp_path / "short").write_bytes(b"\x01" * 0x10)
+    assert ECC.ECKey.from_file(str(tmp_path / "short")) is None
+    assert ECC.ECKey.from_file(str(tmp_path / "missing")) is None
+    with pytest.raises(ValueError):
+        ECC.ECKey(ECC.int_to_bytes(ECC.ORDER))
+
+
+def test_encrypt_decrypt():
+    key = ECC.ECKey()
+    while True:
+        data = os.urandom(0x20)
+        if ECC.point_from_x(ECC.bytes_to_int(data)) is not None:
+            break
+
+    assert ECC.decrypt(ECC.encrypt(data, key.pub()), key.prv()) == data
+    assert Crypto.ecc_decrypt(Crypto.ecc_encrypt(data, key.pub_bytes()), key) == data
+    assert ECC.decrypt(ECC.encrypt(data, key.pub()), ECC.ECKey().prv()) != data
+
+
+def test_encrypt_rejects_non_point_x():
+    x = next(x for x in range(1, 100) if ECC.point_from_x(x) is None)
+    assert ECC.encrypt(ECC.int_to_bytes(x), ECC.ECKey().pub()) is None
+
+
+def test_ecdsa_interop():
+    key = ECC.ECKey()
+    data = b"signed info"
+
+    sig = Crypto.ecdsa(data, key)
+    assert Crypto.ecdsa_verify(data, sig, key.pub_bytes())
+    assert not Crypto.ecdsa_verify(data + b"!", sig, key.pub_bytes())
+    assert not Crypto.ecdsa_verify(data, sig, ECC.ECKey().pub_bytes())
+
+    # Signed outside of modules.ecc, checked against the public key it computes
+    der = ec.derive_private_key(key.prv(), ec.SECP256R1()).sign(data, ec.ECDSA(hashes.SHA256()))
+    r, s = decode_dss_signature(der)
+    assert Crypto.ecdsa_verify(data, ECC.int_to_bytes(r) + ECC.int_to_bytes(s), key.pub_bytes())
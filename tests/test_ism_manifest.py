@@ -0,0 +1,93 @@
+import os
+
+import pytest
+
+from content import SYSTEM_ID, manifest, pro, wrmheader
+from core.file_cache import FileCache
+from core.ism_manifest import ISMManifest
+from core.mp4_builder import MP4Builder
+from core.wrm_header import WRMHeader
+from modules.crypto import Crypto
+
+KID = bytes(range(0x10))
+WRMHEADER = wrmheader(KID)
+
+
+@pytest.mark.parametrize("use_dom", [False, True])
+def test_protection_header(use_dom):
+    prothdr = Crypto.base64_encode(pro(WRMHEADER))
+    ism = ISMManifest("Manifest", manifest(prothdr), use_dom)
+
+    assert ism.ph.SystemID() == SYSTEM_ID
+    assert ism.ph.data() == prothdr
+    assert ism.get_wrmhdr_data() == WRMHEADER
+    hdr = ism.ph.wrmhdr()
+    assert hdr is WRMHeader.from_prothdr(ism.ph.data())
+    assert hdr.kid == KID
+    assert hdr.la_url == "https://example.com/rightsmanager.asmx"
+
+
+def test_no_protection_header():
+    ism = ISMManifest("Manifest", manifest())
+
+    assert ism.ph is None
+    assert ism.get_wrmhdr_data() is None
+
+
+def test_timeline_runs():
+    tl = ISMManifest.Timeline()
+    tl.add(0, 10, 3)
+    tl.add(30, 10)
+    tl.add(40, 5, 2)
+    tl.add(60, 10)
+
+    assert (len(tl), tl.run_cnt()) == (7, 3)
+    assert list(tl.starts_in(0, 7)) == [0, 10, 20, 30, 40, 45, 60]
+    assert list(tl.starts_in(2, 6)) == [20, 30, 40, 45]
+    assert [tl.index_at(t) for t in (0, 39, 44, 45, 55, 69, 70)] == [0, 3, 4, 5, -1, 6, -1]
+    assert tl.range_for(15, 30) == (1, 5)
+    assert tl.range_for(55, 0) == (5, 7)
+
+
+def test_timeline_evict_and_merge():
+    tl = ISMManifest.Timeline()
+    tl.add(0, 10, 5)
+    newer = ISMManifest.Timeline()
+    newer.add(30, 10, 4)
+
+    assert tl.merge(newer) == 2
+    assert (len(tl), tl.run_cnt(), tl.end()) == (7, 1, 70)
+    # Evicting keeps the absolute indexes of the remaining chunks
+    assert tl.evict_before(25) == (0, 3)
+    assert (tl.base, tl.start(3), list(tl.starts_in(0, 7))) == (3, 30, [30, 40, 50, 60])
+    assert tl.evict_to_count(1) == (3, 6)
+    assert (tl.index_at(50), tl.index_at(60)) == (-1, 6)
+
+
+def test_url_template(content_dir):
+    ism = ISMManifest("Manifest", manifest(chunks=((0, 20000000), (None, 20000000), (None, 20000000))))
+    si = ism.streams[0]
+    base = ISMManifest.base_url("http://cdn.example.com/asset.ism/Manifest")
+    template = si.url_template(0, base, "asset")
+
+    assert base == "http://cdn.example.com/asset.ism/"
+    assert si.url_template(0, base, "asset") is template
+    assert template.url(1) == base + "QualityLevels(1000000)/Fragments(video=20000000)"
+    assert template.urls(1, 10) == [template.url(1), template.url(2)]
+    assert template.urls_for(MP4Builder.TimeDesc(2, 2)) == [template.url(1)]
+    assert template.paths(0, 2) == [template.path(0), template.path(1)]
+    assert template.path(2) == os.path.join(FileCache.video_qdir("asset", "0"), "2")
+
+
+@pytest.mark.parametrize("use_dom", [False, True])
+def test_chunk_range_without_stream_timescale(use_dom):
+    chunks = ((0, 2000), (None, 2000), (None, 2000))
+    ism = ISMManifest("Manifest", manifest(chunks=chunks, timescale="1000", si_timescale=None), use_dom)
+    si = ism.streams[0]
+
+    assert si.timescale_val() == 1000
+    assert si.chunk_range(MP4Builder.TimeDesc(2, 2)) == (1, 2)
+    assert si.chunk_range(MP4Builder.TimeDesc(3, 0)) == (1, 3)
+
+    ism = ISMManifest("Manifest", manifest(timescale=None, si_timescale=None), use_dom)
+    assert ism.streams[0].chunk_range(MP4Builder.TimeDesc(2, 2)) == (1, 2)
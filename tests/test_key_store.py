@@ -0,0 +1,128 @@
+import time
+from collections import OrderedDict
+
+import pytest
+
+from core.key_store import KeyStore
+
+FUTURE = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(time.time() + 3600))
+PAST = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(time.time() - 3600))
+
+
+def kid(i):
+    return bytes([i]) * 0x10
+
+
+def key(i):
+    return bytes([0x80 + i]) * 0x10
+
+
+def reopen(monkeypatch):
+    """Drops the in-memory state, as a new process would start."""
+    monkeypatch.setattr(KeyStore, "entries", OrderedDict())
+    monkeypatch.setattr(KeyStore, "offsets", {})
+    monkeypatch.setattr(KeyStore, "loaded", False)
+
+
+def log_lines():
+    with open(KeyStore.log_filename()) as f:
+        return f.read().splitlines()
+
+
+def test_expiry(content_dir):
+    KeyStore.put(kid(1), key(1), FUTURE)
+    KeyStore.put(kid(2), key(2), PAST)
+    KeyStore.put(kid(3), key(3))
+
+    assert KeyStore.get(kid(1)) == key(1)
+    assert KeyStore.expiration(kid(1)) == KeyStore.parse_expiration(FUTURE)
+    assert KeyStore.get(kid(2)) is None
+    assert KeyStore.get(kid(3)) == key(3)
+    assert KeyStore.expiration(kid(3)) is None
+
+
+def test_parse_expiration():
+    assert KeyStore.parse_expiration("2026-10-19T12:00:00Z") == KeyStore.parse_expiration("2026-10-19 12:00:00")
+    assert KeyStore.parse_expiration("10/19/2026 12:00:00 PM") == KeyStore.parse_expiration("2026-10-19T12:00:00Z")
+    assert KeyStore.parse_expiration("someday") is None
+    assert KeyStore.parse_expiration(None) is None
+
+
+def test_reload_drops_expired(content_dir, monkeypatch):
+    KeyStore.put(kid(1), key(1), FUTURE)
+    KeyStore.put(kid(2), key(2), FUTURE)
+    KeyStore.remove(kid(2))
+    reopen(monkeypatch)
+    monkeypatch.setattr(time, "time", lambda: KeyStore.parse_expiration(FUTURE) + 1)
+
+    assert KeyStore.get(kid(1)) is None
+    assert KeyStore.get(kid(2)) is None
+
+
+def test_spilled_keys_read_by_offset(content_dir, monkeypatch):
+    monkeypatch.setattr(KeyStore, "CACHE_SIZE", 2)
+    for i in range(4):
+        KeyStore.put(kid(i), key(i), FUTURE)
+    assert list(KeyStore.entries) == [kid(2).hex(), kid(3).hex()]
+
+    reads = []
+    read_entry = KeyStore.read_entry
+    monkeypatch.setattr(KeyStore, "read_entry", staticmethod(lambda offset: reads.append(offset) or read_entry(offset)))
+
+    assert KeyStore.get(kid(0)) == key(0)
+    assert KeyStore.get(kid(9)) is None
+    # Only the evicted key was read back, the unknown one never touched the log
+    assert reads == [KeyStore.offsets[kid(0).hex()]]
+
+
+def test_compaction_keeps_offsets(content_dir, monkeypatch):
+    monkeypatch.setattr(KeyStore, "CACHE_SIZE", 1)
+    for _ in range(4):
+        KeyStore.put(kid(1), key(1), FUTURE)
+        KeyStore.put(kid(1), key(2), FUTURE)
+    KeyStore.put(kid(2), key(2), PAST)
+    KeyStore.put(kid(3), key(3), FUTURE)
+    # More than COMPACT_RATIO lines per live key
+    assert len(log_lines()) == 10
+
+    reopen(monkeypatch)
+
+    assert KeyStore.get(kid(1)) == key(2)
+    assert KeyStore.get(kid(3)) == key(3)
+    assert KeyStore.get(kid(2)) is None
+    assert len(log_lines()) == 2
+
+
+def test_torn_line_ignored(content_dir, monkeypatch):
+    KeyStore.put(kid(1), key(1))
+    with open(KeyStore.log_filename(), "a") as f:
+        f.write('{"kid": "01')
+    reopen(monkeypatch)
+
+    assert KeyStore.get(kid(1)) == key(1)
+
+
+
+def test_append_after_torn_line(content_dir, monkeypatch):
+    KeyStore.put(kid(1), key(1))
+    with open(KeyStore.log_filename(), "a") as f:
+        f.write('{"kid": "01')
+    reopen(monkeypatch)
+    monkeypatch.setattr(KeyStore, "CACHE_SIZE", 1)
+    KeyStore.put(kid(2), key(2))
+    KeyStore.put(kid(3), key(3))
+
+    # Read back through its recorded offset, then replayed from the log
+    assert KeyStore.get(kid(2)) == key(2)
+    reopen(monkeypatch)
+    monkeypatch.setattr(KeyStore, "CACHE_SIZE", 8)
+    assert [KeyStore.get(kid(i)) for i in (1, 2, 3)] == [key(1), key(2), key(3)]
+    assert len(log_lines()) == 4
+
+
+@pytest.mark.parametrize("sdate", [FUTURE, None])
+def test_put_same_key_not_logged_twice(content_dir, sdate):
+    KeyStore.put(kid(1), key(1), sdate)
+    KeyStore.put(kid(1), key(1), sdate)
+
+    assert len(log_lines()) == 1
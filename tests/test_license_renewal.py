@@ -0,0 +1,93 @@
+import threading
+import time
+
+import pytest
+
+from core.key_store import KeyStore
+from core.license_renewal import LicenseRenewal
+
+KID = bytes(range(0x10))
+
+
+class FakeAsset:
+    def __init__(self, id):
+        self.id = id
+
+    def get_kid(self):
+        return KID
+
+
+@pytest.fixture
+def expiry(monkeypatch):
+    """Settable stored key expiration of every FakeAsset."""
+    value = [None]
+    monkeypatch.setattr(KeyStore, "expiration", lambda kid: value[0])
+    return value
+
+
+def test_due_entries_pop_soonest_first():
+    renewal = LicenseRenewal(lead=0, jitter=0)
+    renewal.running = True
+    now = time.time()
+    renewal.schedule("c", now - 1, now)
+    renewal.schedule("a", now - 3, now)
+    renewal.schedule("b", now - 2, now)
+    renewal.schedule("later", now + 3600, now + 7200)
+    # Rescheduling leaves the old heap entry behind, it must be skipped
+    renewal.schedule("c", now - 5, now)
+
+    assert [renewal.next_due()[2] for _ in range(3)] == ["c", "a", "b"]
+    assert renewal.pending() == [(now + 3600, "later")]
+
+    renewal.running = False
+    assert renewal.next_due() is None
+
+
+def test_renew_at_window():
+    renewal = LicenseRenewal(lead=100, jitter=10)
+    assert all(890 <= renewal.renew_at(1000) <= 900 for _ in range(50))
+
+
+def test_earlier_entry_wakes_the_worker():
+    renewal = LicenseRenewal(lead=0, jitter=0)
+    done = threading.Event()
+    due = []
+
+    def renew(entry):
+        due.append(entry[2])
+        done.set()
+
+    renewal.renew = renew
+    renewal.start()
+    try:
+        now = time.time()
+        renewal.schedule("far", now + 3600, now + 7200)
+        renewal.schedule("near", now + 0.05, now + 7200)
+        assert done.wait(5)
+    finally:
+        renewal.stop()
+    assert due == ["near"]
+    assert renewal.pending() == [(now + 3600, "far")]
+
+
+def test_finish_backoff(expiry):
+    renewal = LicenseRenewal(lead=100, jitter=0)
+    asset = FakeAsset("a1")
+    now = time.time()
+    expiry[0] = now + 1000
+    assert renewal.track(asset)
+    assert renewal.pending() == [(pytest.approx(now + 900), "a1")]
+
+    # Failures retry with a doubling delay while the key is still valid
+    renewal.finish(asset, expiry[0], 0, False)
+    assert renewal.entries["a1"][4] == LicenseRenewal.RETRY_DELAY
+    renewal.finish(asset, expiry[0], LicenseRenewal.RETRY_DELAY, False)
+    assert renewal.entries["a1"][4] == 2 * LicenseRenewal.RETRY_DELAY
+    renewal.finish(asset, expiry[0], 1000, False)
+    assert renewal.pending() == []
+
+    renewal.track(asset)
+    expiry[0] = now + 5000
+    renewal.finish(asset, now + 1000, 0, True)
+    assert renewal.pending() == [(pytest.approx(now + 4900), "a1")]
+    assert renewal.stats() == {"tracked": 1, "renewed": 1, "failed": 3}
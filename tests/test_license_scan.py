@@ -0,0 +1,86 @@
+import io
+import json
+import os
+
+from core.blicense import BLicense
+from core.file_cache import FileCache
+from core.license_scan import LicenseScan
+from modules.crypto import Crypto
+from modules.ecc import ECC
+
+KID = bytes(range(0x10))
+CUSTOM_DATA = (
+    "<LicenseResponseCustomData><LicenseType>Rental</LicenseType><BeginDate>2026-10-01T00:00:00Z</BeginDate>"
+    "<ExpirationDate>2026-10-02T00:00:00Z</ExpirationDate><TransactionId>t1</TransactionId></LicenseResponseCustomData>"
+)
+
+
+def response(license_data):
+    return (
+        '<soap:Envelope xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/"><soap:Body>'
+        "<AcquireLicenseResponse><AcquireLicenseResult><Response><LicenseResponse>"
+        f"<Licenses><License>{Crypto.base64_encode(license_data)}</License></Licenses>"
+        f"<CustomData>{Crypto.base64_encode(CUSTOM_DATA.encode())}</CustomData>"
+        "</LicenseResponse></Response></AcquireLicenseResult></AcquireLicenseResponse></soap:Body></soap:Envelope>"
+    ).encode()
+
+
+def store(content_dir, assetname, data):
+    debug_dir = os.path.join(content_dir, assetname, FileCache.DEBUG_DIR)
+    os.makedirs(debug_dir)
+    with open(os.path.join(debug_dir, LicenseScan.LICENSE_FILE), "wb") as f:
+        f.write(data)
+
+
+def test_scan(tmp_path):
+    while True:
+        enc_data = Crypto.ecc_encrypt(os.urandom(0x20), ECC.ECKey().pub())
+        if enc_data is not None:
+            break
+    lic = BLicense.build(KID, enc_data, os.urandom(0x10), 2000, os.urandom(0x10))
+    good = response(lic)
+    bad = response(lic[:len(lic) // 2])
+    store(str(tmp_path), "asset1", good)
+    store(str(tmp_path), "asset2", bad)
+    os.makedirs(os.path.join(str(tmp_path), FileCache.TMP_DIR))
+
+    out, err = io.StringIO(), io.StringIO()
+    report = LicenseScan.run(str(tmp_path), out, err, workers=1)
+
+    assert (report["files"], report["parsed"], report["errors"]) == (2, 1, 1)
+    rows = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert rows == [{
+        "asset": "asset1",
+        "kid": KID.hex(),
+        "security_level": 2000,
+        "license_type": "Rental",
+        "begin_date": "2026-10-01T00:00:00Z",
+        "expiration_date": "2026-10-02T00:00:00Z",
+        "error_code": None,
+        "transaction_id": "t1",
+        "size": len(good),
+    }]
+    errors = [json.loads(line) for line in err.getvalue().splitlines()]
+    assert len(errors) == 1
+    assert errors[0]["asset"] == "asset2"
+    assert errors[0]["file"].endswith(os.path.join("asset2", FileCache.DEBUG_DIR, LicenseScan.LICENSE_FILE))
+    assert errors[0]["error"].startswith("ValueError: ")
+
+
+def test_scan_malformed_response(tmp_path):
+    data = response(b"license")
+    store(str(tmp_path), "asset1", data[:data.index(b"<CustomData>") + 4])
+
+    out, err = io.StringIO(), io.StringIO()
+    report = LicenseScan.run(str(tmp_path), out, err, workers=1)
+
+    assert (report["files"], report["parsed"], report["errors"]) == (1, 0, 1)
+    assert json.loads(err.getvalue())["error"].startswith("ExpatError: ")
+
+
+def test_scan_csv(tmp_path):
+    out, err = io.StringIO(), io.StringIO()
+    report = LicenseScan.run(str(tmp_path / "missing"), out, err, fmt="csv", workers=1)
+
+    assert report["files"] == 0
+    assert out.getvalue().strip() == ",".join(LicenseScan.FIELDS)
@@ -0,0 +1,84 @@
+import threading
+import time
+
+from core.license_scheduler import LicenseScheduler
+
+
+class FakeAsset:
+    def __init__(self, id, gate=None, ls_url="http://ls.example.com/"):
+        self.id = id
+        self.gate = gate
+        self.ls_url = ls_url
+        self.calls = 0
+
+    def get_kid(self):
+        return None
+
+    def get_ls_url(self):
+        return self.ls_url
+
+    def get_content_key(self):
+        self.calls += 1
+        if self.gate is not None:
+            self.gate.wait(5)
+        return self.id.encode()
+
+
+def test_concurrent_submits_share_one_future(device):
+    gate = threading.Event()
+    asset = FakeAsset("a1", gate)
+    futures = []
+    start = threading.Barrier(8)
+
+    def submit():
+        start.wait()
+        futures.append(sched.submit(asset))
+
+    with LicenseScheduler(workers=4) as sched:
+        threads = [threading.Thread(target=submit) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        gate.set()
+
+        assert len(set(map(id, futures))) == 1
+        assert futures[0].result(5) == b"a1"
+    assert asset.calls == 1
+
+
+def test_done_future_is_resubmitted(device):
+    asset = FakeAsset("a1")
+    with LicenseScheduler(workers=2) as sched:
+        first = sched.submit(asset)
+        first.result(5)
+        second = sched.submit(asset)
+        second.result(5)
+
+    assert first is not second
+    assert asset.calls == 2
+
+
+def test_concurrency_cap_per_server(device):
+    in_flight = []
+    peak = []
+    lock = threading.Lock()
+
+    class SlowAsset(FakeAsset):
+        def get_content_key(self):
+            with lock:
+                in_flight.append(self.id)
+                peak.append(len(in_flight))
+            time.sleep(0.02)
+            with lock:
+                in_flight.remove(self.id)
+            return self.id.encode()
+
+    assets = [SlowAsset(f"a{i}") for i in range(8)]
+    with LicenseScheduler(workers=8, max_concurrent=2, rate=0) as sched:
+        report = LicenseScheduler.wait_all(sched.submit_all(assets), timeout=5)
+        stats = sched.stats()
+
+    assert report == {"ok": 8, "failed": 0, "pending": 0}
+    assert max(peak) <= 2
+    assert stats == {"http://ls.example.com/": 8}
@@ -0,0 +1,77 @@
+import os
+
+import pytest
+
+from content import manifest, pro, wrmheader
+from core.asset import Asset
+from core.file_cache import FileCache
+from core.key_store import KeyStore
+from core.license_load import LicenseLoad
+from core.license_server import LicenseServer
+from core.mspr import MSPR
+from modules.crypto import Crypto
+from modules.utils import Utils
+
+KID = bytes(range(0x10))
+SEED = b"test seed"
+
+
+@pytest.fixture
+def server(monkeypatch):
+    ls = LicenseServer(SEED)
+    url = ls.start()
+    monkeypatch.setattr(MSPR, "WMRMpubkey", MSPR.WMRMpubkey)
+    MSPR.set_wmrm_pubkey(ls.wmrm_pubkey)
+    yield ls, url
+    ls.stop()
+
+
+def test_asset_get_license(device, content_dir, server):
+    ls, url = server
+    prothdr = Crypto.base64_encode(pro(wrmheader(KID, url)))
+    asset = Asset("asset1")
+    Utils.save_file(FileCache.manifest_filename("asset1"), manifest(prothdr))
+    Utils.save_file(FileCache.lsurl_filename("asset1"), url.encode())
+
+    lic = asset.get_license()
+
+    assert lic is not None and lic.verify_signature()
+    assert lic.get_key_id() == KID
+    assert lic.get_content_key() == LicenseServer.content_key(SEED, KID)
+    assert KeyStore.get(KID) == lic.get_content_key()
+    assert Utils.load_file(FileCache.key_filename("asset1")) == Utils.construct_hex_string(lic.get_content_key()).encode()
+    assert os.path.exists(os.path.join(FileCache.debug_dir("asset1"), "lic_resp.txt"))
+    assert (ls.served, ls.faults) == (1, 0)
+
+
+def test_fresh_xml_key_per_challenge(device, server):
+    ls, _ = server
+    header = wrmheader(KID)
+
+    def xml_key(req):
+        keydata = LicenseServer.CHALLENGE_FIELDS.extract(req.encode())[LicenseServer.KEY_DATA]
+        return Crypto.ecc_decrypt(Crypto.base64_decode(keydata), ls.wmrm_key.prv())
+
+    assert xml_key(MSPR.get_license_request(device, header)) != xml_key(MSPR.get_license_request(device, header))
+
+
+def test_license_load(device, server):
+    _, url = server
+    report = LicenseLoad.run(url, 6, 3, SEED)
+
+    assert report["ok"] == 6 and report["errors"] == {}
+
+
+def test_fault_on_bad_challenge(server):
+    ls, _ = server
+    code, body = ls.handle(b"<soap:Envelope/>")
+
+    assert code == 500 and b"soap:Fault" in body
+
+
+def test_fault_on_malformed_challenge(server):
+    ls, _ = server
+    code, body = ls.handle(b"<soap:Envelope><soap:Body><Challenge")
+
+    assert code == 500 and b"malformed challenge" in body
+    assert ls.faults == 1
@@ -0,0 +1,88 @@
+import os
+
+import pytest
+
+from content import manifest
+from core.cdn import CDN
+from core.file_cache import FileCache
+from core.live_manifest import LiveManifest
+
+# 2s chunks in the default 10MHz timescale
+CHUNK = 20000000
+
+
+def chunks(first, last):
+    return tuple((i * CHUNK if i == first else None, CHUNK) for i in range(first, last))
+
+
+def cached_fragments(qdir):
+    return sorted(int(name) for name in os.listdir(qdir))
+
+
+@pytest.fixture
+def cdn(monkeypatch):
+    """Serves the manifests queued in the returned list, one per poll, then 304s."""
+    queue = []
+
+    def download_if_modified(serial, url, etag=None, last_modified=None):
+        if not queue:
+            return 304, None, etag, last_modified
+        return 200, queue.pop(0), f'"{len(queue)}"', None
+
+    monkeypatch.setattr(CDN, "download_if_modified", download_if_modified)
+    return queue
+
+
+@pytest.mark.parametrize("timescale", ["10000000", None])
+def test_follow_without_stream_timescale(cdn, monkeypatch, timescale):
+    cdn.append(manifest(timescale=timescale, si_timescale=None))
+    live = LiveManifest("serial", "http://cdn.example.com/live.isml/Manifest")
+    waits = []
+
+    def wait(timeout):
+        waits.append(timeout)
+        if len(waits) == 2:
+            live.stop()
+        return live.stop_event.is_set()
+
+    monkeypatch.setattr(live.stop_event, "wait", wait)
+
+    assert [f.start for f in live.follow()] == [0, 20000000]
+    # Polls once per 2s chunk, the StreamIndex using the manifest (or default) TimeScale
+    assert waits == [2.0, 2.0]
+
+
+def test_dvr_window_removes_fragments(cdn, content_dir):
+    qdirs = [FileCache.video_qdir("live", q) for q in ("0", "1")]
+    for qdir in qdirs:
+        os.makedirs(qdir)
+        for i in range(6):
+            open(os.path.join(qdir, str(i)), "wb").close()
+    # Any audio stream of the asset is left alone
+    adir = FileCache.audio_qdir("live", "audio", "0")
+    os.makedirs(adir)
+    open(os.path.join(adir, "0"), "wb").close()
+
+    cdn.extend([manifest(chunks=chunks(0, 4), si_timescale=None), manifest(chunks=chunks(2, 6), si_timescale=None)])
+    live = LiveManifest("serial", "http://cdn.example.com/live.isml/Manifest", dvr_duration=4, assetname="live")
+
+    # 8s of chunks in a 4s window: chunks 0 and 1 fall out, only 2 and 3 are announced
+    assert [f.index for f in live.poll()] == [2, 3]
+    assert [cached_fragments(qdir) for qdir in qdirs] == [[2, 3, 4, 5]] * 2
+
+    assert [f.index for f in live.poll()] == [4, 5]
+    si = live.ism.streams[0]
+    assert (si.first_chunk(), si.chunk_cnt(), si.timeline.start(4)) == (4, 6, 4 * CHUNK)
+    assert [cached_fragments(qdir) for qdir in qdirs] == [[4, 5]] * 2
+    assert cached_fragments(adir) == [0]
+
+    assert live.poll() == []
+    assert FileCache.remove_fragments("live", "video", "video", 0, 4) == 0
+
+
+def test_dvr_chunk_window(cdn, content_dir):
+    cdn.append(manifest(chunks=chunks(0, 5), si_timescale=None))
+    live = LiveManifest("serial", "http://cdn.example.com/live.isml/Manifest", dvr_duration=6, dvr_chunks=2)
+
+    assert [f.index for f in live.poll()] == [3, 4]
+    assert FileCache.remove_fragments("missing", "video", "video", 0, 4) == 0
@@ -0,0 +1,99 @@
+import os
+import sys
+
+import pytest
+
+from content import manifest
+from core.ism_manifest import ISMManifest
+from core.manifest_cache import ManifestCache
+from modules.snapshot import Snapshot
+
+KEY = bytes(range(0x20))
+
+
+@pytest.fixture
+def parses(monkeypatch):
+    """Counts the manifests parsed from XML."""
+    count = []
+    parse = ISMManifest.StreamParser.parse
+
+    def counting_parse(self, data):
+        count.append(data)
+        return parse(self, data)
+
+    monkeypatch.setattr(ISMManifest.StreamParser, "parse", counting_parse)
+    return count
+
+
+def test_snapshot_round_trip(tmp_path, monkeypatch):
+    path = str(tmp_path / "obj.snap")
+    assert Snapshot.write(path, KEY, {"a": 1})
+
+    assert Snapshot.read_key(path) == KEY
+    assert Snapshot.read(path, KEY) == {"a": 1}
+    assert Snapshot.read(path, bytes(0x20)) is None
+    monkeypatch.setattr(Snapshot, "VERSION", Snapshot.VERSION + 1)
+    assert Snapshot.read(path, KEY) is None
+
+
+def test_snapshot_rejects_bad_input(tmp_path):
+    path = tmp_path / "obj.snap"
+    with pytest.raises(ValueError):
+        Snapshot.write(str(path), KEY[:4], None)
+
+    assert Snapshot.read(str(path), KEY) is None
+    Snapshot.write(str(path), KEY, [1, 2, 3])
+    path.write_bytes(path.read_bytes()[:-4])
+    assert Snapshot.read(str(path), KEY) is None
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]
+
+
+def test_manifest_cache(tmp_path, parses):
+    path = tmp_path / "Manifest"
+    path.write_bytes(manifest())
+
+    ism = ManifestCache.load(str(path))
+    assert len(parses) == 1 and ism.streams[0].chunk_cnt() == 2
+    assert os.path.exists(ManifestCache.snapshot_filename(str(path)))
+
+    # Unchanged size and mtime: the snapshot is used without reading the XML
+    ism = ManifestCache.load(str(path))
+    assert len(parses) == 1 and ism.data is None and ism.streams[0].chunk_cnt() == 2
+
+    # Touched but identical: the digest still matches
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    ism = ManifestCache.load(str(path))
+    assert len(parses) == 1 and ism.data == manifest()
+
+    path.write_bytes(manifest(chunks=((0, 20000000),)))
+    ism = ManifestCache.load(str(path))
+    assert len(parses) == 2 and ism.streams[0].chunk_cnt() == 1
+
+    assert ManifestCache.load(str(tmp_path / "missing")) is None
+
+
+class Layout:
+    def __init__(self):
+        self.a = 1
+
+
+class ChangedLayout:
+    def __init__(self):
+        self.a = 1
+        self.b = 2
+
+
+def test_snapshot_class_layout_change(tmp_path, monkeypatch):
+    path = str(tmp_path / "obj.snap")
+    Snapshot.write(path, KEY, [Layout()])
+    assert Snapshot.read(path, KEY)[0].a == 1
+
+    # Same qualified name, one more field in __init__
+    ChangedLayout.__qualname__ = Layout.__qualname__
+    monkeypatch.setattr(Snapshot, "layouts", {})
+    monkeypatch.setattr(sys.modules[__name__], "Layout", ChangedLayout)
+    assert Snapshot.read(path, KEY) is None
+
+    monkeypatch.delattr(sys.modules[__name__], "Layout")
+    assert Snapshot.read(path, KEY) is None
@@ -0,0 +1,72 @@
+from content import wrmheader
+from core.mspr import MSPR
+from core.wrm_header import WRMHeader
+from modules.vars import Vars
+
+LS1 = "https://one.example.com/ls"
+LS2 = "https://two.example.com/ls"
+
+
+def kid(i):
+    return bytes([i]) * 0x10
+
+
+def header(i, la_url=LS1):
+    return WRMHeader(wrmheader(kid(i), la_url).encode())
+
+
+def kids(batch):
+    return [k for hdr in batch for k in hdr.kids]
+
+
+def test_batches_split_at_max_kids():
+    headers = [header(i) for i in range(5)] + [header(5, LS2)] + [header(6)]
+
+    batches = MSPR.batches(headers, 3)
+
+    assert [kids(b) for b in batches] == [
+        [kid(0), kid(1), kid(2)], [kid(3), kid(4), kid(6)], [kid(5)],
+    ]
+    assert all(hdr.la_url == batch[0].la_url for batch in batches for hdr in batch)
+
+
+def test_batch_max_kids():
+    assert MSPR.batch_max_kids() == MSPR.BATCH_MAX_KIDS
+    Vars.set("MSPR_BATCH_KIDS", 2)
+    try:
+        assert MSPR.batch_max_kids() == 2
+    finally:
+        Vars.clear("MSPR_BATCH_KIDS")
+
+
+def test_batch_wrmheader():
+    headers = [header(1), header(2), header(1)]
+
+    hdr = WRMHeader(MSPR.batch_wrmheader(headers).encode())
+
+    assert hdr.version == "4.3.0.0"
+    assert hdr.kids == [kid(1), kid(2)]
+    assert hdr.kid_algids == ["AESCTR", "AESCTR"]
+    assert hdr.la_url == LS1
+
+
+def test_batch_license_requests():
+    headers = [header(i) for i in range(3)] + [header(3, LS2)]
+    built = []
+
+    def build(dev, xml):
+        built.append(xml)
+        return f"req{len(built)}"
+
+    Vars.set("MSPR_BATCH_KIDS", 2)
+    try:
+        reqs = MSPR.batch_license_requests(None, headers, build)
+    finally:
+        Vars.clear("MSPR_BATCH_KIDS")
+
+    assert [(kids(batch), req) for batch, req in reqs] == [
+        ([kid(0), kid(1)], "req1"), ([kid(2)], "req2"), ([kid(3)], "req3"),
+    ]
+    assert WRMHeader(built[0].encode()).version == "4.3.0.0"
+    # A batch of one keeps its original header
+    assert built[1:] == [headers[2].xml(), headers[3].xml()]
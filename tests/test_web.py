@@ -0,0 +1,113 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from modules.vars import Vars
+from modules.web import Web
+
+ETAG = '"v1"'
+BODY = b"<SmoothStreamingMedia/>"
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    hits = 0
+
+    def do_GET(self):
+        Handler.hits += 1
+        if self.path == "/fail":
+            self.send_response(500)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+        elif self.headers.get("If-None-Match") == ETAG:
+            self.send_response(304)
+            self.send_header("ETag", ETAG)
+            self.end_headers()
+        else:
+            self.send_response(200)
+            self.send_header("ETag", ETAG)
+            self.send_header("Content-Length", str(len(BODY)))
+            self.end_headers()
+            self.wfile.write(BODY)
+
+    def log_message(self, fmt, *args):
+        pass
+
+
+@pytest.fixture
+def server(monkeypatch):
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(Handler, "hits", 0)
+    monkeypatch.setattr(Web.SessionPool, "idle", {})
+    monkeypatch.setattr(Web.SessionPool, "counters", {})
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    Web.SessionPool.clear()
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_conditional_get(server):
+    status, body, etag, _ = Web.http_get_conditional(server + "/Manifest", [])
+    assert (status, body, etag) == (200, BODY, ETAG)
+
+    status, body, etag, _ = Web.http_get_conditional(server + "/Manifest", [], etag)
+    assert (status, body, etag) == (304, None, ETAG)
+
+
+def test_retries_are_bounded(server, monkeypatch, capsys):
+    sleeps = []
+    monkeypatch.setattr(Web, "sleep", sleeps.append)
+    Vars.set("MSPR_WEB_RETRIES", 3)
+    try:
+        with pytest.raises(requests.HTTPError):
+            Web.http_get_conditional(server + "/fail", [])
+    finally:
+        Vars.clear("MSPR_WEB_RETRIES")
+
+    assert Handler.hits == 3
+    assert sleeps == [1, 1]
+    assert "giving up after 3 attempts" in capsys.readouterr().err
+
+
+def test_session_pool_reuses_connection(server):
+    for _ in range(4):
+        assert Web.http_get_conditional(server + "/Manifest", [])[0] == 200
+
+    stats = Web.SessionPool.stats()[server]
+    assert (stats["requests"], stats["created"], stats["reused"]) == (4, 1, 3)
+    assert stats["connections"] == 1
+    assert stats["idle"] == 1
+
+
+def test_session_pool_limits(server, monkeypatch):
+    url = server + "/Manifest"
+    origin = Web.SessionPool.origin(url)
+    Vars.set("MSPR_WEB_POOL_SIZE", 1)
+    try:
+        with Web.SessionPool.session(url), Web.SessionPool.session(url):
+            pass
+    finally:
+        Vars.clear("MSPR_WEB_POOL_SIZE")
+    stats = Web.SessionPool.stats()[origin]
+    assert (stats["created"], stats["idle"], stats["evicted"]) == (2, 1, 1)
+
+    # A failed request's session is closed instead of going back to the pool
+    with pytest.raises(RuntimeError):
+        with Web.SessionPool.session(url):
+            raise RuntimeError()
+    stats = Web.SessionPool.stats()[origin]
+    assert (stats["idle"], stats["evicted"]) == (0, 2)
+
+    with Web.SessionPool.session(url):
+        pass
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now + Web.SessionPool.IDLE_TIMEOUT + 1)
+    with Web.SessionPool.session(server.replace("127.0.0.1", "localhost")):
+        pass
+    stats = Web.SessionPool.stats()[origin]
+    assert (stats["idle"], stats["evicted"]) == (0, 3)
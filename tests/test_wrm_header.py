@@ -0,0 +1,66 @@
+import struct
+
+import pytest
+
+from content import pro, wrmheader
+from core.wrm_header import WRMHeader
+from modules.crypto import Crypto
+
+KID1 = bytes(range(0x10))
+KID2 = bytes(range(0x10, 0x20))
+DS_ID = b"domain service"
+
+
+def v42_header():
+    kids = "".join(
+        f'<KID ALGID="{algid}" VALUE="{Crypto.base64_encode(kid)}"/>' for kid, algid in ((KID1, "AESCTR"), (KID2, "AESCBC"))
+    )
+    return (
+        '<WRMHEADER xmlns="http://schemas.microsoft.com/DRM/2007/03/PlayReadyHeader" version="4.2.0.0">'
+        f"<DATA><PROTECTINFO><KIDS>{kids}</KIDS></PROTECTINFO>"
+        f"<LA_URL>https://example.com/ls</LA_URL><DS_ID>{Crypto.base64_encode(DS_ID)}</DS_ID></DATA></WRMHEADER>"
+    )
+
+
+def test_v40_header():
+    hdr = WRMHeader(wrmheader(KID1).encode())
+
+    assert hdr.version == "4.0.0.0"
+    assert (hdr.kid, hdr.kids) == (KID1, [KID1])
+    assert (hdr.keylen, hdr.algid) == ("16", "AESCTR")
+    assert hdr.la_url == "https://example.com/rightsmanager.asmx"
+    assert hdr.ds_id is None
+
+
+def test_v42_header_collects_every_kid():
+    hdr = WRMHeader.from_pro(pro(v42_header()))
+
+    assert hdr.version == "4.2.0.0"
+    assert (hdr.kid, hdr.kids) == (KID1, [KID1, KID2])
+    assert hdr.kid_algids == ["AESCTR", "AESCBC"]
+    assert hdr.algid == "AESCTR"
+    assert (hdr.la_url, hdr.ds_id) == ("https://example.com/ls", DS_ID)
+
+
+def test_headers_are_memoized(monkeypatch):
+    monkeypatch.setattr(WRMHeader, "headers", type(WRMHeader.headers)())
+    monkeypatch.setattr(WRMHeader, "CACHE_SIZE", 2)
+    objs = [pro(wrmheader(bytes([i]) * 0x10)) for i in range(3)]
+
+    first = WRMHeader.from_pro(objs[0])
+    assert WRMHeader.from_prothdr(Crypto.base64_encode(objs[0])) is first
+    WRMHeader.from_pro(objs[1])
+    WRMHeader.from_pro(objs[2])
+
+    assert len(WRMHeader.headers) == 2
+    assert WRMHeader.from_pro(objs[0]) is not first
+
+
+def test_pro_records():
+    # A license store record only
+    assert WRMHeader.from_pro(struct.pack("<IHHH", 12, 1, WRMHeader.PRO_RECORD_LICENSE_STORE, 2) + b"\0\0") is None
+
+    with pytest.raises(ValueError):
+        WRMHeader.pro_records(pro(wrmheader(KID1))[:-2])
+    with pytest.raises(ValueError):
+        WRMHeader.pro_records(struct.pack("<IHHH", 12, 1, WRMHeader.PRO_RECORD_WRMHEADER, 4) + b"\0\0")
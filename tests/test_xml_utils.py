@@ -0,0 +1,65 @@
+from io import StringIO
+from xml.parsers import expat
+
+import pytest
+
+from modules.xml_utils import XmlUtils
+
+DOC = b"""<root>
+  <a><b> one </b><b>two</b></a>
+  <c>three</c>
+  <d>four</d>
+</root>"""
+
+
+class Plain:
+    def __init__(self):
+        self.attName = None
+        self.attValue = "default"
+        self.other = None
+
+
+class Slotted:
+    __slots__ = ("attName", "attValue")
+
+    def __init__(self):
+        self.attName = None
+        self.attValue = "default"
+
+
+def test_stream_extractor_first_and_multi():
+    ext = XmlUtils.StreamExtractor(["root.c", "root.missing"], multi=["root.a.b"])
+    assert ext.extract(DOC) == {"root.c": "three", "root.missing": None, "root.a.b": ["one", "two"]}
+
+
+def test_stream_extractor_stops_early():
+    # Everything after the last wanted path is left unparsed, malformed or not
+    ext = XmlUtils.StreamExtractor(["root.a.b", "root.c"])
+    assert ext.extract(DOC[:DOC.index(b"<d>")] + b"<d><broken") == {"root.a.b": "one", "root.c": "three"}
+
+
+def test_stream_extractor_raises_on_malformed_xml():
+    ext = XmlUtils.StreamExtractor(["root.c", "root.d"])
+    with pytest.raises(expat.ExpatError):
+        ext.extract(DOC[:DOC.index(b"<d>")] + b"<d><broken")
+
+
+def test_select_paths():
+    doc = XmlUtils.parse_xml(StringIO(DOC.decode()))
+    assert [XmlUtils.get_value(n) for n in XmlUtils.select(doc, "root.a.b")] == ["one", "two"]
+    assert XmlUtils.get_value_by_path(doc, "root.d") == "four"
+    assert XmlUtils.select_first(doc, "root.a.x") is None
+
+
+def test_instance_from_attrs():
+    for clazz in (Plain, Slotted):
+        obj = XmlUtils.instance_from_attrs(clazz, {"Name": "n", "Other": "x"})
+        assert (obj.attName, obj.attValue) == ("n", "default")
+    assert XmlUtils.get_binder(Slotted) == (("attName", "Name"), ("attValue", "Value"))
+
+
+def test_instance_from_node():
+    doc = XmlUtils.parse_xml(StringIO('<root><item Name="n" Value="v" Other="x"/></root>'))
+    for clazz in (Plain, Slotted):
+        obj = XmlUtils.instance_from_node(clazz, XmlUtils.first_element(doc, "item"))
+        assert (obj.attName, obj.attValue) == ("n", "v")